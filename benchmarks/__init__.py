@@ -0,0 +1 @@
+"""Benchmarks of picard, run with ``python -m benchmarks``."""
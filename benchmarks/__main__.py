@@ -0,0 +1,149 @@
+"""Run the benchmark suite, and save the results as JSON.
+
+Run ``python -m benchmarks --help`` from the root of the repository.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import typing as t
+
+from benchmarks.suite import CASES
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+Result = t.Dict[str, t.Any]
+
+def _one(case: str, shape: str, size: int, *flags: str) -> Result:
+    """Measure one case in a process of its own."""
+    completed = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.suite', case, shape, str(size),
+         *flags],
+        cwd=ROOT, stdout=subprocess.PIPE, check=True,
+    )
+    return json.loads(completed.stdout)
+
+def run(
+        cases: t.Iterable[str],
+        sizes: t.Iterable[int],
+        shapes: t.Container[str] = None,
+        repeat: int = 3,
+        log: t.TextIO = sys.stderr,
+) -> t.List[Result]:
+    """Measure cases on every shape and size.
+
+    The wall time is the fastest of ``repeat`` runs, and the peak RSS is the
+    largest. The counts come from one more run, because counting slows it
+    down.
+    """
+    results = []
+    for case in cases:
+        for shape in CASES[case]:
+            if shapes is not None and shape not in shapes:
+                continue
+            for size in sizes:
+                print(f'{case} {shape} {size}', file=log, flush=True)
+                result = {'case': case, 'shape': shape, 'size': size}
+                runs = [_one(case, shape, size) for _ in range(repeat)]
+                errors = [r['error'] for r in runs if 'error' in r]
+                if errors:
+                    result['error'] = errors[0]
+                else:
+                    result['seconds'] = min(r['seconds'] for r in runs)
+                    result['peak_rss_kib'] = max(
+                        r['peak_rss_kib'] for r in runs)
+                    result.update(_one(case, shape, size, '--count'))
+                results.append(result)
+    return results
+
+def _commit() -> t.Optional[str]:
+    try:
+        completed = subprocess.run(
+            ['git', 'describe', '--always', '--dirty'],
+            cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return completed.stdout.decode().strip()
+
+def _key(result: Result) -> t.Tuple[str, str, int]:
+    return (result['case'], result['shape'], result['size'])
+
+def report(
+        results: t.Iterable[Result], baseline: t.Iterable[Result] = (),
+) -> t.Iterator[str]:
+    """Describe each result, and its ratio to a baseline, one line at
+    a time."""
+    before = {_key(r): r for r in baseline}
+    for result in results:
+        line = f'{result["case"]:>6} {result["shape"]:>13} {result["size"]:>8}'
+        if 'error' in result:
+            yield f'{line}  {result["error"]}'
+            continue
+        line += (
+            f' {result["seconds"]:9.3f}s {result["peak_rss_kib"]:8d} KiB'
+            f' {result["coroutines"]:9d} coroutines {result["tasks"]:8d} tasks'
+            f' {result["stats"]:8d} stats'
+        )
+        old = before.get(_key(result), None)
+        if old is not None and 'seconds' in old:
+            line += f'  x{result["seconds"] / old["seconds"]:.2f} time'
+            line += f' x{result["peak_rss_kib"] / old["peak_rss_kib"]:.2f} RSS'
+        yield line
+
+def _list(value: str) -> t.List[str]:
+    return [v for v in value.split(',') if v]
+
+def main(argv: t.Sequence[str] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks', description=__doc__.splitlines()[0])
+    parser.add_argument(
+        '--cases', type=_list, default=list(CASES),
+        help=f'comma-separated cases, of {", ".join(CASES)} (default: all)')
+    parser.add_argument(
+        '--shapes', type=_list, default=None,
+        help='comma-separated shapes (default: all for each case)')
+    parser.add_argument(
+        '--sizes', type=lambda v: [int(s) for s in _list(v)],
+        default=[10000],
+        help='comma-separated numbers of leaves or targets, '
+        'e.g. 10000,100000,1000000 (default: 10000)')
+    parser.add_argument(
+        '--repeat', type=int, default=3,
+        help='runs of each case, of which the fastest counts (default: 3)')
+    parser.add_argument(
+        '--output', metavar='FILE', help='write the results as JSON')
+    parser.add_argument(
+        '--compare', metavar='FILE',
+        help='compare the results with those in a JSON file')
+    args = parser.parse_args(argv)
+    for case in args.cases:
+        if case not in CASES:
+            parser.error(f'unknown case: {case}')
+
+    baseline = []
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+    results = run(args.cases, args.sizes, args.shapes, args.repeat)
+    for line in report(results, baseline):
+        print(line)
+    if args.output is not None:
+        document = {
+            'commit': _commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'date': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'results': results,
+        }
+        with open(args.output, 'w') as f:
+            json.dump(document, f, indent=2)
+            f.write('\n')
+
+if __name__ == '__main__':
+    main()
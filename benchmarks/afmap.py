@@ -0,0 +1,136 @@
+"""Compare :func:`picard.afunctor.afmap` with the recursive implementation
+it replaced.
+
+Run ``python -m benchmarks.afmap`` from the root of the repository.
+"""
+
+import asyncio
+import itertools
+import time
+import tracemalloc
+import typing as t
+
+from picard.afunctor import AsyncFunctor, afmap
+
+async def recursive_afmap(function, functor):
+    """The recursive :func:`afmap` it replaced, for comparison, without the
+    branch for iterators."""
+    impl = _RECURSIVE.get(type(functor), None)
+    if impl is not None:
+        return await impl(function, functor)
+    if isinstance(functor, AsyncFunctor):
+        return await functor._afmap_(function) # pylint: disable=protected-access
+    if isinstance(functor, t.Mapping):
+        return await _recursive_mapping(function, functor)
+    if isinstance(functor, t.Iterable):
+        return await _recursive_iterable(function, functor)
+    return await function(functor)
+
+async def _recursive_str(function, string):
+    return ''.join(await asyncio.gather(*map(function, string)))
+
+async def _recursive_iterable(function, iterable):
+    ys = await asyncio.gather(
+        *(recursive_afmap(function, x) for x in iterable))
+    return type(iterable)(ys)
+
+async def _recursive_mapping(function, mapping):
+    async def curried(functor):
+        return await recursive_afmap(function, functor)
+    values = await asyncio.gather(*map(curried, mapping.values()))
+    return type(mapping)(itertools.zip_longest(mapping.keys(), values))
+
+_RECURSIVE = {
+    dict: _recursive_mapping,
+    frozenset: _recursive_iterable,
+    list: _recursive_iterable,
+    set: _recursive_iterable,
+    str: _recursive_str,
+    tuple: _recursive_iterable,
+}
+
+async def identity(x):
+    return x
+
+def wide(n: int) -> t.Any:
+    """One list of ``n`` leaves."""
+    return list(range(n))
+
+def prerequisites(n: int) -> t.Any:
+    """``n`` prerequisite structures like those of a pattern target."""
+    return [((i, [i, i]), {'a': i, 'b': (i,)}) for i in range(n // 5)]
+
+def deep(n: int) -> t.Any:
+    """Lists nested ``n`` deep, with a leaf at each level."""
+    functor: t.Any = 0
+    for i in range(n):
+        functor = [functor, i]
+    return functor
+
+SHAPES = {'wide': wide, 'prerequisites': prerequisites, 'deep': deep}
+
+IMPLEMENTATIONS = {'flat': afmap, 'recursive': recursive_afmap}
+
+def measure(
+        implementation: t.Callable,
+        functor: t.Any,
+        leaves: int,
+        repeat: int = 5,
+) -> t.Dict[str, float]:
+    """Return the microseconds per leaf of the fastest of several calls,
+    and the memory allocated by one."""
+    loop = asyncio.new_event_loop()
+    try:
+        seconds = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            loop.run_until_complete(implementation(identity, functor))
+            seconds = min(seconds, time.perf_counter() - start)
+        tracemalloc.start()
+        loop.run_until_complete(implementation(identity, functor))
+        _, peak = tracemalloc.get_traced_memory()
+        blocks = sum(
+            s.count for s in tracemalloc.take_snapshot().statistics('lineno'))
+        tracemalloc.stop()
+    finally:
+        loop.close()
+    return {
+        'us_per_leaf': seconds / leaves * 1e6,
+        'peak_bytes_per_leaf': peak / leaves,
+        'live_blocks': blocks,
+    }
+
+def run(n: int = 10000) -> t.List[t.Dict[str, t.Any]]:
+    """Measure every implementation on every shape with about ``n``
+    leaves."""
+    results = []
+    for shape, make in SHAPES.items():
+        functor = make(n if shape != 'deep' else n // 10)
+        leaves = sum(1 for _ in _leaves(functor))
+        for name, implementation in IMPLEMENTATIONS.items():
+            result = {'shape': shape, 'implementation': name, 'leaves': leaves}
+            result.update(measure(implementation, functor, leaves))
+            results.append(result)
+    return results
+
+def _leaves(functor: t.Any) -> t.Iterator[t.Any]:
+    stack = [functor]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, dict):
+            stack.extend(value.values())
+        elif isinstance(value, (list, tuple)):
+            stack.extend(value)
+        else:
+            yield value
+
+def main() -> None:
+    for result in run():
+        print(
+            f'{result["shape"]:>14} {result["implementation"]:>10} '
+            f'{result["us_per_leaf"]:8.2f} us/leaf '
+            f'{result["peak_bytes_per_leaf"]:8.0f} peak B/leaf'
+        )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Synthetic graphs, for benchmarks.
+
+Each shape of graph has about ``n`` targets: some sources, and the rest
+built from them. A shape is built from a :class:`Nodes`, which makes its
+targets, so that the same shape can be made of files or of rules.
+"""
+
+import os
+from pathlib import Path
+import typing as t
+import typing_extensions as tex
+
+import picard
+from picard.typing import Target
+
+class Nodes(tex.Protocol):
+    """A factory of the targets in a graph."""
+
+    def source(self, name: str) -> t.Any:
+        """Return a target with no prerequisites, or a value that names
+        one."""
+
+    def output(self, name: str, *prereqs: t.Any) -> Target:
+        """Return a target built from some prerequisites."""
+
+async def touch(self, context, *prereqs): # pylint: disable=unused-argument
+    """A recipe that only updates its file."""
+    self.path.touch()
+
+class Files:
+    """File targets in a directory. Sources are named by their filename, and
+    created with the graph unless ``create`` is false. Outputs are built by
+    :func:`touch`."""
+
+    def __init__(self, directory: Path, create: bool = True) -> None:
+        self.directory = f'{directory}{os.sep}'
+        self.create = create
+
+    def source(self, name: str) -> t.Any:
+        path = self.directory + name
+        if self.create:
+            open(path, 'w').close()
+        return path
+
+    def output(self, name: str, *prereqs: t.Any) -> Target:
+        return picard.file(self.directory + name, *prereqs)(touch)
+
+@picard.pattern()
+async def _rule(self, context, *prereqs): # pylint: disable=unused-argument
+    return self.name
+
+class Rules:
+    """Rules whose recipes do nothing but return their name."""
+
+    def source(self, name: str) -> Target:
+        return _rule(name)
+
+    def output(self, name: str, *prereqs: t.Any) -> Target:
+        return _rule(name, *prereqs)
+
+def wide(nodes: Nodes, n: int) -> Target:
+    """Half sources, half outputs each built from one source, and one root
+    built from every output, like the objects and binary of a program."""
+    outputs = [
+        nodes.output(f'{i}.o', nodes.source(f'{i}.c')) for i in range(n // 2)
+    ]
+    return nodes.output('root', *outputs)
+
+def deep(nodes: Nodes, n: int) -> Target:
+    """One source, and a chain of outputs each built from the last."""
+    target = nodes.source('0')
+    for i in range(1, n):
+        target = nodes.output(str(i), target)
+    return target
+
+def diamond(nodes: Nodes, n: int, width: int = 4) -> Target:
+    """Layers of ``width`` outputs, each built from every output in the layer
+    before, so that every pair of layers is full of diamonds."""
+    layer = [nodes.source(f'0.{j}') for j in range(width)]
+    for i in range(1, max(1, n // width)):
+        layer = [nodes.output(f'{i}.{j}', *layer) for j in range(width)]
+    return nodes.output('root', *layer)
+
+def headers(nodes: Nodes, n: int, count: int = 20) -> Target:
+    """Like :func:`wide`, but every output is also built from the same
+    ``count`` headers."""
+    common = [nodes.source(f'{j}.h') for j in range(count)]
+    outputs = [
+        nodes.output(f'{i}.o', nodes.source(f'{i}.c'), *common)
+        for i in range(n // 2)
+    ]
+    return nodes.output('root', *outputs)
+
+SHAPES: t.Dict[str, t.Callable[[Nodes, int], Target]] = {
+    'wide': wide,
+    'deep': deep,
+    'diamond': diamond,
+    'headers': headers,
+}
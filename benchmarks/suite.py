@@ -0,0 +1,200 @@
+"""The cases of the benchmark suite, each measured in this process.
+
+Run one case with ``python -m benchmarks.suite CASE SHAPE SIZE [--count]``.
+It prints one line of JSON. The runner, ``python -m benchmarks``, runs
+every case in a process of its own, so that each peak RSS is its own.
+"""
+
+import asyncio
+import contextlib
+import dis
+import inspect
+import json
+import os
+from pathlib import Path
+import resource
+import sys
+import tempfile
+import time
+import typing as t
+
+import picard
+from picard.afunctor import afmap
+from picard.database import Database
+from picard.functor import fmap
+from picard.graph import Graph
+from picard import snapshot
+
+from benchmarks import afmap as structures
+from benchmarks import graphs
+
+DATABASE = '.picard.db'
+
+CASES: t.Dict[str, t.Sequence[str]] = {
+    # Mapping structures of ``size`` leaves.
+    'fmap': tuple(structures.SHAPES),
+    'afmap': tuple(structures.SHAPES),
+    # Constructing graphs of ``size`` files, and their tables.
+    'graph': tuple(graphs.SHAPES),
+    # Loading the same graphs from a snapshot instead, and their tables.
+    'snapshot': tuple(graphs.SHAPES),
+    # Evaluating graphs of ``size`` rules.
+    'sync': tuple(graphs.SHAPES),
+    # Building graphs of ``size`` files from scratch, and then again when
+    # they are all up-to-date.
+    'full': tuple(graphs.SHAPES),
+    'noop': tuple(graphs.SHAPES),
+}
+"""The shapes that each case can be measured on."""
+
+Work = t.Callable[[asyncio.AbstractEventLoop], t.Any]
+
+def _identity(x):
+    return x
+
+async def _aidentity(x):
+    return x
+
+def _build(directory: Path, root: t.Any) -> Work:
+    def work(loop):
+        database = Database(str(directory / DATABASE))
+        loop.run_until_complete(
+            picard.sync(root, picard.Context(database=database)))
+        database.commit()
+    return work
+
+def prepare(
+        case: str, shape: str, size: int, directory: Path,
+) -> Work:
+    """Build the input of a case, and return the work to measure."""
+    if case == 'fmap':
+        structure = structures.SHAPES[shape](size)
+        return lambda loop: fmap(_identity, structure)
+    if case == 'afmap':
+        structure = structures.SHAPES[shape](size)
+        return lambda loop: loop.run_until_complete(
+            afmap(_aidentity, structure))
+    if case == 'graph':
+        nodes = graphs.Files(directory, create=False)
+        return lambda loop: Graph(graphs.SHAPES[shape](nodes, size))
+    if case == 'snapshot':
+        filename = str(directory / snapshot.SNAPSHOT)
+        nodes = graphs.Files(directory, create=False)
+        def construct():
+            return graphs.SHAPES[shape](nodes, size)
+        snapshot.save(filename, construct())
+        return lambda loop: Graph(snapshot.load(filename, construct))
+    if case == 'sync':
+        root = graphs.SHAPES[shape](graphs.Rules(), size)
+        return lambda loop: loop.run_until_complete(
+            picard.sync(root, picard.Context()))
+    if case in ('full', 'noop'):
+        root = graphs.SHAPES[shape](graphs.Files(directory), size)
+        work = _build(directory, root)
+        if case == 'noop':
+            loop = asyncio.new_event_loop()
+            try:
+                work(loop)
+            finally:
+                loop.close()
+        return work
+    raise ValueError(f'unknown case: {case}')
+
+_STARTS: t.Dict[t.Any, int] = {}
+
+def _starting(frame: t.Any) -> bool:
+    """Return whether a coroutine's frame is starting, not resuming."""
+    code = frame.f_code
+    start = _STARTS.get(code, None)
+    if start is None:
+        # Since Python 3.11, every code object begins with a ``RESUME``.
+        # Before, a frame that has not started is at ``-1``.
+        start = next((
+            i.offset for i in dis.get_instructions(code)
+            if i.opname == 'RESUME'
+        ), -1)
+        _STARTS[code] = start
+    return frame.f_lasti == start
+
+@contextlib.contextmanager
+def counting(
+        loop: asyncio.AbstractEventLoop, counts: t.Dict[str, int],
+) -> t.Iterator[None]:
+    """Count the coroutines started, the tasks created, and the calls of
+    :func:`os.stat` (on any thread) in a block."""
+    counts.update(coroutines=0, tasks=0, stats=0)
+
+    def profile(frame, event, arg): # pylint: disable=unused-argument
+        if (
+                event == 'call' and
+                frame.f_code.co_flags & inspect.CO_COROUTINE and
+                _starting(frame)
+        ):
+            counts['coroutines'] += 1
+
+    def task_factory(loop, coro, **kwargs):
+        counts['tasks'] += 1
+        return asyncio.Task(coro, loop=loop, **kwargs)
+
+    stat = os.stat
+    def counting_stat(*args, **kwargs):
+        counts['stats'] += 1
+        return stat(*args, **kwargs)
+
+    os.stat = counting_stat
+    loop.set_task_factory(task_factory)
+    sys.setprofile(profile)
+    try:
+        yield
+    finally:
+        sys.setprofile(None)
+        loop.set_task_factory(None)
+        os.stat = stat
+
+def _peak_rss() -> int:
+    """Return the peak resident set size of this process, in KiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux counts KiB, but macOS counts bytes.
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+def measure(
+        case: str, shape: str, size: int, count: bool = False,
+) -> t.Dict[str, t.Any]:
+    """Measure one case.
+
+    Returns
+    -------
+    dict
+        The wall time in ``seconds`` and the ``peak_rss_kib`` of this
+        process or, if ``count``, the numbers of ``coroutines``, ``tasks``,
+        and ``stats``. Or, if the case failed, its ``error``.
+    """
+    result: t.Dict[str, t.Any] = {}
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            work = prepare(case, shape, size, Path(directory))
+            try:
+                if count:
+                    with counting(loop, result):
+                        work(loop)
+                else:
+                    start = time.perf_counter()
+                    work(loop)
+                    result['seconds'] = time.perf_counter() - start
+                    result['peak_rss_kib'] = _peak_rss()
+            except RecursionError as error:
+                result = {'error': f'{type(error).__name__}: {error}'}
+    finally:
+        loop.close()
+    return result
+
+def main(argv: t.Sequence[str] = None) -> None:
+    if argv is None:
+        argv = sys.argv[1:]
+    case, shape, size, *flags = argv
+    print(json.dumps(measure(case, shape, int(size), '--count' in flags)))
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,13 @@
 import picard
 
-@picard.file('hello.o', 'hello.c')
+@picard.file('hello.o', 'hello.c', config=('CC', 'CPPFLAGS', 'CFLAGS'))
 async def hello_o(target, context, hello_c):
     cc = context.config.get('CC', 'cc')
     cpp_flags = context.config.get('CPPFLAGS', None)
     c_flags = context.config.get('CFLAGS', None)
     await picard.sh(cc, cpp_flags, c_flags, '-c', hello_c)
 
-@picard.file('hello', hello_o)
+@picard.file('hello', hello_o, config=('CC', 'LDFLAGS', 'LDLIBS'))
 async def hello(target, context, hello_o):
     cc = context.config.get('CC', 'cc')
     ld_flags = context.config.get('LDFLAGS', None)
@@ -6,7 +6,10 @@ from picard.context import Context
 from picard.file import (
     FileRecipePostConditionError, FileTarget, file, file_target
 )
+from picard.graph import BuildError, CycleError
 from picard.pattern import pattern
 from picard.rule import rule
-from picard.shell import sh
+from picard.scheduler import resources
+from picard.shell import ShellError, sh
+from picard.snapshot import glob
 from picard.typing import Target
@@ -0,0 +1,139 @@
+"""Structures of nested collections, taken apart without recursion.
+
+Both :func:`~picard.afunctor.afmap` and
+:class:`~picard.traversable.Traversable` flatten a structure into a list of
+leaves and a program for a stack machine that rebuilds it around their
+(mapped) values. The program is in postfix order: each instruction is
+either :data:`LEAF`, which pushes the next value, or a :class:`Build`.
+"""
+
+import typing as t
+
+LEAF = None
+
+class Build: # pylint: disable=too-few-public-methods
+    """An instruction to pop ``count`` values and push ``build(values,
+    extra)``."""
+
+    __slots__ = ('build', 'count', 'extra')
+
+    def __init__(self, build: t.Callable, count: int, extra: t.Any) -> None:
+        self.build = build
+        self.count = count
+        self.extra = extra
+
+def build_iterable(values: t.List[t.Any], kind: type) -> t.Any:
+    return kind(values)
+
+def build_mapping(values: t.List[t.Any], mapping: t.Mapping) -> t.Any:
+    kind: t.Any = type(mapping)
+    return kind(zip(mapping.keys(), values))
+
+# The kinds of values. Containers and mappings are taken apart by
+# :func:`flatten`, and the rest are passed to its ``leaf`` function.
+CONTAINER = 'container'
+MAPPING = 'mapping'
+STRING = 'string'
+ITERATOR = 'iterator'
+ASYNC_FUNCTOR = 'async functor'
+FUNCTOR = 'functor'
+PLAIN = 'plain'
+
+# The kind of every type seen so far. Protocols and abstract base classes
+# are slow to check, so they are checked once per type, not once per value.
+KINDS: t.Dict[type, str] = {
+    bytes: CONTAINER,
+    dict: MAPPING,
+    frozenset: CONTAINER,
+    list: CONTAINER,
+    range: ITERATOR,
+    set: CONTAINER,
+    str: STRING,
+    tuple: CONTAINER,
+}
+
+def kind_of(kind: type) -> str:
+    """Return the kind of a type, and remember it."""
+    answer = KINDS.get(kind, None)
+    if answer is not None:
+        return answer
+    # User-defined functors (see :class:`~picard.afunctor.AsyncFunctor` and
+    # :class:`~picard.functor.Functor`) come first, to map themselves.
+    if hasattr(kind, '_afmap_'):
+        answer = ASYNC_FUNCTOR
+    elif hasattr(kind, '_fmap_'):
+        answer = FUNCTOR
+    elif issubclass(kind, t.Mapping):
+        answer = MAPPING
+    elif issubclass(kind, t.Iterator):
+        answer = ITERATOR
+    elif issubclass(kind, t.Iterable):
+        answer = CONTAINER
+    else:
+        answer = PLAIN
+    KINDS[kind] = answer
+    return answer
+
+def push_container(value: t.Iterable, stack: t.List[t.Any]) -> None:
+    """Push the children of a container, to be walked before the
+    instruction that rebuilds it."""
+    children = list(value)
+    # The instruction goes beneath the children, to run after them.
+    stack.append(Build(build_iterable, len(children), type(value)))
+    stack.extend(reversed(children))
+
+def push_mapping(value: t.Mapping, stack: t.List[t.Any]) -> None:
+    """Push the values of a mapping, to be walked before the instruction
+    that rebuilds it."""
+    stack.append(Build(build_mapping, len(value), value))
+    stack.extend(reversed(list(value.values())))
+
+Leaf = t.Callable[
+    [t.Any, str, t.List[t.Any], t.List[t.Any], t.List[t.Any]], None]
+
+def flatten(
+        structure: t.Any, leaf: Leaf,
+) -> t.Tuple[t.List[t.Any], t.List[t.Any]]:
+    """Walk a structure, without recursion, and return its leaves and the
+    program that rebuilds it.
+
+    Containers and mappings are taken apart here. Every other value is
+    passed to ``leaf(value, kind, stack, leaves, program)``, which appends
+    to ``leaves`` and ``program``, or pushes to ``stack`` values to walk.
+    """
+    leaves: t.List[t.Any] = []
+    program: t.List[t.Any] = []
+    stack = [structure]
+    kinds = KINDS
+    while stack:
+        value = stack.pop()
+        kind = type(value)
+        if kind is Build:
+            program.append(value)
+            continue
+        answer = kinds.get(kind, None) or kind_of(kind)
+        if answer is CONTAINER:
+            push_container(value, stack)
+        elif answer is MAPPING:
+            push_mapping(value, stack)
+        else:
+            leaf(value, answer, stack, leaves, program)
+    return leaves, program
+
+def rebuild(program: t.Sequence[t.Any], values: t.Iterable[t.Any]) -> t.Any:
+    """Run a program on the values of its leaves, and return the
+    structure."""
+    values = iter(values)
+    stack: t.List[t.Any] = []
+    for instruction in program:
+        if instruction is LEAF:
+            stack.append(next(values))
+            continue
+        count = instruction.count
+        if count:
+            children = stack[-count:]
+            del stack[-count:]
+        else:
+            children = []
+        stack.append(instruction.build(children, instruction.extra))
+    return stack[0]
@@ -0,0 +1,159 @@
+"""Keys that identify the action that builds a target."""
+
+import functools
+import hashlib
+import types
+import typing as t
+import weakref
+
+_CODE_DIGESTS: t.Dict[types.CodeType, str] = {}
+
+# The identities of recipe functions, computed once for each function.
+_IDENTITIES: t.MutableMapping[t.Callable, str] = weakref.WeakKeyDictionary()
+
+# Values whose representation is the same in every process.
+_PLAIN = frozenset({
+    bool, bytes, complex, float, int, str, type(None), type(Ellipsis),
+})
+
+_MUTABLE = frozenset({bytearray, dict, list, set})
+
+def _digest_value(value: t.Any, seen: t.Set[int]) -> str:
+    """Digest a constant, default, or captured value.
+
+    The digest is the same in every process: the elements of frozensets
+    are sorted by their digests, because their order depends on the hash
+    seed, and objects without a representation of their own are identified
+    by their type (and name, if they have one), not their address.
+    Mutable containers are identified by their type alone, because a
+    recipe that captures one usually keeps its own state there, e.g. a log,
+    and should not change as that state does. ``seen`` holds the containers
+    and functions being digested, to stop at cycles.
+    """
+    kind = type(value)
+    if kind in _PLAIN:
+        return f'{kind.__name__}:{value!r}'
+    if kind is types.CodeType:
+        return f'code:{_digest_code(value)}'
+    if kind in _MUTABLE:
+        return kind.__name__
+    if id(value) in seen:
+        return f'{kind.__name__}:...'
+    seen.add(id(value))
+    try:
+        if isinstance(value, tuple):
+            parts = [_digest_value(v, seen) for v in value]
+        elif isinstance(value, frozenset):
+            parts = sorted(_digest_value(v, seen) for v in value)
+        elif isinstance(value, types.MappingProxyType):
+            parts = sorted(
+                _digest_value(k, seen) + '=' + _digest_value(v, seen)
+                for k, v in value.items()
+            )
+        elif isinstance(value, types.FunctionType):
+            parts = [value.__qualname__, _digest_function(value, seen)]
+        elif isinstance(value, types.MethodType):
+            parts = [
+                _digest_value(value.__func__, seen),
+                _digest_value(value.__self__, seen),
+            ]
+        elif isinstance(value, functools.partial):
+            parts = [
+                _digest_value(value.func, seen),
+                _digest_value(value.args, seen),
+                _digest_value(tuple(sorted(value.keywords.items())), seen),
+            ]
+        elif kind.__repr__ is object.__repr__:
+            name = getattr(value, 'name', None)
+            parts = [kind.__module__, kind.__qualname__]
+            if isinstance(name, str):
+                parts.append(name)
+        else:
+            parts = [repr(value)]
+    finally:
+        seen.discard(id(value))
+    text = '\0'.join(parts)
+    return f'{kind.__name__}({len(parts)}):{text}'
+
+def _digest_code(code: types.CodeType) -> str:
+    """Digest the behavior of a code object, but not its location.
+
+    Moving a function within its file, or editing its comments, does not
+    change its digest.
+    """
+    digest = _CODE_DIGESTS.get(code, None)
+    if digest is None:
+        h = hashlib.sha256()
+        h.update(code.co_code)
+        h.update(repr(code.co_names).encode())
+        for const in code.co_consts:
+            h.update(_digest_value(const, set()).encode())
+            h.update(b'\0')
+        digest = _CODE_DIGESTS[code] = h.hexdigest()
+    return digest
+
+def _digest_function(
+        function: types.FunctionType, seen: t.Set[int]
+) -> str:
+    """Digest the code of a function, its default arguments, and the values
+    it captures."""
+    h = hashlib.sha256(_digest_code(function.__code__).encode())
+    cells = []
+    for cell in function.__closure__ or ():
+        try:
+            cells.append(cell.cell_contents)
+        except ValueError:
+            # The variable is not yet assigned.
+            cells.append(Ellipsis)
+    kwdefaults = tuple(sorted((function.__kwdefaults__ or {}).items()))
+    for value in (function.__defaults__, kwdefaults, tuple(cells)):
+        h.update(b'\0')
+        h.update(_digest_value(value, seen).encode())
+    return h.hexdigest()
+
+def recipe_identity(recipe: t.Callable) -> str:
+    """Return a string that changes when a recipe changes.
+
+    It combines the qualified name of the recipe with a digest of its code,
+    its default arguments, and the values it captures from enclosing
+    functions, unless the recipe carries its identity in an ``_identity_``
+    attribute, e.g. because it was loaded from a :mod:`snapshot
+    <picard.snapshot>` without its code. The identity is the same in every
+    process, whatever its hash seed. It is computed once for each function.
+    """
+    identity = getattr(recipe, '_identity_', None)
+    if identity is not None:
+        return identity
+    if isinstance(recipe, types.FunctionType):
+        identity = _IDENTITIES.get(recipe, None)
+        if identity is None:
+            digest = _digest_function(recipe, {id(recipe)})
+            identity = _IDENTITIES[recipe] = (
+                f'{recipe.__module__}.{recipe.__qualname__}:{digest}')
+        return identity
+    name = getattr(recipe, '__qualname__', type(recipe).__qualname__)
+    module = getattr(recipe, '__module__', None)
+    code = getattr(recipe, '__code__', None)
+    digest = '' if code is None else _digest_code(code)
+    return f'{module}.{name}:{digest}'
+
+def action_key(
+        recipe: t.Callable,
+        config: t.Mapping[str, t.Any],
+        keys: t.Iterable[str],
+) -> str:
+    """Return a digest of a recipe and the configuration values it reads.
+
+    Parameters
+    ----------
+    recipe :
+        A recipe function.
+    config :
+        A configuration mapping.
+    keys :
+        The names of the configuration values that the recipe reads.
+    """
+    h = hashlib.sha256(recipe_identity(recipe).encode())
+    for key in sorted(keys):
+        h.update(f'\0{key}={config.get(key, None)!r}'.encode())
+    return h.hexdigest()
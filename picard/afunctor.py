@@ -5,6 +5,8 @@ import itertools
 import typing as t
 import typing_extensions as tex
 
+from picard import _layout
+
 @tex.runtime
 class AsyncFunctor(tex.Protocol):
     """A user-defined functor with an asynchronous fmap.
@@ -17,44 +19,69 @@ class AsyncFunctor(tex.Protocol):
         ...
 
 
-async def _afmap_str(function, string):
-    ss = await asyncio.gather(*map(function, string))
-    return ''.join(ss)
+def _build_str(values, _):
+    return ''.join(values)
+
+def _build_constant(_, value):
+    return value
 
-async def _afmap_generator(function, xs):
-    # These type specializations are awaited unconditionally in :func:`afmap`.
-    # If this function itself were a generator, it could not be awaited.
-    # Instead, it must return an awaitable that returns an async generator.
-    # Gross.
+def _afmap_generator(function, xs):
+    # These are not flattened, because iterators cannot be iterated twice,
+    # and may be infinite. Each value is mapped only as it is requested.
     async def generator():
         for x in xs:
             yield await afmap(function, x)
     return generator()
 
-async def _afmap_iterable(function, iterable):
-    ys = await asyncio.gather(*(afmap(function, x) for x in iterable))
-    return type(iterable)(ys)
-
-async def _afmap_mapping(function, mapping):
-    async def curried(functor):
-        return await afmap(function, functor)
-    values = await asyncio.gather(*map(curried, mapping.values()))
-    kvs = itertools.zip_longest(mapping.keys(), values)
-    return type(mapping)(kvs)
-
-# Only ``str`` and ``range`` need to be here because they do not fit nicely
-# into the protocol branches, but we include the rest of the built-in types
-# here anyways as an optimization (because known types are checked first).
-_IMPLEMENTATIONS = {
-    bytes: _afmap_iterable,
-    dict: _afmap_mapping,
-    frozenset: _afmap_iterable,
-    list: _afmap_iterable,
-    range: _afmap_generator,
-    set: _afmap_iterable,
-    str: _afmap_str,
-    tuple: _afmap_iterable,
-}
+def _leaves(function: t.Callable) -> _layout.Leaf:
+    """Return the function that :func:`~picard._layout.flatten` calls for
+    each leaf. Leaves are collected as ``(function, argument)`` pairs, and
+    called only once the traversal has finished, so that no coroutine is
+    left unawaited if it fails."""
+    def leaf(value, kind, stack, leaves, program):
+        # pylint: disable=protected-access
+        if kind is _layout.STRING:
+            leaves.extend(zip(itertools.repeat(function), value))
+            program.extend(itertools.repeat(_layout.LEAF, len(value)))
+            program.append(_layout.Build(_build_str, len(value), None))
+            return
+        if kind is _layout.FUNCTOR:
+            # A functor with only a synchronous fmap is taken apart like
+            # any other value.
+            if isinstance(value, t.Mapping):
+                _layout.push_mapping(value, stack)
+                return
+            if isinstance(value, t.Iterator):
+                kind = _layout.ITERATOR
+            elif isinstance(value, t.Iterable):
+                _layout.push_container(value, stack)
+                return
+        if kind is _layout.ITERATOR:
+            program.append(_layout.Build(
+                _build_constant, 0, _afmap_generator(function, value)))
+            return
+        if kind is _layout.ASYNC_FUNCTOR:
+            leaves.append((value._afmap_, function))
+        else:
+            # Assume it is the identity functor.
+            leaves.append((function, value))
+        program.append(_layout.LEAF)
+    return leaf
+
+def _call(leaves):
+    """Call each leaf, and return the awaitables. If a call raises, close the
+    coroutines already returned."""
+    awaitables = []
+    try:
+        for function, argument in leaves:
+            awaitables.append(function(argument))
+    except BaseException:
+        for awaitable in awaitables:
+            close = getattr(awaitable, 'close', None)
+            if close is not None:
+                close()
+        raise
+    return awaitables
 
 async def afmap(function: t.Callable, functor):
     """Recursively apply an asynchronous function within a functor.
@@ -66,6 +93,11 @@ async def afmap(function: t.Callable, functor):
     Calls of the function will be evaluated concurrently, thus there is no
     guaranteed order of execution (you want a monad for that).
 
+    The functor is walked once, without recursion, to collect every leaf.
+    They are all awaited together, and then the functor is rebuilt around
+    their values. Iterators (including ``range``) are the exception: they
+    are mapped lazily, to async generators.
+
     Parameters
     ----------
     function :
@@ -81,23 +113,13 @@ async def afmap(function: t.Callable, functor):
         A copy of :param:`functor` with the results of applying
         :param:`function` to all of its leaf values.
     """
-    # pylint: disable=too-many-return-statements
     # Currying async functions is inconvenient and slow. We don't do it.
-    # 1. If the functor is a known type:
-    impl = _IMPLEMENTATIONS.get(type(functor), None)
-    if impl is not None:
-        return await impl(function, functor)
-    # 2. If it is an AsyncFunctor:
-    if isinstance(functor, AsyncFunctor):
-        return await functor._afmap_(function) # pylint: disable=protected-access
-    # 3. If it is a Mapping:
-    if isinstance(functor, t.Mapping):
-        return await _afmap_mapping(function, functor)
-    # 4. If it is an Iterator:
-    if isinstance(functor, t.Iterator):
-        return _afmap_generator(function, functor)
-    # 5. If it is an Iterable:
-    if isinstance(functor, t.Iterable):
-        return await _afmap_iterable(function, functor)
-    # Assume it is the identity functor.
-    return await function(functor)
+    leaves, program = _layout.flatten(functor, _leaves(function))
+    if not leaves:
+        values: t.List[t.Any] = []
+    elif len(leaves) == 1:
+        function, argument = leaves[0]
+        values = [await function(argument)]
+    else:
+        values = await asyncio.gather(*_call(leaves))
+    return _layout.rebuild(program, values)
@@ -1,19 +1,41 @@
 """The rest of the public API."""
 
 import asyncio
+import contextlib
 import inspect
 import logging
 import os
+import re
+import sys
 import typing as t
 
 from picard.afunctor import afmap
 from picard.argparse import parse_args
+from picard.cache import HttpCache, LocalCache, parse_size
 from picard.context import Context
-from picard.typing import Target
+from picard.database import Database
+from picard.graph import Graph, execute
+from picard.jobserver import JobServer
+from picard.ninja import write as write_ninja
+from picard.snapshot import SNAPSHOT, construct
+from picard.trace import Tracer
+from picard.typing import Target, is_target
+from picard.watch import watch as watch_
 
 # Targets = Traversable[Target]
 Targets = t.Any
 
+DATABASE = '.picard.db'
+"""The default filename for the database of past builds."""
+
+FLAGS = frozenset({
+    'keep-going', 'watch', 'serve', 'dry-run', 'question', 'no-snapshot',
+})
+"""Options of :func:`make` that never take a value."""
+
+COUNTS = frozenset({'jobs'})
+"""Options of :func:`make` that take a value only if it is a number."""
+
 async def sync(target: Targets, context: Context = None):
     """Swiss-army function to synchronize one or more targets.
 
@@ -31,48 +53,279 @@ async def sync(target: Targets, context: Context = None):
     -------
     Traversable[Any]
         The value(s) of the targets in the same functor.
+
+    Raises
+    ------
+    picard.graph.CycleError
+        If the targets depend on each other in a cycle.
     """
     if context is None:
         context = Context()
+    # Evaluate the whole graph first, without recursion, so that the
+    # traversal below finds every target already in the memo.
+    await execute(Graph(target, context.memo), context)
     async def _sync(value):
-        if isinstance(value, Target):
-            return await value.recipe(context)
+        if is_target(value):
+            return await evaluate(value, context)
         return value
     return await afmap(_sync, target)
 
+async def evaluate(target: Target, context: Context):
+    """Evaluate a single target at most once per context.
+
+    The first caller starts the target's recipe. Every caller, including the
+    first, awaits the same shared future, which is kept in the context's memo.
+    The future is shielded so that cancelling one dependent does not cancel
+    the evaluation for the others.
+    """
+    future = context.memo.get(target, None)
+    if future is None:
+        future = asyncio.ensure_future(target.recipe(context))
+        context.memo[target] = future
+    return await asyncio.shield(future)
+
 def make(
         target: Targets,
         config: t.Mapping[str, t.Any] = None,
         rules: t.Mapping[str, Target] = None,
+        pools: t.Mapping[str, float] = None,
+        watch: bool = False,
 ):
-    """Parse targets and configuration from the command line."""
+    """Parse targets and configuration from the command line.
+
+    These options configure the build instead of passing into the
+    configuration. Those without a value are flags, and never take the next
+    argument as their value:
+
+    ``--jobs [N]``
+        The maximum number of recipes to run at once, or without a number,
+        as many as there are CPUs.
+    ``--database FILE``
+        The database of past builds. Defaults to ``.picard.db``.
+    ``--freshness mtime|digest``
+        How file targets decide whether they are up-to-date.
+    ``--cache DIR|URL``
+        A directory, or the URL of an HTTP server, in which to cache build
+        outputs, e.g. object files.
+    ``--cache-size SIZE``
+        The maximum size of the cache, e.g. ``10G``. The least recently used
+        outputs are evicted after the build.
+    ``--keep-going``
+        Keep building everything that does not depend on a failed target,
+        instead of stopping at the first failure.
+    ``--trace FILE``
+        Write a profile of the build, in the Chrome trace-event format, that
+        can be loaded in Perfetto.
+    ``--pools NAME:CAPACITY,...``
+        The capacities of resource pools, e.g. ``mem_gb:64,link:2``. They
+        override those passed as ``pools``.
+    ``--watch``
+        After building, keep watching the sources, and rebuild what depends
+        on them whenever they change (see :func:`picard.watch.watch`), until
+        interrupted. The same as passing ``watch=True``.
+    ``--dry-run``
+        Print the recipes that would run, in order, with the time each took
+        at its last build, instead of running them (see
+        :class:`picard.plan.Plan`).
+    ``--question``
+        Like ``--dry-run``, but print nothing, and exit with status 1 if any
+        recipe would run, or else 0.
+    ``--ninja FILE``
+        After building, write a Ninja build file for the targets (see
+        :func:`picard.ninja.lower`).
+    ``--serve``
+        Instead of building, start a :mod:`build server <picard.server>` on
+        ``.picard.sock``, until interrupted. Build with ``python -m
+        picard_client [options] [targets]``.
+    ``--snapshot FILE``
+        The snapshot of the graph, when ``target`` is a function. Defaults to
+        ``.picard.graph``.
+    ``--no-snapshot``
+        Call ``target``, when it is a function, instead of loading or saving
+        a snapshot.
+
+    ``target`` may be a function that takes no arguments and returns the
+    graph, i.e. a structure of file targets. Then the graph is saved to a
+    :mod:`snapshot <picard.snapshot>`, and loaded from it instead of calling
+    the function again, until the build scripts change or the inputs that
+    the function found with :func:`picard.glob` do.
+
+    If ``MAKEFLAGS`` names the jobserver of a parent ``make`` (e.g. because
+    the command is marked recursive with ``+`` in its Makefile), then recipes
+    take their jobs from it. Otherwise, a new jobserver for ``--jobs`` jobs
+    is shared with the children of :func:`picard.sh`.
+    """
     logging.basicConfig(format='%(asctime)s %(message)s', level=logging.INFO)
 
     if rules is None:
-        stack = inspect.stack()
-        module = inspect.getmodule(stack[0].frame)
-        if module is None:
-            raise NotImplementedError(
-                'cannot get module of caller; '
-                'you must pass the "rules" argument')
-        rules = vars(module)
+        rules = _caller_globals()
 
-    targets, overrides = parse_args()
+    targets, overrides = parse_args(flags=FLAGS, counts=COUNTS)
+
+    target = _construct(target, overrides)
 
     targets_ = (
         [target]
         if not targets else
-        [rules[t] for t in targets]
+        [lookup(name, rules, target) for name in targets]
     )
 
+    watch = bool(overrides.pop('watch', watch))
+    serve_ = bool(overrides.pop('serve', False))
+    question = bool(overrides.pop('question', False))
+    ninja = overrides.pop('ninja', None)
+    trace = overrides.pop('trace', None)
+
+    context = _context(
+        config, pools, overrides, None if trace is None else Tracer(),
+        question)
+    try:
+        if serve_:
+            _serve(target, rules, context)
+            return None
+        if watch:
+            _watch(targets_, context)
+            return None
+        value = asyncio.run(sync(targets_, context))
+        if ninja is not None:
+            write_ninja(targets_, context, ninja, sys.argv[0], overrides)
+    finally:
+        _finish(context, trace)
+    if question:
+        raise SystemExit(1 if context.plan else 0)
+    if context.plan is not None:
+        for line in context.plan.report():
+            print(line)
+    return value
+
+def _construct(target: t.Any, overrides: t.Dict[str, t.Any]) -> Targets:
+    """Return the graph, if ``target`` is a function that constructs it,
+    from the snapshot named on the command line, or else ``target``."""
+    snapshot = overrides.pop('snapshot', SNAPSHOT)
+    if not isinstance(snapshot, str):
+        raise ValueError('--snapshot needs a filename')
+    if overrides.pop('no-snapshot', False):
+        snapshot = None
+    if callable(target) and not is_target(target):
+        return construct(target, snapshot, logging.getLogger())
+    return target
+
+def _caller_globals() -> t.Mapping[str, t.Any]:
+    """Return the globals of the module that called :func:`make`."""
+    # Just the frames we need: building the whole stack reads the source of
+    # every frame, which is slow.
+    frame = inspect.currentframe()
+    make_ = None if frame is None else frame.f_back
+    caller = None if make_ is None else make_.f_back
+    del frame, make_
+    if caller is None:
+        raise NotImplementedError(
+            'cannot get module of caller; '
+            'you must pass the "rules" argument')
+    rules = caller.f_globals
+    del caller
+    return rules
+
+def _context(
+        config: t.Optional[t.Mapping[str, t.Any]],
+        pools: t.Optional[t.Mapping[str, float]],
+        overrides: t.Dict[str, t.Any],
+        tracer: t.Optional[Tracer],
+        question: bool,
+) -> Context:
+    """Make the context of a build from the options on the command line.
+
+    The options that configure the build are taken out of ``overrides``, and
+    the rest pass into the configuration. A question is a dry run.
+    """
+    # ``--jobs`` without a number means "as many as there are CPUs".
+    jobs = overrides.pop('jobs', None)
+    jobs = None if jobs in (None, True) else int(jobs)
+    database = Database(overrides.pop('database', DATABASE))
+    freshness = overrides.pop('freshness', 'mtime')
+    cache = overrides.pop('cache', None)
+    cache_size = overrides.pop('cache-size', None)
+    keep_going = bool(overrides.pop('keep-going', False))
+    dry_run = bool(overrides.pop('dry-run', False)) or question
+    pools = {} if pools is None else dict(pools)
+    pools.update(_parse_pools(overrides.pop('pools', '')))
+    if cache is not None:
+        if re.match('^https?://', cache):
+            cache = HttpCache(cache)
+        else:
+            cache = LocalCache(
+                cache, None if cache_size is None else parse_size(cache_size))
+
+    jobserver = JobServer.from_environ()
+    if jobserver is None:
+        jobserver = JobServer.create(jobs or os.cpu_count() or 1)
+
     config = {} if config is None else dict(config)
     config.update(os.environ)
     config.update(overrides)
-    context = Context(config=config)
+    return Context(
+        config=config,
+        jobs=jobs,
+        database=database,
+        freshness=freshness,
+        cache=cache,
+        keep_going=keep_going,
+        tracer=tracer,
+        pools=pools,
+        jobserver=jobserver,
+        dry_run=dry_run,
+    )
+
+def _finish(context: Context, trace: t.Optional[str]) -> None:
+    """Close the database and the jobserver of a build, trim its cache, and
+    write its trace."""
+    context.database.close()
+    jobserver = context.scheduler.jobserver
+    if jobserver is not None:
+        jobserver.close()
+    if context.cache is not None:
+        context.cache.trim()
+    if context.tracer is not None and trace is not None:
+        context.tracer.write(trace)
 
-    return _run(sync(targets_, context))
+def _serve(target: Targets, rules: t.Mapping[str, t.Any], context: Context):
+    """Serve builds until interrupted."""
+    # Imported here because only a server needs it.
+    from picard.server import serve
+    with contextlib.suppress(KeyboardInterrupt):
+        asyncio.run(serve(target, rules, context))
 
-def _run(awaitable):
-    """A shim for :func:`asyncio.run` from 3.7+."""
-    loop = asyncio.get_event_loop()
-    return loop.run_until_complete(awaitable)
+def _watch(targets: Targets, context: Context) -> None:
+    """Build, and rebuild whenever the sources change, until interrupted."""
+    with contextlib.suppress(KeyboardInterrupt):
+        asyncio.run(watch_(targets, context))
+
+def lookup(name: str, rules: t.Mapping[str, t.Any], target: Targets):
+    """Find a target by name: first among the rules, and then among the
+    default targets and their prerequisites, e.g. a file target by its
+    filename.
+
+    Raises
+    ------
+    KeyError
+        If there is no such target.
+    """
+    value = rules.get(name, None)
+    if isinstance(value, Target):
+        return value
+    for node in Graph(target).nodes:
+        if str(node.name) == name:
+            return node
+    raise KeyError(f'no target named {name!r}')
+
+def _parse_pools(text: str) -> t.Dict[str, float]:
+    """Parse capacities of resource pools.
+
+    >>> _parse_pools('mem_gb:64,link:2')
+    {'mem_gb': 64.0, 'link': 2.0}
+    """
+    pools = {}
+    for item in filter(None, text.split(',')):
+        name, _, capacity = item.partition(':')
+        pools[name.strip()] = float(capacity)
+    return pools
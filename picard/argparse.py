@@ -4,13 +4,23 @@ import re
 import sys
 import typing as t
 
-def parse_args(argv: t.Iterable[str] = None):
+def parse_args(
+        argv: t.Iterable[str] = None,
+        flags: t.Container[str] = (),
+        counts: t.Container[str] = (),
+):
     """Parse a command line into positional and keyword arguments.
 
     Parameters
     ----------
     argv :
         A command line, like :obj:`sys.argv`.
+    flags :
+        The names of options that never take a value, e.g. ``keep-going``.
+        They are ``True`` when present.
+    counts :
+        The names of options that take the next argument only if it is a
+        number, like ``make -j``. Otherwise, they are ``True``.
 
     Returns
     -------
@@ -36,6 +46,10 @@ def parse_args(argv: t.Iterable[str] = None):
     (('a', 'b'), {'name': 'value'})
     >>> parse_args(['--name', 'value', 'a', 'b'])
     (('a', 'b'), {'name': 'value'})
+    >>> parse_args(['--flag', 'a'], flags=['flag'])
+    (('a',), {'flag': True})
+    >>> parse_args(['--jobs', 'a', '--jobs', '4'], counts=['jobs'])
+    (('a',), {'jobs': '4'})
     """
     if argv is None:
         argv = sys.argv[1:]
@@ -52,6 +66,9 @@ def parse_args(argv: t.Iterable[str] = None):
             if key is not None:
                 kwargs[key] = True
             key = arg[2:]
+            if key in flags:
+                kwargs[key] = True
+                key = None
             continue
 
         match = re.match('^(\\w+)=(.*)$', arg)
@@ -63,9 +80,13 @@ def parse_args(argv: t.Iterable[str] = None):
             continue
 
         if key is not None:
-            kwargs[key] = arg
+            if key not in counts or arg.isdigit():
+                kwargs[key] = arg
+                key = None
+                continue
+            # Not a count, so it is positional.
+            kwargs[key] = True
             key = None
-            continue
 
         args.append(arg)
 
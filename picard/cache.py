@@ -0,0 +1,355 @@
+"""A content-addressed cache of build outputs."""
+
+import contextlib
+import errno
+import fcntl
+import http.client
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import typing as t
+import urllib.error
+import urllib.request
+
+import typing_extensions as tex
+
+from picard.digest import digest_file
+
+FICLONE = 0x40049409
+"""The Linux ioctl that makes a copy-on-write clone of a file (a reflink)."""
+
+MODE = 0o644
+"""The permission bits of a restored file whose own were not stored."""
+
+# The errors of a request to an HTTP cache. :class:`urllib.error.URLError`
+# is an :class:`OSError`.
+_HTTP_ERRORS = (OSError, http.client.HTTPException)
+
+def parse_size(size: t.Union[int, str]) -> int:
+    """Parse a size in bytes, with an optional binary suffix.
+
+    >>> parse_size('512')
+    512
+    >>> parse_size('10K')
+    10240
+    >>> parse_size('2G')
+    2147483648
+    """
+    if isinstance(size, int):
+        return size
+    match = re.match('^(\\d+)([KMGT]?)B?$', size.strip().upper())
+    if match is None:
+        raise ValueError(f'not a size: {size}')
+    number, suffix = match.groups()
+    return int(number) << (10 * ' KMGT'.index(suffix or ' '))
+
+def _remove(path: str) -> None:
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(path)
+
+def clone(source: str, destination: str, mode: int) -> None:
+    """Replace ``destination`` with a new file with the content of
+    ``source`` and the permission bits ``mode``.
+
+    The content is cloned copy-on-write (a reflink) when the filesystem
+    can, and copied otherwise. Either way, the files do not share an inode,
+    so that changing one, even its modified time, leaves the other alone.
+    """
+    directory = os.path.dirname(os.path.abspath(destination))
+    with open(source, 'rb') as src:
+        fd, temporary = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as dst:
+                try:
+                    fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+                except OSError:
+                    shutil.copyfileobj(src, dst)
+            os.chmod(temporary, mode)
+            os.replace(temporary, destination)
+        except BaseException:
+            _remove(temporary)
+            raise
+
+@tex.runtime
+class Cache(tex.Protocol):
+    """A protocol for caches of build outputs.
+
+    Caches have two halves: a content-addressed store of files, keyed by
+    their digest, and a store of small JSON values, e.g. the digest of the
+    file output by an action, keyed by arbitrary strings. Methods may block;
+    callers run them in an executor.
+
+    A file is stored by its content alone. Callers that care about its
+    permission bits, e.g. for executables, keep them in the value, and pass
+    them back to :meth:`get_file`.
+    """
+    # pylint: disable=unused-argument,pointless-statement,no-self-use
+
+    def get_value(self, key: str) -> t.Any:
+        """Return the value stored under a key, or ``None``."""
+        ...
+
+    def put_value(self, key: str, value: t.Any) -> None:
+        """Store a value under a key."""
+        ...
+
+    def get_file(
+            self,
+            digest: str,
+            destination: t.Union[str, os.PathLike],
+            mode: int = None,
+    ) -> bool:
+        """Copy the file with a digest to a destination, with permission
+        bits ``mode``, if given, and return whether it was found."""
+        ...
+
+    def put_file(self, source: t.Union[str, os.PathLike]) -> str:
+        """Store a file, and return its digest."""
+        ...
+
+    def trim(self) -> None:
+        """Evict files until the cache fits its size, if it has one."""
+        ...
+
+class LocalCache(Cache):
+    """A content-addressed cache in a local directory.
+
+    Files are stored under ``cas/`` by the digest of their content. Small
+    JSON values, e.g. the digest of the output for an action key, are stored
+    under ``ac/`` by key. When the files take more than ``max_size`` bytes,
+    the least recently used are evicted by :meth:`trim`.
+
+    Files are stored and restored as clones (see :func:`clone`), never as
+    links, so that the cache and every tree that restored a file each have
+    their own. The stored files are read-only, and their modified times
+    record only when they were last used.
+
+    Parameters
+    ----------
+    directory :
+        The root directory of the cache. It is created if necessary.
+    max_size :
+        The maximum size of the cache in bytes, or ``None`` for no limit.
+    """
+
+    def __init__(
+            self,
+            directory: t.Union[str, os.PathLike],
+            max_size: int = None,
+    ) -> None:
+        self.directory = os.fspath(directory)
+        self.max_size = max_size
+
+    def _path(self, kind: str, key: str) -> str:
+        return os.path.join(self.directory, kind, key[:2], key)
+
+    def get_value(self, key: str) -> t.Any:
+        """Return the value stored under a key, or ``None``."""
+        try:
+            with open(self._path('ac', key)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def put_value(self, key: str, value: t.Any) -> None:
+        """Store a value under a key."""
+        self._write(self._path('ac', key), json.dumps(value).encode())
+
+    def get_file(
+            self,
+            digest: str,
+            destination: t.Union[str, os.PathLike],
+            mode: int = None,
+    ) -> bool:
+        """Restore the file with a given digest to a destination.
+
+        Parameters
+        ----------
+        digest :
+            The digest of the file.
+        destination :
+            The filename to restore it to.
+        mode :
+            The permission bits of the restored file. By default, they are
+            those of the stored file, plus write permission for its owner.
+
+        Returns
+        -------
+        bool
+            Whether the file was in the cache.
+        """
+        path = self._path('cas', digest)
+        try:
+            if mode is None:
+                mode = (os.stat(path).st_mode | 0o200) & 0o777
+            # A new file, and so newer than its prerequisites.
+            clone(path, os.fspath(destination), mode)
+        except FileNotFoundError:
+            return False
+        # Mark the file as recently used.
+        os.utime(path)
+        return True
+
+    def put_file(self, source: t.Union[str, os.PathLike]) -> str:
+        """Store a file and return its digest."""
+        digest = digest_file(source)
+        path = self._path('cas', digest)
+        if os.path.exists(path):
+            os.utime(path)
+            return digest
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        clone(os.fspath(source), path, os.stat(source).st_mode & 0o555)
+        return digest
+
+    def _write(self, path: str, content: bytes) -> None:
+        """Atomically write a file."""
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temporary = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+            os.replace(temporary, path)
+        except BaseException:
+            _remove(temporary)
+            raise
+
+    def trim(self) -> None:
+        """Evict the least recently used files until the cache fits within
+        its maximum size."""
+        if self.max_size is None:
+            return
+        entries = []
+        total = 0
+        for root, _, filenames in os.walk(os.path.join(self.directory, 'cas')):
+            for filename in filenames:
+                path = os.path.join(root, filename)
+                try:
+                    status = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((status.st_mtime_ns, status.st_size, path))
+                total += status.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError as error:
+                if error.errno != errno.ENOENT:
+                    raise
+            total -= size
+
+class HttpCache(Cache):
+    """A cache on an HTTP server.
+
+    The server must answer ``GET`` and ``PUT`` requests for paths of the form
+    ``/ac/KEY`` (values) and ``/cas/DIGEST`` (files), and answer ``404`` for
+    those that are missing. This is the protocol spoken by, e.g.,
+    bazel-remote_, or by nginx with WebDAV enabled.
+
+    A request that fails for any other reason, e.g. a timeout or a refused
+    connection, is logged, and treated as a miss or a store that did not
+    happen, so that the build goes on without the cache.
+
+    .. _bazel-remote: https://github.com/buchgr/bazel-remote
+
+    Parameters
+    ----------
+    url :
+        The base URL of the server.
+    timeout :
+        The timeout in seconds for each request.
+    log :
+        The logger for failed requests.
+    """
+
+    def __init__(
+            self,
+            url: str,
+            timeout: float = 30,
+            log: logging.Logger = logging.getLogger(),
+    ) -> None:
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+        self.log = log
+
+    def _request(
+            self, method: str, path: str, data: t.Any = None, **headers: str,
+    ) -> t.Any:
+        request = urllib.request.Request(
+            f'{self.url}/{path}', data=data, method=method, headers=headers)
+        return urllib.request.urlopen(request, timeout=self.timeout)
+
+    def _failed(self, method: str, path: str, error: Exception) -> None:
+        """Log a failed request, unless it was for something missing."""
+        if isinstance(error, urllib.error.HTTPError) and error.code == 404:
+            return
+        self.log.warning(f'cache: {method} {self.url}/{path}: {error}')
+
+    def get_value(self, key: str) -> t.Any:
+        path = f'ac/{key}'
+        try:
+            with self._request('GET', path) as response:
+                return json.load(response)
+        except (*_HTTP_ERRORS, ValueError) as error:
+            self._failed('GET', path, error)
+            return None
+
+    def put_value(self, key: str, value: t.Any) -> None:
+        path = f'ac/{key}'
+        data = json.dumps(value).encode()
+        try:
+            self._request('PUT', path, data).close()
+        except _HTTP_ERRORS as error:
+            self._failed('PUT', path, error)
+
+    def get_file(
+            self,
+            digest: str,
+            destination: t.Union[str, os.PathLike],
+            mode: int = None,
+    ) -> bool:
+        """Download the file with a given digest to a destination, with the
+        permission bits ``mode``, or else :data:`MODE`."""
+        path = f'cas/{digest}'
+        destination = os.fspath(destination)
+        directory = os.path.dirname(os.path.abspath(destination))
+        fd, temporary = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                with self._request('GET', path) as response:
+                    shutil.copyfileobj(response, f)
+                    if response.length:
+                        # The connection closed before the end.
+                        raise http.client.IncompleteRead(b'', response.length)
+            os.chmod(temporary, MODE if mode is None else mode)
+            os.replace(temporary, destination)
+        except _HTTP_ERRORS as error:
+            _remove(temporary)
+            self._failed('GET', path, error)
+            return False
+        except BaseException:
+            _remove(temporary)
+            raise
+        return True
+
+    def put_file(self, source: t.Union[str, os.PathLike]) -> str:
+        digest = digest_file(source)
+        path = f'cas/{digest}'
+        size = os.stat(source).st_size
+        with open(source, 'rb') as f:
+            try:
+                self._request(
+                    'PUT', path, f, **{'Content-Length': str(size)}
+                ).close()
+            except _HTTP_ERRORS as error:
+                self._failed('PUT', path, error)
+        return digest
+
+    def trim(self) -> None:
+        """Leave eviction to the server."""
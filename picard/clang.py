@@ -1,15 +1,34 @@
 """Patterns for compiling C and C++ objects and executables."""
 
+import asyncio
+import functools
+import hashlib
+import os
 import re
+import shutil
 import typing as t
 
+from picard.cache import Cache
+from picard.context import Context
+from picard.depfile import parse_depfile
 from picard.file import file, file_target, FileLike, FileTargetLike
 from picard.shell import sh
 from picard.typing import Target
 
+MANIFEST_SIZE = 16
+"""The maximum number of header sets remembered for each source file."""
+
 def object_(source: FileTargetLike) -> Target:
     """Compile an object file from a source file.
 
+    The compiler writes a dependency file listing the headers included by
+    the source file. They are stored in the database of past builds, so that
+    changing any of them will recompile the object file.
+
+    If the context has a :class:`~picard.cache.Cache`, it is consulted
+    before compiling. The cache is keyed by the compiler, ``CPPFLAGS``,
+    ``CFLAGS``, and the contents of the source file and its headers.
+
     Parameters
     ----------
     source :
@@ -21,17 +40,29 @@ def object_(source: FileTargetLike) -> Target:
         A :ref:`file target <file-target>` for the object file compiled from
         ``source``.
     """
-    # TODO: Implement :func:`find_headers`.
-    # headers = [file_target(h) for h in find_headers(filename)]
-    headers: t.Iterable[FileTargetLike] = []
     source = file_target(source)
-    @file(re.sub('\\.c$', '.o', source.name), source, *headers)
-    async def target(self, context, source, *headers):
-        # pylint: disable=unused-argument
+    filename = re.sub('\\.c$', '.o', source.name)
+    @file(
+        filename, source,
+        config=('CC', 'CPPFLAGS', 'CFLAGS'),
+        depfile=filename + '.d',
+    )
+    async def target(self, context, source):
         cc = context.config.get('CC', 'cc')
         cpp_flags = context.config.get('CPPFLAGS', None)
         c_flags = context.config.get('CFLAGS', None)
-        await sh(cc, cpp_flags, c_flags, '-c', source)
+        cache = context.cache
+        if cache is not None:
+            key = await _digest(
+                context, 'object', cc, cpp_flags, c_flags, source, [source])
+            if await _restore_object(context, cache, key, self, source):
+                return
+        await sh(
+            cc, cpp_flags, c_flags, '-MMD', '-MF', self.depfile,
+            '-c', source, '-o', self.name,
+        )
+        if cache is not None:
+            await _store_object(context, cache, key, self, source)
     return target
 
 def objects(*sources):
@@ -41,6 +72,12 @@ def objects(*sources):
 def executable(filename: FileLike, *objects: FileTargetLike) -> Target:
     """Link an executable from object files.
 
+    The executable is a :ref:`file target <file-target>` with ``cache=True``,
+    so if the context has a :class:`~picard.cache.Cache`, it is consulted
+    before linking. The cache is keyed by the linking recipe, the values of
+    ``CC``, ``LDFLAGS``, and ``LDLIBS``, the filename, and the contents of
+    the object files.
+
     Parameters
     ----------
     filename :
@@ -54,11 +91,109 @@ def executable(filename: FileLike, *objects: FileTargetLike) -> Target:
         A :ref:`file target <file-target>` for the executable linked from
         ``objects``.
     """
-    @file(filename, *objects)
+    @file(filename, *objects, config=('CC', 'LDFLAGS', 'LDLIBS'), cache=True)
     async def target(self, context, *objects):
-        # pylint: disable=unused-argument
         cc = context.config.get('CC', 'cc')
         ld_flags = context.config.get('LDFLAGS', None)
         ld_libs = context.config.get('LDLIBS', None)
         await sh(cc, ld_flags, '-o', self.name, *objects, ld_libs)
     return target
+
+@functools.lru_cache(maxsize=None)
+def _compiler(cc: str) -> str:
+    """Identify a compiler by its resolved path, size, and modified time."""
+    path = shutil.which(cc)
+    if path is None:
+        return cc
+    path = os.path.realpath(path)
+    status = os.stat(path)
+    return f'{path}:{status.st_size}:{status.st_mtime_ns}'
+
+async def _digest(
+        context: Context,
+        kind: str,
+        cc: str,
+        flags1: t.Optional[str],
+        flags2: t.Optional[str],
+        *files: t.Any,
+) -> str:
+    """Digest the compiler, two sets of flags, and the names and contents of
+    the files in each of the rest of the arguments."""
+    h = hashlib.sha256()
+    for part in (kind, _compiler(cc), flags1, flags2):
+        h.update(f'{part}\0'.encode())
+    for filenames in files:
+        if isinstance(filenames, (str, os.PathLike)):
+            h.update(f'{filenames}\0'.encode())
+            continue
+        for digest in await _digest_files(context, filenames) or ():
+            h.update(f'{digest}\0'.encode())
+    return h.hexdigest()
+
+async def _digest_files(
+        context: Context, filenames: t.Sequence[FileLike],
+) -> t.Optional[t.List[str]]:
+    """Return the digests of files, or ``None`` if any are missing."""
+    statuses = await context.stats.stat_all(filenames)
+    present = [s for s in statuses if s is not None]
+    if len(present) < len(statuses):
+        return None
+    return await context.digests.digest_all(filenames, present)
+
+async def _restore_object(
+        context: Context,
+        cache: Cache,
+        key: str,
+        target: t.Any,
+        source: FileLike,
+) -> bool:
+    """Restore an object file and its dependency file from the cache.
+
+    The key does not cover the headers, which are not known until the source
+    is preprocessed. Instead, it maps to a manifest of the header sets seen
+    before, each with their digests and the digest of the object file they
+    produced. The first set whose digests all match is a hit.
+    """
+    loop = asyncio.get_event_loop()
+    manifest = await loop.run_in_executor(None, cache.get_value, key)
+    for entry in manifest or ():
+        headers = entry['headers']
+        digests = await _digest_files(context, list(headers))
+        if digests != list(headers.values()):
+            continue
+        if not await loop.run_in_executor(
+                None, cache.get_file, entry['object'], target.name):
+            continue
+        depfile = ' '.join(
+            p.replace(' ', '\\ ') for p in (os.fspath(source), *headers))
+        with open(target.depfile, 'w') as f:
+            f.write(f'{target.name}: {depfile}\n')
+        context.log.info(f'cached: {target.name}')
+        return True
+    return False
+
+async def _store_object(
+        context: Context,
+        cache: Cache,
+        key: str,
+        target: t.Any,
+        source: FileLike,
+) -> None:
+    """Store an object file in the cache, and add its headers to the
+    manifest for its key."""
+    with open(target.depfile) as f:
+        headers = [
+            h for h in parse_depfile(f.read()) if h != os.fspath(source)
+        ]
+    digests = await _digest_files(context, headers)
+    if digests is None:
+        return
+    loop = asyncio.get_event_loop()
+    digest = await loop.run_in_executor(None, cache.put_file, target.name)
+    entry = {'headers': dict(zip(headers, digests)), 'object': digest}
+    manifest = await loop.run_in_executor(None, cache.get_value, key)
+    manifest = [
+        e for e in manifest or () if e['headers'] != entry['headers']
+    ]
+    manifest = [entry, *manifest][:MANIFEST_SIZE]
+    await loop.run_in_executor(None, cache.put_value, key, manifest)
@@ -1,15 +1,101 @@
 """Context shared through the dependency graph."""
 
+import asyncio
 import logging
 import typing as t
 
+from picard.cache import Cache
+from picard.database import Database
+from picard.digest import DigestCache
+from picard.jobserver import JobServer
+from picard.scheduler import Scheduler
+from picard.stat import StatCache
+from picard.trace import Tracer
+
+FRESHNESS = ('mtime', 'digest')
+
 class Context:
-    """A configuration mapping and a logger."""
+    """A configuration mapping, a logger, and the state of one build.
+
+    The state includes:
+
+    - a memo of evaluations, keyed by target, so that each target's recipe
+      runs at most once per context, no matter how many dependents it has;
+    - a :class:`~picard.scheduler.Scheduler` that runs at most ``jobs``
+      recipes at once, within the capacities of resource ``pools``, and
+      remembers how long each took in the database;
+    - a :class:`~picard.stat.StatCache` shared by every file target;
+    - a :class:`~picard.database.Database` of past builds, and
+      a :class:`~picard.digest.DigestCache` stored in it;
+    - an optional :class:`~picard.cache.Cache` of build outputs;
+    - for a dry run, a :class:`~picard.plan.Plan` of the recipes that would
+      run.
+
+    Parameters
+    ----------
+    config :
+        A configuration mapping.
+    log :
+        A logger.
+    jobs :
+        The maximum number of recipes to run at once. Defaults to the number
+        of CPUs.
+    database :
+        A database. Defaults to an in-memory database that keeps nothing
+        between builds.
+    freshness :
+        How file targets decide whether they are up-to-date: ``'mtime'``
+        (the default) compares modified times, like Make; ``'digest'``
+        compares the content digests of prerequisites with those recorded at
+        the last build.
+    cache :
+        A cache of build outputs, or ``None`` (the default) for no caching.
+    keep_going :
+        Whether to keep evaluating the targets that do not depend on a failed
+        target, instead of cancelling everything at the first failure.
+    tracer :
+        A :class:`~picard.trace.Tracer` to record a profile of the build, or
+        ``None`` (the default) for none.
+    pools :
+        A mapping from resource name, e.g. ``'mem_gb'``, to the capacity that
+        the recipes running at once may share.
+    jobserver :
+        A :class:`~picard.jobserver.JobServer` shared with the parent and
+        children of this process, or ``None`` (the default) for none.
+    dry_run :
+        Whether to find which recipes would run, in :attr:`plan`, instead of
+        running them.
+    """
 
     def __init__(
             self,
             config: t.Mapping[str, t.Any] = None,
             log: logging.Logger = logging.getLogger(),
+            jobs: int = None,
+            database: Database = None,
+            freshness: str = 'mtime',
+            cache: Cache = None,
+            keep_going: bool = False,
+            tracer: Tracer = None,
+            pools: t.Mapping[str, float] = None,
+            jobserver: JobServer = None,
+            dry_run: bool = False,
     ) -> None:
+        if freshness not in FRESHNESS:
+            raise ValueError(f'unknown freshness: {freshness}')
         self.config = {} if config is None else config
         self.log = log
+        self.database = Database() if database is None else database
+        self.scheduler = Scheduler(
+            jobs, self.database.table('durations'), pools, jobserver)
+        self.stats = StatCache()
+        self.digests = DigestCache(self.database.table('digests'))
+        self.freshness = freshness
+        self.cache = cache
+        self.keep_going = keep_going
+        self.tracer = tracer
+        self.plan = None
+        if dry_run:
+            from picard.plan import Plan # pylint: disable=cyclic-import
+            self.plan = Plan(self.scheduler.durations)
+        self.memo: t.MutableMapping[t.Any, asyncio.Future] = {}
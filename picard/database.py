@@ -0,0 +1,113 @@
+"""A persistent record of past builds."""
+
+import json
+import os
+import sqlite3
+import typing as t
+
+class Table(t.MutableMapping[str, t.Any]):
+    """A mapping from strings to JSON values, stored in a :class:`Database`.
+
+    The whole table is loaded into memory on first use. Changes stay in memory
+    until the database is committed, when they are written in one
+    transaction.
+    """
+
+    def __init__(self, database: 'Database', name: str) -> None:
+        self._database = database
+        self.name = name
+        self._rows: t.Optional[t.Dict[str, t.Any]] = None
+        self._dirty: t.Set[str] = set()
+
+    @property
+    def rows(self) -> t.Dict[str, t.Any]:
+        """The rows of this table, read when first needed."""
+        if self._rows is None:
+            self._rows = self._database.load(self.name)
+        return self._rows
+
+    def __getitem__(self, key: str) -> t.Any:
+        return self.rows[key]
+
+    def __setitem__(self, key: str, value: t.Any) -> None:
+        self.rows[key] = value
+        self._dirty.add(key)
+
+    def __delitem__(self, key: str) -> None:
+        del self.rows[key]
+        self._dirty.add(key)
+
+    def __iter__(self) -> t.Iterator[str]:
+        return iter(self.rows)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def changes(self) -> t.Tuple[t.List[t.Tuple[str, str]], t.List[str]]:
+        """Return and forget the rows changed and deleted since the last
+        commit."""
+        dirty, self._dirty = self._dirty, set()
+        rows = self.rows
+        changed = [(k, json.dumps(rows[k])) for k in dirty if k in rows]
+        deleted = [k for k in dirty if k not in rows]
+        return changed, deleted
+
+class Database:
+    """A set of :class:`Table`\\ s in an SQLite database.
+
+    Parameters
+    ----------
+    path :
+        The filename of the database. The default, ``':memory:'``, keeps
+        nothing between processes. The file is not opened until a table is
+        first used.
+    """
+
+    def __init__(self, path: t.Union[str, os.PathLike] = ':memory:') -> None:
+        self.path = path
+        self._connection: t.Optional[sqlite3.Connection] = None
+        self._tables: t.Dict[str, Table] = {}
+
+    def table(self, name: str) -> Table:
+        """Return the table with a given name, creating it if necessary."""
+        table = self._tables.get(name, None)
+        if table is None:
+            table = self._tables[name] = Table(self, name)
+        return table
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """The connection to the database, opened when first needed."""
+        if self._connection is None:
+            self._connection = sqlite3.connect(os.fspath(self.path))
+        return self._connection
+
+    def load(self, name: str) -> t.Dict[str, t.Any]:
+        """Read every row of a table."""
+        connection = self.connection
+        connection.execute(
+            f'CREATE TABLE IF NOT EXISTS "{name}" '
+            '(key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        cursor = connection.execute(f'SELECT key, value FROM "{name}"')
+        return {k: json.loads(v) for k, v in cursor}
+
+    def commit(self) -> None:
+        """Write every change to disk."""
+        if self._connection is None:
+            return
+        with self._connection as connection:
+            for table in self._tables.values():
+                changed, deleted = table.changes()
+                connection.executemany(
+                    f'INSERT OR REPLACE INTO "{table.name}" (key, value) '
+                    'VALUES (?, ?)', changed)
+                connection.executemany(
+                    f'DELETE FROM "{table.name}" WHERE key = ?',
+                    ((k,) for k in deleted))
+
+    def close(self) -> None:
+        """Commit and then close the database."""
+        self.commit()
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
@@ -0,0 +1,67 @@
+"""Parse the Makefile-style dependency files written by compilers."""
+
+import typing as t
+
+def parse_depfile(text: str) -> t.List[str]:
+    """Return the prerequisites named in a dependency file.
+
+    Dependency files, like those written by ``cc -MMD -MF FILE``, are
+    a subset of Makefile syntax: one or more rules, each a list of targets,
+    a colon, and a list of prerequisites, with lines continued by
+    a backslash. Spaces in filenames are escaped with a backslash, and dollar
+    signs are doubled.
+
+    Parameters
+    ----------
+    text :
+        The content of a dependency file.
+
+    Returns
+    -------
+    [str]
+        The prerequisites of every rule, in order and without duplicates.
+
+    Examples
+    --------
+
+    >>> parse_depfile('a.o: a.c a.h \\\\\\n  b.h\\n')
+    ['a.c', 'a.h', 'b.h']
+    >>> parse_depfile('a.o: a\\\\ b.c $$c.h\\na.h:\\n')
+    ['a b.c', '$c.h']
+    """
+    prereqs: t.Dict[str, None] = {}
+    text = text.replace('\\\r\n', ' ').replace('\\\n', ' ')
+    for line in text.splitlines():
+        words = _split(line)
+        for i, word in enumerate(words):
+            if word.endswith(':'):
+                for prereq in words[i + 1:]:
+                    prereqs.setdefault(prereq, None)
+                break
+    return list(prereqs)
+
+def _split(line: str) -> t.List[str]:
+    """Split a line into words, unescaping spaces and dollar signs."""
+    words = []
+    word: t.List[str] = []
+    i = 0
+    while i < len(line):
+        c = line[i]
+        if c == '\\' and i + 1 < len(line) and line[i + 1] in ' #':
+            word.append(line[i + 1])
+            i += 2
+            continue
+        if c == '$' and i + 1 < len(line) and line[i + 1] == '$':
+            word.append('$')
+            i += 2
+            continue
+        if c.isspace():
+            if word:
+                words.append(''.join(word))
+                word = []
+        else:
+            word.append(c)
+        i += 1
+    if word:
+        words.append(''.join(word))
+    return words
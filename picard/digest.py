@@ -0,0 +1,76 @@
+"""Content digests of files."""
+
+import asyncio
+import hashlib
+import mmap
+import os
+import typing as t
+
+from picard.database import Table
+
+CHUNK_SIZE = 1 << 16
+"""Files smaller than this are read into memory in one piece."""
+
+MMAP_SIZE = 1 << 20
+"""Files at least this large are memory-mapped instead of read."""
+
+def digest_file(path: t.Union[str, os.PathLike]) -> str:
+    """Return the hexadecimal SHA-256 digest of a file's content."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size >= MMAP_SIZE:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                h.update(m)
+        else:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                h.update(chunk)
+    return h.hexdigest()
+
+class DigestCache:
+    """Digests of files, stored by path, size, and modified time.
+
+    A file is hashed (in the loop's default executor) only when its size or
+    modified time differs from what is stored.
+
+    Parameters
+    ----------
+    table :
+        A table mapping each path to a list of its size, modified time in
+        nanoseconds, and digest.
+    """
+
+    def __init__(self, table: Table) -> None:
+        self._table = table
+        self._futures: t.Dict[t.Tuple[str, int, int], asyncio.Future] = {}
+
+    async def digest_all(
+            self,
+            paths: t.Iterable[t.Union[str, os.PathLike]],
+            statuses: t.Iterable[os.stat_result],
+    ) -> t.List[str]:
+        """Return the digest of each file, given its current status."""
+        futures = [
+            self._future(os.fspath(p), s) for p, s in zip(paths, statuses)
+        ]
+        return await asyncio.shield(asyncio.gather(*futures))
+
+    def _future(self, path: str, status: os.stat_result) -> asyncio.Future:
+        size, mtime = status.st_size, status.st_mtime_ns
+        key = (path, size, mtime)
+        future = self._futures.get(key, None)
+        if future is not None:
+            return future
+        loop = asyncio.get_event_loop()
+        record = self._table.get(path, None)
+        if record is not None and record[:2] == [size, mtime]:
+            future = loop.create_future()
+            future.set_result(record[2])
+        else:
+            future = loop.run_in_executor(None, digest_file, path)
+            def store(future: asyncio.Future) -> None:
+                if not future.cancelled() and future.exception() is None:
+                    self._table[path] = [size, mtime, future.result()]
+            future.add_done_callback(store)
+        self._futures[key] = future
+        return future
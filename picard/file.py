@@ -1,11 +1,23 @@
 """Make-style file (and directory) targets."""
 
+import asyncio
+import errno
+import hashlib
 import os
 from pathlib import Path
+import stat
+import types
 import typing as t
+import weakref
 
+from picard.action import action_key
+from picard.cache import Cache
 from picard.context import Context
-from picard.typing import Target
+from picard.depfile import parse_depfile
+from picard.scheduler import Command
+from picard.stat import Status
+from picard import trace
+from picard.typing import Target, is_target
 
 FileLike = t.Union[str, os.PathLike]
 FileTargetLike = t.Union[Target, FileLike]
@@ -15,6 +27,22 @@ Recipe = t.Callable[
     t.Awaitable[t.Union[None, Path]],
 ]
 
+# Shared by every target without resources.
+_NO_RESOURCES: t.Mapping[str, float] = types.MappingProxyType({})
+
+def _filename(value: FileLike) -> str:
+    """Return a filename in the form of ``str(Path(value))``, without
+    making a :class:`~pathlib.Path` when it is already in that form."""
+    name = os.fspath(value)
+    if (
+            os.sep == '/' and isinstance(name, str) and name and
+            name != '.' and not name.startswith(('./', '//')) and
+            not name.endswith(('/', '/.')) and
+            '//' not in name and '/./' not in name
+    ):
+        return name
+    return str(Path(name))
+
 def is_file_like(value):
     # For now, ``isinstance`` does not play well with ``typing.Union``.
     # https://stackoverflow.com/a/45959000/618906
@@ -24,67 +52,379 @@ class FileRecipePostConditionError(Exception):
     """Raised when a file recipe fails to update its target."""
 
 class FileTarget(Target):
-    """A file that must be newer than its prerequisite files."""
+    """A file that must be newer than its prerequisite files.
+
+    Graphs can have millions of these, so they have slots, and keep their
+    path as a string, in :attr:`name`.
+    """
+
+    __slots__ = (
+        'name', 'prereqs', 'config', 'restat', 'depfile', 'cache',
+        'resources', '_recipe', '__weakref__',
+    )
 
     def __init__(
-            self, path: Path, recipe: Recipe, *prereqs: FileTargetLike,
+            self,
+            path: FileLike,
+            recipe: Recipe,
+            *prereqs: FileTargetLike,
+            config: t.Iterable[str] = (),
+            restat: bool = False,
+            depfile: FileLike = None,
+            cache: bool = False,
+            resources: t.Mapping[str, float] = None,
     ) -> None:
-        self.path = path
-        self.prereqs = [file_target(p) for p in prereqs]
+        self.name = os.fspath(path)
+        self.prereqs = tuple(file_target(p) for p in prereqs)
+        self.config = tuple(config)
+        self.restat = restat
+        self.depfile = depfile
+        self.cache = cache
+        self.resources = _NO_RESOURCES if not resources else dict(resources)
         self._recipe = recipe
 
+    @classmethod
+    def _make(
+            cls,
+            name: str,
+            recipe: Recipe,
+            prereqs: t.Tuple[Target, ...],
+            config: t.Tuple[str, ...],
+            restat: bool,
+            depfile: t.Optional[str],
+            cache: bool,
+            resources: t.Optional[t.Dict[str, float]],
+    ) -> 'FileTarget':
+        """Construct a target from values that are already in the forms
+        that the constructor would convert them to, e.g. from a
+        :mod:`snapshot <picard.snapshot>`, without converting them again."""
+        # pylint: disable=protected-access
+        target = cls.__new__(cls)
+        target.name = name
+        target.prereqs = prereqs
+        target.config = config
+        target.restat = restat
+        target.depfile = depfile
+        target.cache = cache
+        target.resources = resources or _NO_RESOURCES
+        target._recipe = recipe
+        return target
+
     @property
-    def name(self) -> str: # type: ignore
-        return str(self.path)
+    def path(self) -> Path:
+        """The path of the file."""
+        return Path(self.name)
 
     async def recipe(self, context: Context) -> Path:
         """Conditionally rebuild this file.
 
         The conditions are (1) if this file does not exist or (2) if its
-        prerequisites have changed since it was last touched.
+        prerequisites have changed since it was last touched. Whether they
+        have changed is decided by the context's ``freshness``. The file is
+        also rebuilt whenever its :func:`action key
+        <picard.action.action_key>` differs from that recorded at its last
+        build.
+
+        If this target was constructed with ``restat=True`` and its recipe
+        rewrites it with the same content as its last build, or leaves it
+        alone, then its dependents will see it as unchanged ("early
+        cutoff").
+
+        If this target was constructed with a ``depfile``, then the
+        prerequisites listed in that file after its recipe runs are stored in
+        the database and checked, along with its explicit prerequisites, in
+        later builds.
+
+        If this target was constructed with ``cache=True`` and the context
+        has a :class:`cache <picard.cache.Cache>`, then the file is restored
+        from the cache, instead of running the recipe, whenever it has been
+        built before with the same action and prerequisite contents.
+
+        In a dry run, the recipe is not run. Instead, if it would run, this
+        target is added to the context's :class:`~picard.plan.Plan`.
         """
-        # TODO: Memoize value.
         # There is no way around evaluating all of the prerequisites. Either
         # (1) some have changed but we must feed them all to the recipe or (2)
         # we must check all of them to make sure none have changed.
         from picard.api import sync # pylint: disable=cyclic-import
-        prereqs = await sync(self.prereqs)
-        if not await self._is_up_to_date(context, prereqs):
-            context.log.info(f'start: {self.name}')
-            value = await self._recipe(self, context, *prereqs)
-            if value is not None and value != self.path:
-                context.log.warning(
-                    f'discarding value returned by {self._recipe}: {value}')
-            if not await self._is_up_to_date(context, prereqs):
-                raise FileRecipePostConditionError(self.name)
-            context.log.info(f'finish: {self.name}')
+        prereqs = await sync(self.prereqs, context)
+        if context.plan is not None:
+            if context.plan.stale(self) or not await self._is_up_to_date(
+                    context, prereqs):
+                context.plan.add(self)
+            return self.path
+        with trace.target(context.tracer, self.name):
+            with trace.span('up-to-date', 'check'):
+                if await self._is_up_to_date(context, prereqs):
+                    return self.path
+            async with context.scheduler.job(self) as job:
+                before = await context.stats.stat(self.name)
+                context.log.info(f'start: {self.name}')
+                cache = context.cache if self.cache else None
+                key = None
+                if cache is not None:
+                    key = await self._cache_key(context, prereqs)
+                with trace.span('recipe', 'recipe'):
+                    if cache is None or key is None:
+                        await self._run(context, prereqs)
+                    elif not await self._restore(context, cache, key):
+                        await self._run(context, prereqs)
+                        await self._store(cache, key)
+                await self._record(context, prereqs, job.commands, before)
+                with trace.span('up-to-date', 'check'):
+                    if not await self._is_up_to_date(context, prereqs):
+                        raise FileRecipePostConditionError(self.name)
+                context.log.info(f'finish: {self.name}')
         return self.path
 
+    async def _run(self, context: Context, prereqs: t.Sequence[t.Any]) -> None:
+        value = await self._recipe(self, context, *prereqs)
+        context.stats.invalidate(self.name)
+        if self.depfile is not None:
+            await self._read_depfile(context, self.depfile)
+        if value is not None and value != self.path:
+            context.log.warning(
+                f'discarding value returned by {self._recipe}: {value}')
+
+    async def _cache_key(
+            self, context: Context, prereqs: t.Iterable[t.Any]
+    ) -> str:
+        """Digest the action, the name, and the prerequisite contents."""
+        filenames = _filenames(context, prereqs)
+        statuses = _present(
+            filenames, await context.stats.stat_all(filenames))
+        digests = await context.digests.digest_all(filenames, statuses)
+        h = hashlib.sha256(f'{self._action(context)}\0{self.name}'.encode())
+        for digest in digests:
+            h.update(f'\0{digest}'.encode())
+        return h.hexdigest()
+
+    async def _restore(
+            self, context: Context, cache: Cache, key: str
+    ) -> bool:
+        """Try to restore this file from the cache."""
+        loop = asyncio.get_event_loop()
+        value = await loop.run_in_executor(None, cache.get_value, key)
+        if value is None:
+            return False
+        hit = await loop.run_in_executor(
+            None, cache.get_file, value['output'], self.name,
+            value.get('mode', None))
+        if hit:
+            context.stats.invalidate(self.name)
+            context.log.info(f'cached: {self.name}')
+        return hit
+
+    async def _store(self, cache: Cache, key: str) -> None:
+        """Store this file, and its permission bits, in the cache."""
+        loop = asyncio.get_event_loop()
+        digest = await loop.run_in_executor(None, cache.put_file, self.name)
+        mode = stat.S_IMODE(os.stat(self.name).st_mode)
+        await loop.run_in_executor(
+            None, cache.put_value, key, {'output': digest, 'mode': mode})
+
     async def _is_up_to_date(
             self, context: Context, prereqs: t.Iterable[t.Any]
     ) -> bool:
-        try:
-            mtime = os.stat(self.name).st_mtime
-        except FileNotFoundError:
+        filenames = _filenames(context, prereqs)
+        explicit = len(filenames)
+        filenames += self._discovered(context)
+
+        # Stat the target and all of its prerequisites in one batch.
+        status, *found = await context.stats.stat_all(
+            [self.name, *filenames])
+        if status is None:
+            return False
+        if any(s is None for s in found[explicit:]):
+            # A discovered prerequisite has gone away.
+            return False
+        statuses = _present(filenames, found)
+
+        builds = context.database.table('builds')
+        record = builds.get(self.name, None)
+        if record is not None and record['action'] != self._action(context):
+            # The recipe or its configuration has changed.
             return False
 
-        for prereq in prereqs:
-            if not is_file_like(prereq):
-                # Not a filename.
-                context.log.warn(
-                    f'skipping non-filename dependency: {prereq}')
-                continue
-            if os.stat(prereq).st_mtime > mtime:
+        if context.freshness == 'digest' and record is not None:
+            inputs = record.get('inputs', None)
+            if inputs is not None:
+                digests = await context.digests.digest_all(
+                    filenames, statuses)
+                return inputs == _inputs(filenames, digests)
+
+        mtime = status.st_mtime_ns
+        built = None if record is None else record.get('built', None)
+        if built is not None and built[0] == mtime:
+            # A restat recipe last ran after this file was modified, and left
+            # it alone.
+            mtime = built[1]
+        for filename, prereq_status in zip(filenames, statuses):
+            if _mtime(builds, filename, prereq_status) > mtime:
                 # Prerequisite has been modified after target.
                 return False
 
+        if context.plan is not None:
+            # Leave the database alone in a dry run.
+            return True
+        if record is None or (
+                context.freshness == 'digest' and 'inputs' not in record):
+            # Adopt a target built before it was recorded.
+            commands = [] if record is None else record['commands']
+            await self._record(context, prereqs, commands)
         return True
 
+    def _discovered(self, context: Context) -> t.List[str]:
+        """Return the prerequisites discovered at the last build."""
+        if self.depfile is None:
+            return []
+        return list(context.database.table('deps').get(self.name, ()))
+
+    async def _read_depfile(
+            self, context: Context, depfile: FileLike
+    ) -> None:
+        """Store the prerequisites listed in the dependency file, and then
+        remove it."""
+        loop = asyncio.get_event_loop()
+        try:
+            text = await loop.run_in_executor(
+                None, _read_and_remove, depfile)
+        except FileNotFoundError:
+            context.log.warning(f'missing dependency file: {depfile}')
+            context.database.table('deps').pop(self.name, None)
+            return
+        explicit = {p.name for p in self.prereqs}
+        context.database.table('deps')[self.name] = [
+            d for d in parse_depfile(text) if d not in explicit
+        ]
+
+    def _action(self, context: Context) -> str:
+        return action_key(self._recipe, context.config, self.config)
+
+    async def _record(
+            self,
+            context: Context,
+            prereqs: t.Iterable[t.Any],
+            commands: t.Sequence[Command],
+            before: os.stat_result = None,
+    ) -> None:
+        """Record the action (and, if needed, the input digests) of a fresh
+        build.
+
+        ``before`` is the status of the file before its recipe ran, or
+        ``None`` if it did not run.
+        """
+        builds = context.database.table('builds')
+        previous = builds.get(self.name, None)
+        record: t.Dict[str, t.Any] = {
+            'action': self._action(context),
+            'commands': list(commands),
+        }
+        if self.restat:
+            status = await context.stats.stat(self.name)
+            if status is not None:
+                digest, = await context.digests.digest_all(
+                    [self.name], [status])
+                record['output'] = digest
+                if previous is not None and previous.get('output') == digest:
+                    if before is not None:
+                        # Dependents should compare against the modified time
+                        # of the content, which has not changed.
+                        mtime = _mtime(builds, self.name, before)
+                        record['cutoff'] = [status.st_mtime_ns, mtime]
+                    elif 'cutoff' in previous:
+                        record['cutoff'] = previous['cutoff']
+                if before is not None:
+                    newest = await self._newest(context, prereqs)
+                    if newest > status.st_mtime_ns:
+                        # The recipe left the file older than its
+                        # prerequisites, which it may, if it has not changed.
+                        record['built'] = [status.st_mtime_ns, newest]
+                elif previous is not None and 'built' in previous:
+                    record['built'] = previous['built']
+        if context.freshness == 'digest':
+            filenames = _filenames(context, prereqs)
+            filenames += self._discovered(context)
+            statuses = _present(
+                filenames, await context.stats.stat_all(filenames))
+            digests = await context.digests.digest_all(filenames, statuses)
+            record['inputs'] = _inputs(filenames, digests)
+        builds[self.name] = record
+
+    async def _newest(
+            self, context: Context, prereqs: t.Iterable[t.Any]
+    ) -> int:
+        """Return the newest modified time of the prerequisites' content."""
+        builds = context.database.table('builds')
+        filenames = _filenames(context, prereqs) + self._discovered(context)
+        statuses = await context.stats.stat_all(filenames)
+        return max((
+            _mtime(builds, f, s)
+            for f, s in zip(filenames, statuses) if s is not None
+        ), default=0)
+
+def _read_and_remove(filename: FileLike) -> str:
+    with open(filename) as f:
+        text = f.read()
+    os.remove(filename)
+    return text
+
+def _filenames(
+        context: Context, prereqs: t.Iterable[t.Any]
+) -> t.List[FileLike]:
+    filenames = []
+    for prereq in prereqs:
+        if not is_file_like(prereq):
+            # Not a filename.
+            context.log.warn(f'skipping non-filename dependency: {prereq}')
+            continue
+        filenames.append(prereq)
+    return filenames
+
+def _present(
+        filenames: t.Sequence[FileLike], statuses: t.Sequence[Status],
+) -> t.List[os.stat_result]:
+    """Return the statuses of files that must exist."""
+    present = []
+    for filename, status in zip(filenames, statuses):
+        if status is None:
+            raise FileNotFoundError(
+                errno.ENOENT, os.strerror(errno.ENOENT), str(filename))
+        present.append(status)
+    return present
+
+def _mtime(
+        builds: t.Mapping[str, t.Any],
+        filename: FileLike,
+        status: os.stat_result,
+) -> int:
+    """Return the modified time, in nanoseconds, of a file's content.
+
+    That is the time recorded by an early cutoff, if the file has not been
+    touched since, or else the time of its status.
+    """
+    record = builds.get(os.fspath(filename), None)
+    if record is not None:
+        cutoff = record.get('cutoff', None)
+        if cutoff is not None and cutoff[0] == status.st_mtime_ns:
+            return cutoff[1]
+    return status.st_mtime_ns
+
+def _inputs(
+        filenames: t.Iterable[FileLike], digests: t.Iterable[str]
+) -> t.Dict[str, str]:
+    return {os.fspath(f): d for f, d in zip(filenames, digests)}
+
+# The source files named by filename, shared by every target that names
+# them, for as long as any does.
+_SOURCES: t.MutableMapping[str, FileTarget] = weakref.WeakValueDictionary()
+
 def file_target(value: FileTargetLike) -> Target:
     """Canonicalize a value to a :class:`Target`.
 
     If the value is already a :class:`Target`, it is returned as-is.
-    If it is a :class:`str`, it is returned as a :class:`FileTarget`.
+    If it is a :class:`str`, it is returned as a :class:`FileTarget`, the
+    same one for the same filename.
 
     Parameters
     ----------
@@ -101,19 +441,76 @@ def file_target(value: FileTargetLike) -> Target:
     Exception
         If :param:`value` is not convertible to a target.
     """
-    if isinstance(value, Target):
-        return value
+    # Check the common types first, because checking the protocol is slow.
+    kind = type(value)
+    if kind is FileTarget or (kind is not str and is_target(value)):
+        return t.cast(Target, value)
     if is_file_like(value):
         # Treat ``value`` as a filename.
-        return file(value)()
+        filename = t.cast(FileLike, value)
+        key = t.cast(str, value) if kind is str else os.fspath(filename)
+        try:
+            return _SOURCES[key]
+        except KeyError:
+            target = _SOURCES[key] = file(filename)()
+            return target
     raise Exception(f'not a target: {value}')
 
 async def _noop(*args, **kwargs) -> None: # pylint: disable=unused-argument
     """A function that does nothing."""
 
-def file(target: FileLike, *prereqs: FileTargetLike):
-    """A file that is newer than its prerequisite files."""
+def file(
+        target: FileLike,
+        *prereqs: FileTargetLike,
+        config: t.Iterable[str] = (),
+        restat: bool = False,
+        depfile: FileLike = None,
+        cache: bool = False,
+        resources: t.Mapping[str, float] = None,
+):
+    """A file that is newer than its prerequisite files.
+
+    Parameters
+    ----------
+    target :
+        The filename or path of the file.
+    *prereqs :
+        Filenames, paths, or targets for the prerequisite files.
+    config :
+        The names of the configuration values that the recipe reads. The file
+        is rebuilt whenever any of them change. Only these, and the code,
+        default arguments, and captured values of the recipe (see
+        :func:`~picard.action.recipe_identity`), decide whether it is
+        rebuilt: the commands it ran are recorded, but not compared, because
+        the commands of the next build are only known by running it. A value
+        that the recipe reads but that is missing here can change without
+        rebuilding the file.
+    restat :
+        Whether to compare the file's content after each rebuild with that of
+        its last build, and if they are the same, leave its dependents alone.
+        The recipe may then leave the file untouched when it would not
+        change, e.g. a generator that writes only changed content.
+    depfile :
+        The filename of a Makefile-style dependency file, e.g. from
+        ``cc -MMD -MF depfile``, that the recipe writes to list prerequisites
+        it discovered, e.g. headers. It is read and removed after the recipe
+        runs.
+    cache :
+        Whether to restore the file from the context's cache, if it has one,
+        instead of running the recipe, when the recipe has already run with
+        the same prerequisite contents. Only the file itself is cached, so
+        the recipe should have no other effects. The cache keeps a copy of
+        its own, so the recipe may rewrite the file in place.
+    resources :
+        The resources consumed by the recipe, e.g. ``{'mem_gb': 8}``, counted
+        against the pools of the context's
+        :class:`~picard.scheduler.Scheduler`.
+    """
     # pylint: disable=unused-argument
     def decorator(recipe: Recipe = _noop):
-        return FileTarget(Path(target), recipe, *prereqs)
+        return FileTarget(
+            _filename(target), recipe, *prereqs,
+            config=config, restat=restat, depfile=depfile, cache=cache,
+            resources=resources,
+        )
     return decorator
@@ -0,0 +1,325 @@
+"""An explicit dependency graph and an executor for it."""
+
+from array import array
+import asyncio
+import typing as t
+
+from picard.context import Context
+from picard.traversable import Traversable
+from picard.typing import Target, is_target
+
+class CycleError(Exception):
+    """Raised when the prerequisites of a target lead back to itself."""
+
+    def __init__(self, cycle: t.Sequence[Target]) -> None:
+        super().__init__(
+            'dependency cycle: ' + ' -> '.join(str(c.name) for c in cycle))
+        self.cycle = cycle
+
+class BuildError(Exception):
+    """Raised at the end of a build in which some targets failed.
+
+    Attributes
+    ----------
+    failures : [(Target, BaseException)]
+        Each failed target and the exception raised by its recipe.
+    """
+
+    def __init__(
+            self, failures: t.Sequence[t.Tuple[Target, BaseException]],
+    ) -> None:
+        names = ', '.join(str(target.name) for target, _ in failures)
+        super().__init__(f'{len(failures)} target(s) failed: {names}')
+        self.failures = failures
+
+class _Frame: # pylint: disable=too-few-public-methods
+    """A target on the stack of a depth-first search, its prerequisites,
+    and the position of the next one to visit."""
+
+    __slots__ = ('target', 'children', 'position')
+
+    def __init__(self, target: Target, children: t.List[Target]) -> None:
+        self.target = target
+        self.children = children
+        self.position = 0
+
+def prerequisites(structure: t.Any) -> t.Iterator[Target]:
+    """Iterate the targets buried in a prerequisite structure.
+
+    The walk is iterative and does not descend into targets, strings, or
+    iterators (which cannot be iterated twice). The targets in
+    a :class:`~picard.traversable.Traversable` are found only once.
+    """
+    stack = [structure]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, Traversable):
+            yield from value.targets
+            continue
+        kind = type(value)
+        if kind is list or kind is tuple:
+            stack.extend(reversed(value))
+            continue
+        if isinstance(value, (str, bytes, range)):
+            continue
+        if is_target(value):
+            yield value
+        elif isinstance(value, t.Mapping):
+            stack.extend(reversed(list(value.values())))
+        elif isinstance(value, t.Iterator):
+            continue
+        elif isinstance(value, t.Iterable):
+            stack.extend(reversed(list(value)))
+
+class Adjacency(t.Sequence[t.Sequence[int]]):
+    """A list of node numbers for each node, packed in two arrays.
+
+    The numbers for node ``i`` are ``edges[offsets[i]:offsets[i + 1]]``.
+    """
+
+    __slots__ = ('offsets', 'edges')
+
+    def __init__(self) -> None:
+        self.offsets = array('l', [0])
+        self.edges = array('i')
+
+    def append(self, nodes: t.Iterable[int]) -> None:
+        """Add the numbers for the next node."""
+        self.edges.extend(nodes)
+        self.offsets.append(len(self.edges))
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i): # type: ignore
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('node out of range')
+        return self.edges[self.offsets[i]:self.offsets[i + 1]]
+
+    def __iter__(self) -> t.Iterator[t.Sequence[int]]:
+        edges = self.edges
+        offsets = self.offsets
+        for i in range(len(self)):
+            yield edges[offsets[i]:offsets[i + 1]]
+
+    def __eq__(self, other: t.Any) -> bool:
+        if not isinstance(other, t.Sequence):
+            return NotImplemented
+        return len(self) == len(other) and all(
+            list(a) == list(b) for a, b in zip(self, other))
+
+    __hash__ = None # type: ignore
+
+    def __repr__(self) -> str:
+        return repr([list(nodes) for nodes in self])
+
+    def degrees(self) -> t.List[int]:
+        """Return the length of the list for each node."""
+        offsets = self.offsets
+        return [offsets[i + 1] - offsets[i] for i in range(len(self))]
+
+    def transpose(self) -> 'Adjacency':
+        """Return the reverse edges, each list in ascending order."""
+        n = len(self)
+        counts = [0] * (n + 1)
+        for j in self.edges:
+            counts[j + 1] += 1
+        for j in range(n):
+            counts[j + 1] += counts[j]
+        offsets = array('l', counts)
+        edges = array('i', [0]) * len(self.edges)
+        for i, nodes in enumerate(self):
+            for j in nodes:
+                edges[counts[j]] = i
+                counts[j] += 1
+        transposed = Adjacency()
+        transposed.offsets = offsets
+        transposed.edges = edges
+        return transposed
+
+class Graph:
+    """A table of nodes and edges for every target reachable from some roots.
+
+    Nodes are numbered in topological order: every target comes after all of
+    its prerequisites. The numbers of the prerequisites and dependents of
+    each node are in two :class:`Adjacency` tables, ``prereqs`` and
+    ``dependents``. Targets that are already in the memo (i.e. evaluated
+    or being evaluated) become nodes, but their prerequisites are not walked.
+
+    Parameters
+    ----------
+    roots :
+        A prerequisite structure.
+    memo :
+        The memo of a :class:`Context`.
+
+    Raises
+    ------
+    CycleError
+        If any target is reachable from itself.
+    """
+
+    def __init__(
+            self, roots: t.Any, memo: t.Container[Target] = (),
+    ) -> None:
+        self.nodes: t.List[Target] = []
+        self.index: t.Dict[Target, int] = {}
+        self.prereqs = Adjacency()
+        self.roots = [self._walk(r, memo) for r in prerequisites(roots)]
+        self.dependents = self.prereqs.transpose()
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def _walk(self, root: Target, memo: t.Container[Target]) -> int:
+        if root in self.index:
+            return self.index[root]
+        # An iterative depth-first search.
+        visiting = {root}
+        stack = [_Frame(root, self._children(root, memo))]
+        while stack:
+            frame = stack[-1]
+            children = frame.children
+            position = frame.position
+            while position < len(children):
+                child = children[position]
+                position += 1
+                if child in self.index:
+                    continue
+                if child in visiting:
+                    path = [f.target for f in stack]
+                    raise CycleError(path[path.index(child):] + [child])
+                visiting.add(child)
+                stack.append(_Frame(child, self._children(child, memo)))
+                break
+            else:
+                stack.pop()
+                visiting.remove(frame.target)
+                self._add(frame.target, children)
+                continue
+            frame.position = position
+        return self.index[root]
+
+    @staticmethod
+    def _children(
+            target: Target, memo: t.Container[Target]
+    ) -> t.List[Target]:
+        if target in memo:
+            return []
+        return list(prerequisites(target.prereqs))
+
+    def _add(self, target: Target, children: t.Iterable[Target]) -> None:
+        i = len(self.nodes)
+        self.nodes.append(target)
+        self.index[target] = i
+        # All prerequisites have been added already.
+        self.prereqs.append(sorted({self.index[c] for c in children}))
+
+    def critical_paths(
+            self, durations: t.Mapping[str, float],
+    ) -> t.List[float]:
+        """Return the length of the longest path from each node to a root.
+
+        A path is as long as the sum of the durations of its targets, i.e.
+        the least time to finish the roots once the node is ready. Targets
+        without a known duration are assumed to take the mean of the rest.
+        """
+        known = [durations.get(str(n.name), None) for n in self.nodes]
+        values = [d for d in known if d is not None]
+        mean = sum(values) / len(values) if values else 0.0
+        lengths = [0.0] * len(self.nodes)
+        # Every dependent has a greater number than its prerequisites.
+        for i in reversed(range(len(self.nodes))):
+            longest = max((lengths[d] for d in self.dependents[i]), default=0)
+            duration = known[i]
+            lengths[i] = longest + (mean if duration is None else duration)
+        return lengths
+
+async def execute(graph: Graph, context: Context) -> None:
+    """Evaluate every target in a graph, each after its prerequisites.
+
+    Ready targets are started as soon as their last prerequisite finishes.
+    Their futures are kept in the context's memo, where :func:`picard.sync`
+    will find them. Each target is prioritized in the scheduler by its
+    critical path, as measured in past builds, so that when there are more
+    ready targets than jobs, the longest chains of work start first.
+
+    If a recipe raises an exception, then by default every recipe still
+    running is cancelled (which kills their subprocesses), and the exception
+    is propagated. If the context has ``keep_going``, then every target that
+    does not depend on a failed target is still evaluated, and
+    a :class:`BuildError` is raised at the end.
+    """
+    waiting = graph.prereqs.degrees()
+    finished: asyncio.Queue = asyncio.Queue()
+    started: t.List[asyncio.Future] = []
+    skipped: t.Set[int] = set()
+    failures: t.List[t.Tuple[Target, BaseException]] = []
+    scheduler = context.scheduler
+    priorities = graph.critical_paths(scheduler.durations)
+    scheduler.priorities.update(zip(graph.nodes, priorities))
+
+    def start(i: int) -> None:
+        target = graph.nodes[i]
+        future = context.memo.get(target, None)
+        if future is None:
+            future = asyncio.ensure_future(target.recipe(context))
+            context.memo[target] = future
+            started.append(future)
+        future.add_done_callback(lambda _: finished.put_nowait(i))
+
+    def skip(i: int) -> int:
+        """Skip every dependent of a target, and return how many."""
+        count = 0
+        stack = list(graph.dependents[i])
+        while stack:
+            d = stack.pop()
+            if d not in skipped:
+                skipped.add(d)
+                count += 1
+                stack.extend(graph.dependents[d])
+        return count
+
+    def by_priority(nodes: t.Iterable[int]) -> t.List[int]:
+        return sorted(nodes, key=lambda i: -priorities[i])
+
+    for i in by_priority(i for i, count in enumerate(waiting) if count == 0):
+        start(i)
+
+    remaining = len(graph)
+    try:
+        while remaining:
+            i = await finished.get()
+            remaining -= 1
+            future = context.memo[graph.nodes[i]]
+            error = (
+                asyncio.CancelledError() if future.cancelled() else
+                future.exception()
+            )
+            if error is not None:
+                if not context.keep_going:
+                    future.result()
+                failures.append((graph.nodes[i], error))
+                remaining -= skip(i)
+                continue
+            ready = []
+            for d in graph.dependents[i]:
+                waiting[d] -= 1
+                if waiting[d] == 0 and d not in skipped:
+                    ready.append(d)
+            for d in by_priority(ready):
+                start(d)
+    finally:
+        running = [f for f in started if not f.done()]
+        for future in running:
+            future.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+
+    if failures:
+        for target, error in failures:
+            context.log.error(f'failed: {target.name}: {error}')
+        raise BuildError(failures)
@@ -0,0 +1,192 @@
+"""The GNU make jobserver protocol.
+
+A jobserver is a pipe (or named pipe) holding one byte, a token, for every
+job that may run at once beyond the first. Every process in the tree owns
+one implicit job, and must read a token from the pipe before running each
+additional job, and write it back when that job finishes. See `the GNU make
+manual`__.
+
+.. __: https://www.gnu.org/software/make/manual/html_node/Job-Slots.html
+"""
+
+import asyncio
+import collections
+import contextlib
+import logging
+import os
+import re
+import stat
+import typing as t
+
+Token = t.Optional[bytes]
+"""A byte read from the pipe, or ``None`` for the implicit job."""
+
+_AUTH = re.compile(
+    '--jobserver-(?:auth|fds)=(?:fifo:(?P<fifo>\\S+)|(?P<r>\\d+),(?P<w>\\d+))')
+
+class JobServer:
+    """A client of a jobserver.
+
+    Use :meth:`from_environ` to join the jobserver of a parent ``make``, or
+    :meth:`create` to start a new one. Either way, :meth:`environ` and
+    :attr:`pass_fds` let child processes, e.g. recursive ``make``, share it.
+
+    Parameters
+    ----------
+    read_fd :
+        A non-blocking file descriptor to read tokens from.
+    write_fd :
+        A file descriptor to write tokens to.
+    makeflags :
+        The ``MAKEFLAGS`` for children.
+    pass_fds :
+        The file descriptors that children must inherit.
+    owned :
+        File descriptors to close in :meth:`close`.
+    """
+
+    def __init__(
+            self,
+            read_fd: int,
+            write_fd: int,
+            makeflags: str,
+            pass_fds: t.Sequence[int] = (),
+            owned: t.Sequence[int] = (),
+    ) -> None:
+        self.read_fd = read_fd
+        self.write_fd = write_fd
+        self.makeflags = makeflags
+        self.pass_fds = tuple(pass_fds)
+        self._owned = owned
+        self._implicit = False
+        self._waiters: t.Deque[asyncio.Future] = collections.deque()
+
+    @classmethod
+    def from_environ(
+            cls,
+            environ: t.Mapping[str, str] = os.environ,
+            log: logging.Logger = logging.getLogger(),
+    ) -> t.Optional['JobServer']:
+        """Join the jobserver named in ``MAKEFLAGS``, if any.
+
+        Returns ``None`` if there is none, or if it cannot be opened, e.g.
+        because the parent ``make`` did not treat this command as recursive
+        and closed the pipe.
+        """
+        makeflags = environ.get('MAKEFLAGS', '')
+        matches = list(_AUTH.finditer(makeflags))
+        if not matches:
+            return None
+        # The last option wins.
+        match = matches[-1]
+        try:
+            if match.group('fifo'):
+                path = match.group('fifo')
+                read_fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+                write_fd = os.open(path, os.O_WRONLY)
+                return cls(read_fd, write_fd, makeflags, (),
+                           (read_fd, write_fd))
+            r, w = int(match.group('r')), int(match.group('w'))
+            for fd in (r, w):
+                if not stat.S_ISFIFO(os.fstat(fd).st_mode):
+                    raise OSError(f'not a pipe: {fd}')
+            read_fd = _reopen(r)
+        except OSError as error:
+            log.warning(f'cannot join jobserver: {error}')
+            return None
+        return cls(read_fd, w, makeflags, (r, w), (read_fd,))
+
+    @classmethod
+    def create(cls, jobs: int) -> 'JobServer':
+        """Start a jobserver for ``jobs`` jobs."""
+        r, w = os.pipe()
+        os.write(w, b'+' * (jobs - 1))
+        read_fd = _reopen(r)
+        makeflags = f'-j{jobs} --jobserver-auth={r},{w}'
+        return cls(read_fd, w, makeflags, (r, w), (read_fd, r, w))
+
+    def environ(
+            self, environ: t.Mapping[str, str] = os.environ,
+    ) -> t.Dict[str, str]:
+        """Return a copy of an environment that shares this jobserver."""
+        environ = dict(environ)
+        environ['MAKEFLAGS'] = self.makeflags
+        return environ
+
+    async def acquire(self) -> Token:
+        """Wait for a job, and return its token."""
+        if not self._implicit:
+            self._implicit = True
+            return None
+        loop = asyncio.get_event_loop()
+        waiter = loop.create_future()
+        self._waiters.append(waiter)
+        if len(self._waiters) == 1:
+            loop.add_reader(self.read_fd, self._read)
+        try:
+            return await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # We were handed a token just as we were cancelled.
+                self.release(waiter.result())
+            else:
+                with contextlib.suppress(ValueError):
+                    self._waiters.remove(waiter)
+                self._idle()
+            raise
+
+    def release(self, token: Token) -> None:
+        """Give back the token of a finished job."""
+        if token is not None:
+            os.write(self.write_fd, token)
+            return
+        # Hand the implicit job directly to a waiter, if any.
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                self._idle()
+                return
+        self._implicit = False
+        self._idle()
+
+    def close(self) -> None:
+        """Close the file descriptors opened for this jobserver."""
+        for fd in self._owned:
+            with contextlib.suppress(OSError):
+                os.close(fd)
+
+    def _read(self) -> None:
+        while self._waiters:
+            waiter = self._waiters[0]
+            if waiter.done():
+                self._waiters.popleft()
+                continue
+            try:
+                token = os.read(self.read_fd, 1)
+            except BlockingIOError:
+                return
+            if not token:
+                # Every writer has closed the pipe. Stop waiting for it.
+                self._waiters.popleft().set_exception(
+                    OSError('jobserver closed'))
+                continue
+            self._waiters.popleft().set_result(token)
+        self._idle()
+
+    def _idle(self) -> None:
+        if not self._waiters:
+            asyncio.get_event_loop().remove_reader(self.read_fd)
+
+def _reopen(fd: int) -> int:
+    """Open a new, non-blocking description of the pipe at a file
+    descriptor, so as not to change the blocking mode of the one shared with
+    other processes."""
+    try:
+        return os.open(f'/proc/self/fd/{fd}', os.O_RDONLY | os.O_NONBLOCK)
+    except OSError:
+        # Without procfs, fall back to the shared description. GNU make
+        # tolerates non-blocking reads.
+        fd = os.dup(fd)
+        os.set_blocking(fd, False)
+        return fd
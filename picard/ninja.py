@@ -0,0 +1,261 @@
+"""Lower a graph of file targets to a ``build.ninja`` file for Ninja_.
+
+.. _Ninja: https://ninja-build.org/manual.html
+"""
+
+import os
+import re
+import shlex
+import sys
+import typing as t
+
+from picard.context import Context
+from picard.graph import Graph, prerequisites
+from picard.scheduler import Command
+from picard.snapshot import scripts
+from picard.typing import Target
+
+NINJA = 'build.ninja'
+"""The default filename of a Ninja build file."""
+
+def escape(path: t.Any) -> str:
+    """Escape a path for a build statement.
+
+    >>> escape('a b:c$d')
+    'a$ b$:c$$d'
+    """
+    return (
+        os.fspath(path).replace('$', '$$').replace(' ', '$ ')
+        .replace(':', '$:')
+    )
+
+def _shell(command: Command) -> str:
+    """Return a recorded command as a line for the shell.
+
+    >>> _shell(['cc', '-c', 'a b.c'])
+    "cc -c 'a b.c'"
+    >>> _shell({'args': ['make'], 'cwd': '/src', 'env': {'A': '1', 'B': None}})
+    '(cd /src && env -u B A=1 make)'
+    """
+    if not isinstance(command, dict):
+        return ' '.join(shlex.quote(a) for a in command)
+    env = command.get('env', {})
+    args = list(command['args'])
+    if env:
+        # Options come before variables.
+        unset = sorted(n for n, v in env.items() if v is None)
+        assign = sorted(f'{n}={v}' for n, v in env.items() if v is not None)
+        args = ['env', *(a for n in unset for a in ('-u', n)), *assign, *args]
+    line = ' '.join(shlex.quote(a) for a in args)
+    cwd = command.get('cwd', None)
+    if cwd is not None:
+        # In a subshell, to leave the directory of later commands alone.
+        line = f'(cd {shlex.quote(cwd)} && {line})'
+    return line
+
+def _command(commands: t.Sequence[Command]) -> str:
+    return ' && '.join(_shell(c) for c in commands).replace('$', '$$')
+
+def _arguments(overrides: t.Mapping[str, t.Any]) -> t.List[str]:
+    """Return the command line arguments that pass configuration values to
+    a build script.
+
+    >>> _arguments({'CC': 'clang', 'with-docs': True, 'out-dir': 'a b'})
+    ['CC=clang', '--with-docs', '--out-dir', 'a b']
+    """
+    arguments: t.List[str] = []
+    for name, value in overrides.items():
+        if value is True:
+            arguments.append(f'--{name}')
+        elif re.match('^\\w+$', name):
+            arguments.append(f'{name}={value}')
+        else:
+            arguments += [f'--{name}', str(value)]
+    return arguments
+
+def _rule(depfile: bool, restat: bool) -> str:
+    return 'sh' + ('_gcc' if depfile else '') + ('_restat' if restat else '')
+
+def _pool(
+        target: t.Any, pools: t.Mapping[str, float],
+) -> t.Optional[t.Tuple[str, int]]:
+    """Choose the Ninja pool for a target: that of its most constraining
+    resource, as many of which fit in their pool as its depth."""
+    choices = []
+    for name, cost in (getattr(target, 'resources', None) or {}).items():
+        if name not in pools or cost <= 0:
+            continue
+        depth = max(1, int(pools[name] // min(cost, pools[name])))
+        choices.append((f'{name}_{depth}', depth))
+    return min(choices, key=lambda choice: choice[1], default=None)
+
+def _step(
+        node: t.Any,
+        builds: t.Mapping[str, t.Any],
+        script: t.Optional[str],
+        arguments: t.Sequence[str],
+) -> t.Optional[t.Tuple[str, bool]]:
+    """Return the command of the step for a file target, and whether it is
+    a restat step, or ``None`` if it has none."""
+    record = builds.get(node.name, None)
+    commands = [] if record is None else record['commands']
+    if commands:
+        return _command(commands), bool(getattr(node, 'restat', False))
+    if script is not None:
+        # A callback may decide that its target is up-to-date.
+        command = [sys.executable, script, *arguments, node.name]
+        return _command([command]), True
+    return None
+
+def _statement(
+        node: t.Any,
+        inputs: t.Sequence[Target],
+        command: str,
+        restat: bool,
+        pool: t.Optional[t.Tuple[str, int]],
+) -> str:
+    """Return the build statement for a file target."""
+    depfile = getattr(node, 'depfile', None)
+    lines = [
+        f'build {escape(node.name)}: {_rule(depfile is not None, restat)}'
+        f' {" ".join(escape(i.name) for i in inputs)}',
+        f'  cmd = {command}',
+    ]
+    if depfile is not None:
+        lines.append(f'  depfile = {os.fspath(depfile)}')
+    if pool is not None:
+        lines.append(f'  pool = {pool[0]}')
+    return '\n'.join(lines)
+
+def _header(pools: t.Mapping[str, int]) -> t.List[str]:
+    """Return the lines that declare the pools and the rules."""
+    text = ['# Generated by picard. Do not edit.', '']
+    for name, depth in sorted(pools.items()):
+        text += [f'pool {name}', f'  depth = {depth}', '']
+    for depfile in (False, True):
+        for restat in (False, True):
+            text += [f'rule {_rule(depfile, restat)}', '  command = $cmd']
+            text.append('  description = $out')
+            if depfile:
+                text += ['  depfile = $depfile', '  deps = gcc']
+            if restat:
+                text.append('  restat = 1')
+            text.append('')
+    return text
+
+def _regenerate(
+        graph: Graph, script: str, arguments: t.Sequence[str], filename: str,
+) -> t.List[str]:
+    """Return the lines that regenerate the build file when the build
+    scripts change."""
+    modules = {
+        module for module in (
+            getattr(getattr(node, '_recipe', None), '__module__', None)
+            for node in graph.nodes
+        ) if module is not None
+    }
+    implicit = [
+        escape(f) for f in scripts(modules)
+        if f != os.path.abspath(script)
+    ]
+    regenerate = [sys.executable, script, *arguments, '--ninja']
+    return [
+        'rule picard',
+        f'  command = {_command([regenerate])} $out',
+        '  description = picard $out',
+        '  generator = 1',
+        '',
+        f'build {escape(filename)}: picard {escape(script)}'
+        + (f' | {" ".join(implicit)}' if implicit else ''),
+        '',
+    ]
+
+def lower(
+        target: t.Any,
+        context: Context,
+        script: t.Optional[str] = None,
+        filename: str = NINJA,
+        overrides: t.Mapping[str, t.Any] = None,
+) -> t.Tuple[str, t.List[Target]]:
+    """Lower a graph of file targets to the text of a Ninja build file.
+
+    Each file target with prerequisites becomes a build statement. Its
+    command is the list of commands run by :func:`picard.sh` at its last
+    build, as recorded in the context's database, so the graph must have
+    been built first. A command that ran in another directory, or with
+    changes to its environment, runs in a subshell that changes to that
+    directory, under ``env``. A ``depfile`` becomes ``deps = gcc``, ``restat``
+    becomes ``restat = 1``, and ``resources`` choose a ``pool``.
+
+    A file target that ran no commands at its last build, e.g. one with
+    a Python recipe, becomes a step that calls back into the build
+    ``script`` to build just that file. Without a script, no step is
+    written. Neither is one written for targets that are not files, e.g.
+    rules, nor for file targets with them as prerequisites.
+
+    With a script, Ninja will also regenerate the build file, at
+    ``filename``, whenever the script, a module beside it, or a module of
+    a recipe changes (see :func:`picard.snapshot.scripts`). The script is
+    passed the configuration ``overrides`` from its command line, both when
+    it regenerates the file and when it builds a file for a step, so that
+    they are built with the same configuration as this graph was. Values
+    from the environment are not passed, and a change to one is not seen
+    until the file is regenerated by hand.
+
+    Returns
+    -------
+    (str, [Target])
+        The text, and the targets that could not be lowered.
+    """
+    graph = Graph(target)
+    arguments = _arguments(overrides or {})
+    builds = context.database.table('builds')
+    pools: t.Dict[str, int] = {}
+    statements: t.List[str] = []
+    skipped: t.List[Target] = []
+    outputs: t.List[str] = []
+    roots = set(graph.roots)
+    for i, node in enumerate(graph.nodes):
+        inputs = list(prerequisites(node.prereqs))
+        if not hasattr(node, 'path') or not all(
+                hasattr(p, 'path') for p in inputs):
+            skipped.append(node)
+            continue
+        if not inputs:
+            # A source.
+            continue
+        step = _step(node, builds, script, arguments)
+        if step is None:
+            skipped.append(node)
+            continue
+        command, restat = step
+        pool = _pool(node, context.scheduler.pools)
+        if pool is not None:
+            pools[pool[0]] = pool[1]
+        statements.append(_statement(node, inputs, command, restat, pool))
+        if i in roots:
+            outputs.append(escape(node.name))
+
+    text = _header(pools)
+    if script is not None:
+        text += _regenerate(graph, script, arguments, filename)
+    text += statements
+    if outputs:
+        text += ['', f'default {" ".join(outputs)}']
+    return '\n'.join(text) + '\n', skipped
+
+def write(
+        target: t.Any,
+        context: Context,
+        filename: str = NINJA,
+        script: t.Optional[str] = None,
+        overrides: t.Mapping[str, t.Any] = None,
+) -> t.List[Target]:
+    """Write a Ninja build file (see :func:`lower`), and return the targets
+    that could not be lowered."""
+    text, skipped = lower(target, context, script, filename, overrides)
+    with open(filename, 'w') as f:
+        f.write(text)
+    for node in skipped:
+        context.log.warning(f'not lowered to ninja: {node.name}')
+    return skipped
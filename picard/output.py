@@ -0,0 +1,69 @@
+"""Buffered output of subprocesses."""
+
+import collections
+import sys
+import typing as t
+
+LIMIT = 1 << 20
+"""The default maximum number of bytes kept by an :class:`Output`."""
+
+class Output:
+    """A bounded buffer of output, flushed as one block.
+
+    Chunks are kept as they are written, without copying or splitting lines.
+    Once more than ``limit`` bytes are written, the first half of the limit
+    is kept, and the rest acts as a ring buffer of the most recent output.
+
+    Parameters
+    ----------
+    limit :
+        The maximum number of bytes to keep.
+    """
+
+    def __init__(self, limit: int = LIMIT) -> None:
+        self.limit = limit
+        self._head: t.List[bytes] = []
+        self._head_size = 0
+        self._tail: t.Deque[bytes] = collections.deque()
+        self._tail_size = 0
+        self.omitted = 0
+        """The number of bytes dropped from the middle."""
+
+    def write(self, chunk: bytes) -> None:
+        """Append a chunk of output."""
+        if self._head_size < self.limit // 2 and not self._tail:
+            self._head.append(chunk)
+            self._head_size += len(chunk)
+            return
+        self._tail.append(chunk)
+        self._tail_size += len(chunk)
+        room = self.limit - self._head_size
+        while self._tail_size > room and len(self._tail) > 1:
+            dropped = self._tail.popleft()
+            self._tail_size -= len(dropped)
+            self.omitted += len(dropped)
+
+    def chunks(self) -> t.Iterator[bytes]:
+        """Iterate the chunks kept, with a note where any were dropped."""
+        yield from self._head
+        if self.omitted:
+            yield f'\n[... {self.omitted} bytes omitted ...]\n'.encode()
+        yield from self._tail
+
+    def getvalue(self) -> bytes:
+        """Return everything kept, as one string of bytes."""
+        return b''.join(self.chunks())
+
+    def flush(self, stream: t.BinaryIO = None) -> None:
+        """Write everything kept to a stream, by default standard output, and
+        then forget it."""
+        if not self._head and not self._tail:
+            return
+        if stream is None:
+            sys.stdout.flush()
+            stream = sys.stdout.buffer
+        stream.writelines(self.chunks())
+        stream.flush()
+        self._head.clear()
+        self._tail.clear()
+        self._head_size = self._tail_size = self.omitted = 0
@@ -3,7 +3,9 @@
 import functools
 import typing as t
 
+from picard import trace
 from picard.context import Context
+from picard.traversable import Traversable
 from picard.typing import Target
 
 Recipe = t.Any
@@ -13,26 +15,42 @@ class PatternTarget(Target):
 
     def __init__(self, name: str, recipe: Recipe, *args, **kwargs) -> None:
         self.name = name
-        self.prereqs = (args, kwargs)
+        # Taken apart once, to be mapped at every evaluation.
+        self.prereqs = Traversable((args, kwargs))
+        self.resources: t.Mapping[str, float] = {}
         self._recipe = recipe
         if recipe.__doc__:
             self.__doc__ = recipe.__doc__
 
     async def recipe(self, context: Context) -> t.Any:
-        # TODO: Memoize value.
         from picard.api import sync # pylint: disable=cyclic-import
-        args, kwargs = await sync(self.prereqs)
-        context.log.info(f'start: {self.name}')
-        value = await self._recipe(self, context, *args, **kwargs)
-        context.log.info(f'finish: {self.name}')
+        args, kwargs = (await sync(self.prereqs, context)).structure
+        if context.plan is not None:
+            context.plan.add_rule(self)
+            return None
+        with trace.target(context.tracer, self.name):
+            async with context.scheduler.job(self):
+                context.log.info(f'start: {self.name}')
+                with trace.span('recipe', 'recipe'):
+                    value = await self._recipe(self, context, *args, **kwargs)
+                context.log.info(f'finish: {self.name}')
         return value
 
-def pattern() -> t.Callable[[Recipe], t.Callable[..., Target]]:
+def pattern(
+        resources: t.Mapping[str, float] = None,
+) -> t.Callable[[Recipe], t.Callable[..., Target]]:
     """Turn a recipe function into a target constructor.
 
     The constructor's parameters are the prerequisites, which will be passed,
     evaluated, to the recipe.
 
+    Parameters
+    ----------
+    resources :
+        The resources consumed by the recipe of every target, e.g.
+        ``{'mem_gb': 8}``, counted against the pools of the context's
+        :class:`~picard.scheduler.Scheduler`.
+
     Example
     -------
 
@@ -51,7 +69,10 @@ def pattern() -> t.Callable[[Recipe], t.Callable[..., Target]]:
     def decorator(recipe):
         @_wraps(recipe)
         def constructor(name, *args, **kwargs):
-            return PatternTarget(name, recipe, *args, **kwargs)
+            target = PatternTarget(name, recipe, *args, **kwargs)
+            if resources is not None:
+                target.resources = dict(resources)
+            return target
         return constructor
     return decorator
 
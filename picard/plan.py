@@ -0,0 +1,114 @@
+"""The recipes that a build would run, found without running them."""
+
+import typing as t
+
+from picard.graph import prerequisites
+from picard.typing import Target
+
+class Plan:
+    """The targets whose recipes would run, in the order they would run.
+
+    A context with a plan is a dry run: file targets check whether they are
+    up-to-date, as usual, but instead of running their recipe, add
+    themselves to the plan, and every target that depends on a target in the
+    plan is assumed to be out-of-date. Other targets, e.g. rules, evaluate to
+    ``None`` and are held aside: they join the plan, just before the first
+    step that depends on them, only when a file target that would be built
+    depends on them, directly or through other rules. A plan with no steps
+    means that everything is up-to-date.
+
+    Parameters
+    ----------
+    durations :
+        A mapping from target name to the seconds its recipe took last time,
+        e.g. :attr:`picard.scheduler.Scheduler.durations`.
+    """
+
+    def __init__(self, durations: t.Mapping[str, float] = None) -> None:
+        self.durations = {} if durations is None else durations
+        self.steps: t.List[Target] = []
+        self._steps: t.Set[Target] = set()
+        self._rules: t.Set[Target] = set()
+
+    def __contains__(self, target: t.Any) -> bool:
+        return target in self._steps
+
+    def __len__(self) -> int:
+        return len(self.steps)
+
+    def add(self, target: Target) -> None:
+        """Add a target whose recipe would run, after the rules it needs."""
+        if target in self._steps:
+            return
+        # Walk the rules it depends on, and add each after its own rules.
+        stack = [(target, iter(self._held(target)))]
+        while stack:
+            step, children = stack[-1]
+            child = next(children, None)
+            if child is None:
+                stack.pop()
+                self._steps.add(step)
+                self.steps.append(step)
+            elif child not in self._steps:
+                stack.append((child, iter(self._held(child))))
+
+    def add_rule(self, target: Target) -> None:
+        """Hold aside a rule, whose recipe would run only if a step needs
+        it."""
+        self._rules.add(target)
+
+    def stale(self, target: Target) -> bool:
+        """Return whether any prerequisite of a target is in the plan, or is
+        a rule that depends on one."""
+        seen: t.Set[Target] = set()
+        stack = [target]
+        while stack:
+            for prereq in prerequisites(stack.pop().prereqs):
+                if prereq in self._steps:
+                    return True
+                if prereq in self._rules and prereq not in seen:
+                    seen.add(prereq)
+                    stack.append(prereq)
+        return False
+
+    def _held(self, target: Target) -> t.List[Target]:
+        return [
+            p for p in prerequisites(target.prereqs)
+            if p in self._rules and p not in self._steps
+        ]
+
+    def estimate(self, target: Target) -> t.Optional[float]:
+        """Return the seconds a recipe is expected to take, if known."""
+        return self.durations.get(str(target.name), None)
+
+    def critical_path(self) -> float:
+        """Return the estimated seconds of the longest chain of steps."""
+        lengths: t.Dict[Target, float] = {}
+        # Every step comes after the steps it depends on.
+        for target in self.steps:
+            before = max((
+                lengths[p] for p in prerequisites(target.prereqs)
+                if p in lengths
+            ), default=0)
+            lengths[target] = before + (self.estimate(target) or 0)
+        return max(lengths.values(), default=0)
+
+    def report(self) -> t.Iterator[str]:
+        """Describe each step and then the totals, one line at a time."""
+        total = 0.0
+        unknown = 0
+        for target in self.steps:
+            estimate = self.estimate(target)
+            if estimate is None:
+                unknown += 1
+                yield f'would run: {target.name}'
+            else:
+                total += estimate
+                yield f'would run: {target.name} (~{estimate:.2f}s)'
+        summary = (
+            f'{len(self.steps)} recipe(s), ~{total:.2f}s of work, '
+            f'~{self.critical_path():.2f}s on the critical path'
+        )
+        if unknown:
+            summary += f' ({unknown} without an estimate)'
+        yield summary
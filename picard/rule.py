@@ -13,7 +13,8 @@ def rule(*args, **kwargs) -> t.Callable[[Recipe], Target]:
     """Turn a recipe function into a target.
 
     The parameters are the prerequisites, which will be passed, evaluated, to
-    the recipe.
+    the recipe. To declare the resources consumed by the recipe, decorate the
+    rule with :func:`picard.resources`.
 
     Example
     -------
@@ -0,0 +1,242 @@
+"""Limit how many recipes run at once."""
+
+import asyncio
+import contextlib
+import contextvars
+import heapq
+import itertools
+import os
+import time
+import typing as t
+
+from picard import trace
+from picard.jobserver import JobServer
+from picard.output import Output
+
+Costs = t.Dict[str, float]
+T = t.TypeVar('T')
+
+_JOB: contextvars.ContextVar = contextvars.ContextVar(
+    'picard.job', default=None)
+
+# A command run by :func:`picard.shell.sh`, as it is recorded: its
+# arguments, or, if it ran in another directory or environment, a mapping
+# with its arguments (``args``), its directory (``cwd``), and the variables
+# it set, or unset with ``None`` (``env``).
+Command = t.Union[t.List[str], t.Dict[str, t.Any]]
+
+def current_job() -> t.Optional['Job']:
+    """Return the job held by the running task, if any."""
+    return _JOB.get()
+
+class Job: # pylint: disable=too-few-public-methods
+    """A slot in a :class:`Scheduler`, held for the duration of one recipe."""
+
+    def __init__(self, scheduler: 'Scheduler', target: t.Any) -> None:
+        self.scheduler = scheduler
+        self.target = target
+        self.commands: t.List[Command] = []
+        """The commands run by :func:`picard.shell.sh` under this job."""
+        self.output = Output()
+        """The output of those commands, flushed when the job finishes."""
+
+class Scheduler:
+    """A limit on concurrent jobs, handed out by priority.
+
+    Every recipe holds one job while it runs. Subprocesses started with
+    :func:`picard.shell.sh` run under the job of the recipe that started
+    them. Jobs are reentrant: a task that already holds a job, and every task
+    it spawns, runs under that job instead of waiting for another, so that
+    a recipe that evaluates other targets cannot deadlock itself.
+
+    When jobs are scarce, they go to the waiting target with the highest
+    priority, and then first-come, first-served. The time each target holds
+    its job is saved in ``durations``, from which
+    :func:`picard.graph.execute` computes priorities in the next build.
+
+    A target may also declare a mapping of ``resources`` that its recipe
+    consumes, e.g. ``{'mem_gb': 8, 'link': 1}`` (see :func:`resources`).
+    A job is only handed out while the sum of the resources held by running
+    jobs fits in every pool. The first waiting target that does not fit
+    reserves its resources, and a job: those behind it are passed over for
+    it unless they fit beside it, so that a stream of small targets cannot
+    starve a large one. A cost larger than the capacity of its pool is
+    reduced to that capacity, so that the target can at least run alone.
+    Resources without a pool are unlimited.
+
+    With a :class:`~picard.jobserver.JobServer`, each job must also take
+    a token from it, so that this process shares one limit with its parent
+    ``make`` and its children.
+
+    Parameters
+    ----------
+    jobs :
+        The maximum number of concurrent jobs. Defaults to the number of
+        CPUs.
+    durations :
+        A mapping from target name to the seconds its recipe took last time,
+        updated as jobs finish.
+    pools :
+        A mapping from resource name to its capacity.
+    jobserver :
+        A jobserver, or ``None`` for none.
+    """
+
+    def __init__(
+            self,
+            jobs: int = None,
+            durations: t.MutableMapping[str, float] = None,
+            pools: t.Mapping[str, float] = None,
+            jobserver: JobServer = None,
+    ) -> None:
+        if jobs is None:
+            jobs = os.cpu_count() or 1
+        if jobs < 1:
+            raise ValueError(f'jobs must be positive: {jobs}')
+        self.jobs = jobs
+        self.durations = {} if durations is None else durations
+        self.pools = {} if pools is None else dict(pools)
+        self.jobserver = jobserver
+        self.priorities: t.Dict[t.Any, float] = {}
+        """The priority of each target, by default zero."""
+        self._running = 0
+        self._usage = {name: 0.0 for name in self.pools}
+        # A heap of (-priority, sequence, future, costs).
+        self._waiters: t.List[t.Tuple[float, int, asyncio.Future, Costs]] = []
+        self._sequence = itertools.count()
+
+    @contextlib.asynccontextmanager
+    async def job(self, target: t.Any = None) -> t.AsyncIterator[Job]:
+        """Hold a job for the duration of a ``with`` block."""
+        held = _JOB.get()
+        if held is not None:
+            yield held
+            return
+        costs = self._costs(target)
+        with trace.span('wait', 'scheduler'):
+            await self._acquire(self.priorities.get(target, 0), costs)
+            try:
+                slot = await self._token()
+            except BaseException:
+                self._release(costs)
+                raise
+        self._count()
+        job = Job(self, target)
+        token = _JOB.set(job)
+        start = time.monotonic()
+        try:
+            yield job
+        finally:
+            if target is not None:
+                self.durations[str(target.name)] = time.monotonic() - start
+            _JOB.reset(token)
+            job.output.flush()
+            if self.jobserver is not None:
+                self.jobserver.release(slot)
+            self._release(costs)
+            self._count()
+
+    def _count(self) -> None:
+        trace.counter(
+            'jobs', running=self._running, waiting=len(self._waiters))
+        if self._usage:
+            trace.counter('resources', **self._usage)
+
+    async def _token(self) -> t.Optional[bytes]:
+        if self.jobserver is None:
+            return None
+        return await self.jobserver.acquire()
+
+    def _costs(self, target: t.Any) -> Costs:
+        """Return the costs of a target in the pools, clamped to their
+        capacities."""
+        resources = getattr(target, 'resources', None) or {}
+        return {
+            name: min(cost, self.pools[name])
+            for name, cost in resources.items() if name in self.pools
+        }
+
+    def _fits(self, costs: Costs, reserved: Costs = None) -> bool:
+        """Return whether a job with some costs fits now, beside another
+        that has reserved its own."""
+        if reserved is None:
+            return self._running < self.jobs and all(
+                self._usage[name] + cost <= self.pools[name]
+                for name, cost in costs.items()
+            )
+        return self._running + 1 < self.jobs and all(
+            self._usage[name] + cost + reserved.get(name, 0) <=
+            self.pools[name]
+            for name, cost in costs.items()
+        )
+
+    def _take(self, costs: Costs) -> None:
+        self._running += 1
+        for name, cost in costs.items():
+            self._usage[name] += cost
+
+    async def _acquire(self, priority: float, costs: Costs) -> None:
+        if not self._waiters and self._fits(costs):
+            self._take(costs)
+            return
+        waiter = asyncio.get_event_loop().create_future()
+        entry = (-priority, next(self._sequence), waiter, costs)
+        heapq.heappush(self._waiters, entry)
+        self._dispatch()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # We were handed a slot just as we were cancelled.
+                self._release(costs)
+            else:
+                with contextlib.suppress(ValueError):
+                    self._waiters.remove(entry)
+                    heapq.heapify(self._waiters)
+            raise
+
+    def _release(self, costs: Costs) -> None:
+        self._running -= 1
+        for name, cost in costs.items():
+            self._usage[name] -= cost
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Hand out jobs to waiters, in order of priority, while they fit
+        beside the first that does not."""
+        if self._running >= self.jobs:
+            return
+        passed = []
+        reserved: t.Optional[Costs] = None
+        while self._waiters and self._running < self.jobs:
+            entry = heapq.heappop(self._waiters)
+            waiter, costs = entry[2], entry[3]
+            if waiter.done():
+                continue
+            if self._fits(costs, reserved):
+                self._take(costs)
+                waiter.set_result(None)
+            else:
+                passed.append(entry)
+                if reserved is None:
+                    reserved = costs
+        for entry in passed:
+            heapq.heappush(self._waiters, entry)
+
+def resources(**costs: float) -> t.Callable[[T], T]:
+    """Declare the resources consumed by the recipe of a target.
+
+    Example
+    -------
+
+    .. code-block:: python
+
+        @picard.resources(mem_gb=8, link=1)
+        @picard.rule(objects)
+        async def program(context, objects):
+            ...
+    """
+    def decorator(target: T) -> T:
+        target.resources = costs # type: ignore
+        return target
+    return decorator
@@ -0,0 +1,189 @@
+"""A long-lived build server, and the protocol it speaks to clients.
+
+A server keeps its targets, their graphs, and its context (including the
+memo, the stat and digest caches, and the database) in memory between
+builds. It watches the sources of every graph it has built (see
+:class:`~picard.watch.Sources`), and when they change, it forgets only the
+targets downstream of them. A build in which nothing changed evaluates
+nothing.
+
+Clients (see :mod:`picard_client`) connect to a Unix socket and send one
+line of JSON, ``{"argv": [...]}``, with the same arguments as the build
+script. The server answers with frames of output, and then a frame with the
+exit status.
+"""
+
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import os
+import socket
+import typing as t
+
+from picard.argparse import parse_args
+from picard.context import Context
+from picard.graph import Graph
+from picard.typing import Target
+from picard.watch import Sources, Watcher, changes, default_watcher
+from picard_client import EXIT, HEADER, OUTPUT, SOCKET
+
+OPTIONS = (
+    'jobs', 'database', 'freshness', 'cache', 'cache-size', 'trace', 'pools',
+    'watch', 'serve', 'dry-run', 'question', 'ninja', 'snapshot',
+    'no-snapshot',
+)
+"""Options of :func:`picard.make` that are fixed when the server starts."""
+
+class _Frames(io.RawIOBase):
+    """A binary stream that writes output frames to a client."""
+
+    def __init__(self, writer: asyncio.StreamWriter) -> None:
+        super().__init__()
+        self._writer = writer
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b: t.Any) -> int:
+        data = bytes(b)
+        self._writer.write(HEADER.pack(OUTPUT, len(data)) + data)
+        return len(data)
+
+class Server:
+    """A build server.
+
+    Builds run one at a time.
+
+    Parameters
+    ----------
+    target :
+        The default targets.
+    rules :
+        The targets that may be named by clients.
+    context :
+        The context shared by every build. Its configuration is updated with
+        the overrides of each client.
+    watcher :
+        A watcher for sources.
+    """
+
+    def __init__(
+            self,
+            target: t.Any,
+            rules: t.Mapping[str, Target],
+            context: Context,
+            watcher: Watcher = None,
+    ) -> None:
+        self.target = target
+        self.rules = rules
+        self.context = context
+        self.watcher = default_watcher() if watcher is None else watcher
+        self._config = dict(context.config)
+        self._overrides: t.Dict[str, t.Any] = {}
+        self._sources: t.Dict[t.Tuple[str, ...], Sources] = {}
+        self._lock = asyncio.Lock()
+
+    async def build(self, argv: t.Sequence[str], stream: io.IOBase) -> int:
+        """Build the targets named in a command line, write the output to
+        a stream, and return an exit status."""
+        text = io.TextIOWrapper(stream, write_through=True) # type: ignore
+        handler = logging.StreamHandler(text)
+        handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+        log = self.context.log
+        log.addHandler(handler)
+        try:
+            with contextlib.redirect_stdout(text):
+                return await self._build(argv)
+        except SystemExit:
+            # Raised by ``--help``.
+            return 0
+        except Exception as error: # pylint: disable=broad-except
+            log.error(f'build failed: {error}')
+            return 1
+        finally:
+            log.removeHandler(handler)
+            text.flush()
+            self.context.database.commit()
+
+    async def _build(self, argv: t.Sequence[str]) -> int:
+        # pylint: disable=cyclic-import
+        from picard.api import COUNTS, FLAGS, lookup, sync
+        names, overrides = parse_args(argv, FLAGS, COUNTS)
+        for option in OPTIONS:
+            if overrides.pop(option, None) is not None:
+                self.context.log.warning(f'ignored by the server: {option}')
+        self.context.keep_going = bool(overrides.pop('keep-going', False))
+        if overrides != self._overrides:
+            # The configuration is part of every recipe's action. Start over.
+            self._overrides = overrides
+            self.context.config = {**self._config, **overrides}
+            self.context.memo.clear()
+            self._sources.clear()
+        targets = [self.target] if not names else [
+            lookup(n, self.rules, self.target) for n in names
+        ]
+        sources = self._sources.get(names, None)
+        if sources is None:
+            sources = Sources(Graph(targets), self.context, self.watcher)
+            self._sources[names] = sources
+        try:
+            await sync(targets, self.context)
+        finally:
+            sources.refresh()
+        return 0
+
+    async def handle(
+            self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+    ) -> None:
+        """Answer one client."""
+        try:
+            request = json.loads(await reader.readline())
+            async with self._lock:
+                status = await self.build(request['argv'], _Frames(writer))
+            payload = str(status).encode()
+            writer.write(HEADER.pack(EXIT, len(payload)) + payload)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def watch(self) -> None:
+        """Forget the targets downstream of changed sources, forever."""
+        while True:
+            changed = await changes(self.watcher)
+            async with self._lock:
+                for sources in self._sources.values():
+                    sources.invalidate(changed)
+
+async def serve(
+        target: t.Any,
+        rules: t.Mapping[str, Target],
+        context: Context,
+        path: str = SOCKET,
+) -> None:
+    """Serve builds on a Unix socket until cancelled.
+
+    Raises
+    ------
+    RuntimeError
+        If another server is already listening on the socket.
+    """
+    if os.path.exists(path):
+        with socket.socket(socket.AF_UNIX) as probe:
+            with contextlib.suppress(OSError):
+                probe.connect(path)
+                raise RuntimeError(f'a server is already listening: {path}')
+        os.remove(path)
+    server = Server(target, rules, context)
+    watching = asyncio.ensure_future(server.watch())
+    listener = await asyncio.start_unix_server(server.handle, path)
+    context.log.info(f'serving on {path}')
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        watching.cancel()
+        server.watcher.close()
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(path)
@@ -1,17 +1,160 @@
 """A shortcut for subprocesses."""
 
 import asyncio
+from asyncio.subprocess import Process
+import contextlib
+import os
+import signal
+import sys
+import typing as t
+
+from picard import trace
+from picard.output import Output
+from picard.scheduler import Command, Job, current_job
+
+CHUNK_SIZE = 1 << 16
+"""The most bytes read from a subprocess at once."""
+
+KILL_TIMEOUT = 5
+"""Seconds to wait for a terminated subprocess before killing it."""
+
+class ShellError(Exception):
+    """Raised when a command exits with a non-zero status.
+
+    Attributes
+    ----------
+    command : (str, ...)
+        The command line.
+    returncode : int
+        The exit status.
+    output : bytes
+        The output of the command, possibly with the middle omitted.
+    """
+
+    def __init__(
+            self, command: t.Sequence[str], returncode: int, output: bytes,
+    ) -> None:
+        super().__init__(
+            f'exit status {returncode}: {" ".join(command)}')
+        self.command = tuple(command)
+        self.returncode = returncode
+        self.output = output
 
 async def sh(*args, **kwargs):
     """Echo and execute a command.
 
+    The command counts against the job of the recipe that calls it, and is
+    recorded with that job, along with its ``cwd`` and the changes that its
+    ``env`` makes to the environment, if they are passed. A command run
+    outside of any recipe is not limited.
+
+    Like Ninja, the command runs in a process group of its own, with its
+    standard input from ``/dev/null``. If the calling task is cancelled,
+    e.g. because another recipe failed, or because Ctrl-C interrupted the
+    build, then the whole group is terminated, including any children that
+    the command started, e.g. under ``sh -c``. If the scheduler has a
+    :class:`~picard.jobserver.JobServer`, the command inherits it through
+    ``MAKEFLAGS``, so that a recursive ``make`` shares its limit on jobs.
+
+    Unless ``stdout`` is redirected, the command and its output (both
+    standard output and standard error) are buffered with the job, and
+    written as one block when the job finishes, so that the output of
+    concurrent jobs is never interleaved.
+
     Parameters
     ----------
     *args :
         Command line arguments. ``None``s will be removed and the rest
         passed through ``str`` before execution.
+    **kwargs :
+        Keyword arguments for :func:`asyncio.create_subprocess_exec`.
+
+    Raises
+    ------
+    ShellError
+        If the command exits with a non-zero status.
     """
     args = tuple(str(a) for a in args if a is not None)
-    print(' '.join(args))
-    p = await asyncio.create_subprocess_exec(*args, **kwargs)
-    await p.wait()
+    job = current_job()
+    output = Output() if job is None else job.output
+    output.write(' '.join(args).encode() + b'\n')
+    if job is not None:
+        job.commands.append(_command(args, kwargs))
+    piped = 'stdout' not in kwargs
+    if piped:
+        kwargs['stdout'] = asyncio.subprocess.PIPE
+        kwargs.setdefault('stderr', asyncio.subprocess.STDOUT)
+    kwargs.setdefault('stdin', asyncio.subprocess.DEVNULL)
+    if sys.version_info >= (3, 11):
+        kwargs.setdefault('process_group', 0)
+    else:
+        kwargs.setdefault('start_new_session', True)
+    jobserver = None if job is None else job.scheduler.jobserver
+    if jobserver is not None:
+        kwargs['env'] = jobserver.environ(kwargs.get('env', os.environ))
+        kwargs['pass_fds'] = (
+            *kwargs.get('pass_fds', ()), *jobserver.pass_fds)
+    name = os.path.basename(args[0])
+    with trace.span(name, 'sh', command=' '.join(args)):
+        await _run(args, kwargs, job, output)
+
+def _command(args: t.Sequence[str], kwargs: t.Mapping[str, t.Any]) -> Command:
+    """Return a command as it is recorded (see
+    :data:`picard.scheduler.Command`)."""
+    cwd = kwargs.get('cwd', None)
+    env = kwargs.get('env', None)
+    changes: t.Dict[str, t.Optional[str]] = {}
+    if env is not None:
+        changes = {
+            name: value for name, value in env.items()
+            if os.environ.get(name, None) != value
+        }
+        changes.update(
+            (name, None) for name in os.environ if name not in env)
+    if cwd is None and not changes:
+        return list(args)
+    command: t.Dict[str, t.Any] = {'args': list(args)}
+    if cwd is not None:
+        command['cwd'] = os.path.abspath(cwd)
+    if changes:
+        command['env'] = changes
+    return command
+
+async def _run(
+        args: t.Sequence[str],
+        kwargs: t.Dict[str, t.Any],
+        job: t.Optional[Job],
+        output: Output,
+) -> None:
+    piped = kwargs['stdout'] is asyncio.subprocess.PIPE
+    try:
+        p = await asyncio.create_subprocess_exec(*args, **kwargs)
+        try:
+            if piped:
+                read = t.cast(asyncio.StreamReader, p.stdout).read
+                while True:
+                    chunk = await read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    output.write(chunk)
+            returncode = await p.wait()
+        except asyncio.CancelledError:
+            await _kill(p)
+            raise
+        if returncode != 0:
+            raise ShellError(args, returncode, output.getvalue())
+    finally:
+        if job is None:
+            output.flush()
+
+async def _kill(p: Process) -> None:
+    """Terminate the process group of a subprocess, and then, if the
+    subprocess does not exit within :data:`KILL_TIMEOUT` seconds, kill it."""
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        with contextlib.suppress(ProcessLookupError):
+            os.killpg(p.pid, sig)
+        try:
+            await asyncio.wait_for(p.wait(), KILL_TIMEOUT)
+            return
+        except asyncio.TimeoutError:
+            pass
@@ -0,0 +1,421 @@
+"""Snapshots of graphs of file targets, to skip constructing them again.
+
+A build script can pass :func:`picard.make` a function that constructs its
+graph, instead of the graph itself. Then :func:`construct` saves the graph
+to a snapshot, and later builds load the snapshot instead of calling the
+function, until the build scripts change or the inputs found with
+:func:`glob` do. It keeps the filename, prerequisites, and options of every
+target, and a reference to its recipe: its identity (see
+:func:`picard.action.recipe_identity`), module, and qualified name. A recipe
+is found only when it must run: by its reference, or else by calling the
+function after all.
+
+The file is read through a memory map, and has three parts. First is a
+small :mod:`marshal` header, with what the snapshot depends on, so that an
+out-of-date snapshot is rejected without reading the rest. Then a
+:mod:`marshal` body, with the names, recipes, and options. Last are the
+edges and the recipe and flags of each target, as raw arrays that are
+copied out without decoding.
+
+The graph must be made of plain :class:`~picard.file.FileTarget`, and the
+function must depend only on the build scripts and on :func:`glob`.
+"""
+
+from array import array
+import contextlib
+import contextvars
+import glob as glob_
+import importlib
+import logging
+import marshal
+import mmap
+import os
+import struct
+import sys
+import typing as t
+
+from picard.action import recipe_identity
+from picard.file import FileTarget
+from picard.functor import fmap
+from picard.graph import Graph
+from picard.typing import Target, is_target
+
+SNAPSHOT = '.picard.graph'
+"""The default filename for the snapshot of a graph."""
+
+FORMAT = 2
+
+Constructor = t.Callable[[], t.Any]
+Glob = t.Tuple[str, bool, t.List[str]]
+
+_RESTAT = 1
+_CACHE = 2
+
+# The sizes of the header and of the record after it.
+_PREFIX = struct.Struct('<QQ')
+
+_NO_OPTIONS = ((), None, None)
+
+class SnapshotError(Exception):
+    """Raised when a graph cannot be saved to a snapshot, or a snapshot no
+    longer matches its graph."""
+
+_GLOBS: contextvars.ContextVar[t.Optional[t.List[Glob]]] = (
+    contextvars.ContextVar('picard.snapshot.globs', default=None)
+)
+
+def glob(pattern: str, recursive: bool = False) -> t.List[str]:
+    """Return the sorted filenames that match a pattern (see
+    :func:`glob.glob`).
+
+    A function that constructs a graph should find its inputs with this, so
+    that its snapshot is discarded when they change.
+    """
+    filenames = sorted(glob_.glob(pattern, recursive=recursive))
+    globs = _GLOBS.get()
+    if globs is not None:
+        globs.append((pattern, recursive, filenames))
+    return filenames
+
+def _record(constructor: Constructor) -> t.Tuple[t.Any, t.List[Glob]]:
+    """Call a constructor, and return its graph and the globs it ran."""
+    globs: t.List[Glob] = []
+    token = _GLOBS.set(globs)
+    try:
+        return constructor(), globs
+    finally:
+        _GLOBS.reset(token)
+
+def scripts(modules: t.Iterable[str] = ()) -> t.List[str]:
+    """Return the absolute filenames of the build scripts: the main script,
+    the modules beside it, and some other modules, by name."""
+    files = set()
+    main = getattr(sys.modules.get('__main__', None), '__file__', None)
+    if main is not None:
+        directory = os.path.dirname(os.path.abspath(main)) + os.sep
+        for module in list(sys.modules.values()):
+            filename = getattr(module, '__file__', None)
+            if filename is not None:
+                filename = os.path.abspath(filename)
+                if filename.startswith(directory):
+                    files.add(filename)
+    for name in modules:
+        filename = getattr(sys.modules.get(name, None), '__file__', None)
+        if filename is not None:
+            files.add(os.path.abspath(filename))
+    return sorted(files)
+
+def _stats(files: t.Iterable[str]) -> t.List[t.Any]:
+    stats: t.List[t.Any] = []
+    for filename in files:
+        try:
+            stat = os.stat(filename)
+        except FileNotFoundError:
+            stats.append((filename, None))
+        else:
+            stats.append((filename, stat.st_size, stat.st_mtime_ns))
+    return stats
+
+def _tag() -> str:
+    # The format of :mod:`marshal` may change with the interpreter, and
+    # that of the arrays with the machine.
+    return f'{FORMAT}:{sys.implementation.cache_tag}:{sys.byteorder}'
+
+def _indexer(index: t.Mapping[Target, int]) -> t.Callable[[t.Any], int]:
+    def _index(value):
+        if not is_target(value):
+            raise SnapshotError(f'not a target: {value!r}')
+        return index[value]
+    return _index
+
+def save(
+        filename: t.Union[str, os.PathLike],
+        root: t.Any,
+        globs: t.Iterable[Glob] = (),
+        modules: t.Iterable[str] = (),
+) -> None:
+    """Save a graph to a snapshot.
+
+    Parameters
+    ----------
+    filename :
+        The filename of the snapshot.
+    root :
+        An arbitrary structure of file targets, e.g. the default target.
+    globs :
+        The results of :func:`glob` that constructed the graph.
+    modules :
+        The names of more modules whose changes invalidate the snapshot,
+        e.g. that of the constructor.
+
+    Raises
+    ------
+    SnapshotError
+        If the graph has a target that is not a
+        :class:`~picard.file.FileTarget`, or ``root`` has a value that is not
+        a target.
+    OSError
+        If the snapshot cannot be written.
+    ValueError
+        If ``root`` has a container that :mod:`marshal` cannot write.
+    """
+    filename = os.fspath(filename)
+    graph = Graph(root)
+    index = graph.index
+    offsets = array('q', [0])
+    edges = array('i')
+    recipes: t.Dict[str, int] = {}
+    references: t.List[t.Tuple[str, str, str]] = []
+    recipe_of = array('i')
+    flags = bytearray(len(graph.nodes))
+    options: t.Dict[int, t.Any] = {}
+    for i, target in enumerate(graph.nodes):
+        kind = type(target)
+        if kind is not FileTarget:
+            raise SnapshotError(f'not a plain file target: {target.name}')
+        node = t.cast(FileTarget, target)
+        # Prerequisites in their order, unlike those of the graph.
+        edges.extend(index[p] for p in node.prereqs)
+        offsets.append(len(edges))
+        # pylint: disable=protected-access
+        recipe = node._recipe
+        identity = recipe_identity(recipe)
+        j = recipes.get(identity, None)
+        if j is None:
+            j = recipes[identity] = len(references)
+            references.append((
+                identity,
+                getattr(recipe, '__module__', None) or '',
+                getattr(recipe, '__qualname__', ''),
+            ))
+        recipe_of.append(j)
+        flags[i] = (
+            (_RESTAT if node.restat else 0) | (_CACHE if node.cache else 0))
+        depfile = None if node.depfile is None else os.fspath(node.depfile)
+        if node.config or depfile is not None or node.resources:
+            options[i] = (node.config, depfile, dict(node.resources))
+    modules = {*modules, *(module for _, module, _ in references)}
+    header = marshal.dumps({
+        'tag': _tag(),
+        'scripts': _stats(scripts(modules)),
+        'globs': [list(g) for g in globs],
+    })
+    body = marshal.dumps({
+        'names': [node.name for node in graph.nodes],
+        'recipes': references,
+        'options': options,
+        'root': fmap(_indexer(index), root),
+    })
+    # Replace the old snapshot at once, in case another build is reading it.
+    partial = f'{filename}.{os.getpid()}'
+    try:
+        with open(partial, 'wb') as f:
+            f.write(_PREFIX.pack(len(header), len(body)))
+            f.write(header)
+            f.write(body)
+            # Align the arrays.
+            f.write(bytes(-f.tell() % offsets.itemsize))
+            offsets.tofile(f)
+            edges.tofile(f)
+            recipe_of.tofile(f)
+            f.write(flags)
+        os.replace(partial, filename)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(partial)
+        raise
+
+def _is_current(header: t.Any) -> bool:
+    """Return whether the build scripts and globs of a snapshot are still
+    the same."""
+    if not isinstance(header, dict) or header.get('tag', None) != _tag():
+        return False
+    scripts = header['scripts']
+    if _stats(s[0] for s in scripts) != scripts:
+        return False
+    return all(
+        sorted(glob_.glob(pattern, recursive=recursive)) == filenames
+        for pattern, recursive, filenames in header['globs']
+    )
+
+def _array(typecode: str, memory: memoryview, start: int, count: int):
+    """Return an array of ``count`` items at an offset in a buffer, and
+    the offset after them."""
+    values = array(typecode)
+    end = start + count * values.itemsize
+    if end > len(memory):
+        raise EOFError('snapshot is truncated')
+    values.frombytes(memory[start:end])
+    return values, end
+
+class _Recipes:
+    """The recipes of a graph, found only when one must run."""
+
+    def __init__(self, constructor: Constructor) -> None:
+        self.constructor = constructor
+        self._recipes: t.Optional[t.Dict[str, t.Callable]] = None
+
+    def find(self, name: str, reference: '_Recipe') -> t.Callable:
+        """Return the recipe of a target, by its reference or else by
+        constructing the graph.
+
+        Raises
+        ------
+        SnapshotError
+            If the recipe is not the one in the snapshot.
+        """
+        identity = recipe_identity(reference)
+        recipe: t.Any = None
+        if reference.qualname and '<' not in reference.qualname:
+            try:
+                recipe = importlib.import_module(reference.module)
+                for attribute in reference.qualname.split('.'):
+                    recipe = getattr(recipe, attribute)
+            except (ImportError, AttributeError):
+                recipe = None
+        if recipe is None or recipe_identity(recipe) != identity:
+            if self._recipes is None:
+                graph = Graph(self.constructor())
+                self._recipes = {
+                    # pylint: disable=protected-access
+                    node.name: node._recipe for node in graph.nodes
+                    if isinstance(node, FileTarget)
+                }
+            recipe = self._recipes.get(name, None)
+        if recipe is None or recipe_identity(recipe) != identity:
+            raise SnapshotError(
+                f'the recipe of {name} is not the one in the snapshot')
+        return recipe
+
+class _Recipe: # pylint: disable=too-few-public-methods
+    """A recipe in a snapshot. It is found when it is first called, but its
+    identity is known before then."""
+
+    __slots__ = ('_identity_', 'module', 'qualname', '_recipes')
+
+    def __init__(
+            self, identity: str, module: str, qualname: str,
+            recipes: _Recipes,
+    ) -> None:
+        self._identity_ = identity
+        self.module = module
+        self.qualname = qualname
+        self._recipes = recipes
+
+    def __call__(self, target: Target, *args: t.Any) -> t.Awaitable:
+        return self._recipes.find(target.name, self)(target, *args)
+
+    def __repr__(self) -> str:
+        return f'{self.module}.{self.qualname}'
+
+def load(
+        filename: t.Union[str, os.PathLike], constructor: Constructor,
+) -> t.Optional[t.Any]:
+    """Load a graph from a snapshot.
+
+    Parameters
+    ----------
+    filename :
+        The filename of the snapshot.
+    constructor :
+        The function that constructed the graph. It is called only if a
+        recipe must run and cannot be found by its reference.
+
+    Returns
+    -------
+    Any
+        The structure of targets passed to :func:`save`, or ``None`` if
+        there is no snapshot or it is out-of-date.
+    """
+    # Not a file descriptor, which :func:`open` would also take.
+    filename = os.fspath(filename)
+    try:
+        with open(filename, 'rb') as f:
+            view = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    with view, memoryview(view) as memory:
+        try:
+            return _load(memory, constructor)
+        except (struct.error, ValueError, EOFError, TypeError, KeyError):
+            return None
+
+def _load(memory: memoryview, constructor: Constructor) -> t.Optional[t.Any]:
+    header_size, body_size = _PREFIX.unpack_from(memory)
+    start = _PREFIX.size
+    if not _is_current(marshal.loads(memory[start:start + header_size])):
+        return None
+    start += header_size
+    body = marshal.loads(memory[start:start + body_size])
+    start += body_size
+    names = body['names']
+    count = len(names)
+    offsets, start = _array('q', memory, start + -start % 8, count + 1)
+    edges, start = _array('i', memory, start, offsets[count])
+    recipe_of, start = _array('i', memory, start, count)
+    flags, _ = _array('B', memory, start, count)
+
+    recipes = _Recipes(constructor)
+    references = [
+        _Recipe(identity, module, qualname, recipes)
+        for identity, module, qualname in body['recipes']
+    ]
+    options = body['options']
+    # The prerequisites are in canonical form already, so skip the
+    # constructor, which would canonicalize each again.
+    make = FileTarget._make # pylint: disable=protected-access
+    nodes: t.List[FileTarget] = []
+    append = nodes.append
+    node = nodes.__getitem__
+    for i, name in enumerate(names):
+        config, depfile, resources = options.get(i, _NO_OPTIONS)
+        flag = flags[i]
+        append(make(
+            name,
+            references[recipe_of[i]],
+            tuple(map(node, edges[offsets[i]:offsets[i + 1]])),
+            config,
+            bool(flag & _RESTAT),
+            depfile,
+            bool(flag & _CACHE),
+            resources,
+        ))
+    return fmap(node, body['root'])
+
+def construct(
+        constructor: Constructor,
+        filename: t.Union[None, str, os.PathLike] = SNAPSHOT,
+        log: logging.Logger = None,
+) -> t.Any:
+    """Return the graph of a constructor, from its snapshot if it is
+    current, or else by calling it and saving a new snapshot.
+
+    Parameters
+    ----------
+    constructor :
+        A function that takes no arguments and returns a structure of file
+        targets.
+    filename :
+        The filename of the snapshot, or ``None`` to just call the
+        constructor.
+    log :
+        A logger for whether the snapshot was used.
+    """
+    if filename is None:
+        return constructor()
+    filename = os.fspath(filename)
+    if log is None:
+        log = logging.getLogger(__name__)
+    root = load(filename, constructor)
+    if root is not None:
+        log.info(f'loaded the graph from {filename}')
+        return root
+    root, globs = _record(constructor)
+    module = getattr(constructor, '__module__', None)
+    try:
+        save(filename, root, globs, () if module is None else (module,))
+    except SnapshotError as error:
+        log.info(f'cannot save the graph to {filename}: {error}')
+    except (OSError, ValueError) as error:
+        log.warning(f'cannot save the graph to {filename}: {error}')
+    return root
@@ -0,0 +1,87 @@
+"""A per-build cache of file status."""
+
+import asyncio
+import os
+import typing as t
+
+Status = t.Optional[os.stat_result]
+
+def _stat_all(paths: t.Sequence[str]) -> t.List[t.Any]:
+    results: t.List[t.Any] = []
+    for path in paths:
+        try:
+            results.append(os.stat(path))
+        except FileNotFoundError:
+            results.append(None)
+        except OSError as error:
+            results.append(error)
+    return results
+
+class StatCache:
+    """Cached calls to :func:`os.stat`, batched to a thread pool.
+
+    Every path is stat'ed at most once until it is invalidated. Misses
+    requested in the same iteration of the event loop are stat'ed together in
+    one call to the loop's default executor, so the loop never blocks on the
+    filesystem.
+    """
+
+    def __init__(self) -> None:
+        self._cache: t.Dict[str, asyncio.Future] = {}
+        self._pending: t.List[t.Tuple[str, asyncio.Future]] = []
+
+    async def stat(self, path: t.Union[str, os.PathLike]) -> Status:
+        """Return the status of a file, or ``None`` if it does not exist."""
+        status, = await self.stat_all((path,))
+        return status
+
+    async def stat_all(
+            self, paths: t.Iterable[t.Union[str, os.PathLike]]
+    ) -> t.List[Status]:
+        """Return the status of each file, or ``None`` for those missing."""
+        futures = [self._future(os.fspath(p)) for p in paths]
+        return await asyncio.shield(asyncio.gather(*futures))
+
+    def invalidate(self, path: t.Union[str, os.PathLike]) -> None:
+        """Forget the status of a file, e.g. after a recipe writes it."""
+        self._cache.pop(os.fspath(path), None)
+
+    def _future(self, path: str) -> asyncio.Future:
+        future = self._cache.get(path, None)
+        if future is None:
+            loop = asyncio.get_event_loop()
+            future = loop.create_future()
+            self._cache[path] = future
+            if not self._pending:
+                loop.call_soon(self._flush)
+            self._pending.append((path, future))
+        return future
+
+    def _flush(self) -> None:
+        batch, self._pending = self._pending, []
+        loop = asyncio.get_event_loop()
+        paths = [path for path, _ in batch]
+        def resolve(results: asyncio.Future) -> None:
+            if results.cancelled():
+                for path, future in batch:
+                    self._forget(path, future)
+                    future.cancel()
+                return
+            if results.exception() is not None:
+                outcomes = [results.exception()] * len(batch)
+            else:
+                outcomes = results.result()
+            for (path, future), outcome in zip(batch, outcomes):
+                if future.done():
+                    continue
+                if isinstance(outcome, BaseException):
+                    # Do not cache failures.
+                    self._forget(path, future)
+                    future.set_exception(outcome)
+                else:
+                    future.set_result(outcome)
+        loop.run_in_executor(None, _stat_all, paths).add_done_callback(resolve)
+
+    def _forget(self, path: str, future: asyncio.Future) -> None:
+        if self._cache.get(path, None) is future:
+            del self._cache[path]
@@ -0,0 +1,109 @@
+"""Profiles of builds in the Chrome trace-event format.
+
+Load them in Perfetto_ or ``chrome://tracing``.
+
+.. _Perfetto: https://ui.perfetto.dev
+"""
+
+import contextlib
+import contextvars
+import heapq
+import json
+import os
+import time
+import typing as t
+
+# The tracer and lane of the target being evaluated by the running task.
+_LANE: contextvars.ContextVar = contextvars.ContextVar(
+    'picard.trace.lane', default=None)
+
+class Tracer:
+    """A recorder of trace events.
+
+    Each target is drawn as a span on a "lane" (a thread, as far as the
+    trace viewer knows). Spans for the steps within a target, e.g. its
+    up-to-date check and its subprocesses, are nested within it on the same
+    lane. Concurrently evaluated targets get distinct lanes, reused as they
+    finish, so the number of lanes in use is the concurrency over time.
+    """
+
+    def __init__(self) -> None:
+        self.events: t.List[t.Dict[str, t.Any]] = []
+        self._origin = time.perf_counter()
+        self._free: t.List[int] = []
+        self._lanes = 0
+
+    def now(self) -> float:
+        """Return the time, in microseconds, since the tracer was created."""
+        return (time.perf_counter() - self._origin) * 1e6
+
+    def _acquire_lane(self) -> int:
+        if self._free:
+            return heapq.heappop(self._free)
+        self._lanes += 1
+        self.events.append({
+            'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(),
+            'tid': self._lanes, 'args': {'name': f'lane {self._lanes}'},
+        })
+        return self._lanes
+
+    def _release_lane(self, lane: int) -> None:
+        heapq.heappush(self._free, lane)
+
+    def complete(
+            self, name: str, category: str, lane: int, start: float,
+            **args: t.Any,
+    ) -> None:
+        """Record a span that started at ``start`` and ends now."""
+        self.events.append({
+            'name': name, 'cat': category, 'ph': 'X', 'pid': os.getpid(),
+            'tid': lane, 'ts': start, 'dur': self.now() - start, 'args': args,
+        })
+
+    def counter(self, name: str, **values: float) -> None:
+        """Record the values of a counter at this time."""
+        self.events.append({
+            'name': name, 'ph': 'C', 'pid': os.getpid(), 'ts': self.now(),
+            'args': values,
+        })
+
+    def write(self, filename: t.Union[str, os.PathLike]) -> None:
+        """Write the events as a JSON trace file."""
+        with open(filename, 'w') as f:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, f)
+
+@contextlib.contextmanager
+def target(tracer: t.Optional[Tracer], name: str) -> t.Iterator[None]:
+    """Draw a span for the evaluation of a target on a lane of its own."""
+    if tracer is None:
+        yield
+        return
+    lane = tracer._acquire_lane() # pylint: disable=protected-access
+    token = _LANE.set((tracer, lane))
+    start = tracer.now()
+    try:
+        yield
+    finally:
+        tracer.complete(name, 'target', lane, start)
+        _LANE.reset(token)
+        tracer._release_lane(lane) # pylint: disable=protected-access
+
+@contextlib.contextmanager
+def span(name: str, category: str, **args: t.Any) -> t.Iterator[None]:
+    """Draw a span nested within the span of the current target, if any."""
+    current = _LANE.get()
+    if current is None:
+        yield
+        return
+    tracer, lane = current
+    start = tracer.now()
+    try:
+        yield
+    finally:
+        tracer.complete(name, category, lane, start, **args)
+
+def counter(name: str, **values: float) -> None:
+    """Record a counter, if the current target is being traced."""
+    current = _LANE.get()
+    if current is not None:
+        current[0].counter(name, **values)
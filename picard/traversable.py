@@ -0,0 +1,161 @@
+"""A structure of values, flattened once to be mapped many times."""
+
+import asyncio
+import typing as t
+
+from picard import _layout
+from picard.afunctor import afmap
+from picard.functor import fmap
+from picard.typing import Target, is_target
+
+# Shared by every structure without nested leaves.
+_NONE: t.Sequence[int] = ()
+
+def _leaf(value, kind, stack, leaves, program):
+    # pylint: disable=unused-argument
+    leaves.append(value)
+    program.append(_layout.LEAF)
+
+def _nested(leaves: t.List[t.Any]) -> t.Optional[t.Sequence[int]]:
+    """Return the positions of the nested leaves, or ``None`` if any leaf is
+    a collection.
+
+    A plain leaf is passed to a function as-is. A nested leaf is some other
+    functor, e.g. a string, and is passed to :func:`~picard.functor.fmap` or
+    :func:`~picard.afunctor.afmap`.
+    """
+    kinds = _layout.KINDS
+    nested: t.List[int] = []
+    for i, leaf in enumerate(leaves):
+        kind = type(leaf)
+        answer = kinds.get(kind, None) or _layout.kind_of(kind)
+        if answer is _layout.PLAIN:
+            continue
+        if answer is _layout.CONTAINER or answer is _layout.MAPPING:
+            return None
+        nested.append(i)
+    return nested or _NONE
+
+_UNBUILT = object()
+
+class Traversable:
+    """A structure of values, e.g. the prerequisites of a target, that has
+    been taken apart once, so that it can be mapped many times without
+    looking at its containers again.
+
+    The leaves are kept in one flat list, in the order of a depth-first
+    walk, and :meth:`_fmap_` and :meth:`_afmap_` map over just that list.
+    The result is another :class:`Traversable` with the same layout.
+    Strings, iterators, and other functors are leaves here, but they are
+    mapped by :func:`~picard.functor.fmap` and
+    :func:`~picard.afunctor.afmap`, so every map has the same value as it
+    would on the original structure. Like those, it assumes that the
+    structure is not changed after it is taken apart.
+
+    Parameters
+    ----------
+    structure :
+        An arbitrary structure of nested collections.
+
+    Example
+    -------
+
+    >>> from picard.functor import fmap
+    >>> xs = Traversable(([1, 2], {'a': 3}))
+    >>> list(xs)
+    [1, 2, 3]
+    >>> fmap(lambda x: x * 10, xs).structure
+    ([10, 20], {'a': 30})
+    """
+
+    __slots__ = ('leaves', '_nested', '_program', '_targets', '_structure')
+
+    def __init__(self, structure: t.Any) -> None:
+        self.leaves, self._program = _layout.flatten(structure, _leaf)
+        self._nested = _nested(self.leaves) or _NONE
+        self._targets: t.Optional[t.List[Target]] = None
+        # Rebuilt only if it is asked for.
+        self._structure: t.Any = _UNBUILT
+
+    @classmethod
+    def _with_leaves(
+            cls, original: 'Traversable', leaves: t.List[t.Any],
+    ) -> 'Traversable':
+        """Return a structure with the layout of another and new leaves."""
+        # pylint: disable=protected-access
+        nested = _nested(leaves)
+        if nested is None:
+            # A leaf became a collection. Take it apart too.
+            return cls(_layout.rebuild(original._program, leaves))
+        traversable = cls.__new__(cls)
+        traversable.leaves = leaves
+        traversable._nested = nested
+        traversable._program = original._program
+        traversable._targets = None
+        traversable._structure = _UNBUILT
+        return traversable
+
+    @property
+    def structure(self) -> t.Any:
+        """The structure, rebuilt (only once) from the leaves."""
+        if self._structure is _UNBUILT:
+            self._structure = _layout.rebuild(self._program, self.leaves)
+        return self._structure
+
+    @property
+    def targets(self) -> t.List[Target]:
+        """The targets buried in the structure (see
+        :func:`picard.graph.prerequisites`), found only once."""
+        if self._targets is None:
+            # pylint: disable=cyclic-import
+            from picard.graph import prerequisites
+            targets: t.List[Target] = []
+            nested = set(self._nested)
+            for i, leaf in enumerate(self.leaves):
+                if i in nested:
+                    targets.extend(prerequisites(leaf))
+                elif is_target(leaf):
+                    targets.append(leaf)
+            self._targets = targets
+        return self._targets
+
+    def __iter__(self) -> t.Iterator[t.Any]:
+        """Iterate the leaves."""
+        return iter(self.leaves)
+
+    def __len__(self) -> int:
+        return len(self.leaves)
+
+    def __eq__(self, other: t.Any) -> bool:
+        if not isinstance(other, Traversable):
+            return NotImplemented
+        return self.structure == other.structure
+
+    __hash__ = None # type: ignore
+
+    def __repr__(self) -> str:
+        return f'Traversable({self.structure!r})'
+
+    def _map(self, function: t.Callable, nested: t.Callable) -> t.List:
+        """Apply a function to each plain leaf, and ``nested(function,
+        leaf)`` to each nested leaf."""
+        if not self._nested:
+            return [function(leaf) for leaf in self.leaves]
+        positions = set(self._nested)
+        return [
+            nested(function, leaf) if i in positions else function(leaf)
+            for i, leaf in enumerate(self.leaves)
+        ]
+
+    def _fmap_(self, function: t.Callable) -> 'Traversable':
+        return Traversable._with_leaves(self, self._map(function, fmap))
+
+    async def _afmap_(self, function: t.Callable) -> 'Traversable':
+        awaitables = self._map(function, afmap)
+        if not awaitables:
+            leaves: t.List[t.Any] = []
+        elif len(awaitables) == 1:
+            leaves = [await awaitables[0]]
+        else:
+            leaves = list(await asyncio.gather(*awaitables))
+        return Traversable._with_leaves(self, leaves)
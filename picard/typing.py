@@ -22,8 +22,26 @@ class Target(tex.Protocol):
 
     .. protocol_: https://www.python.org/dev/peps/pep-0544/
     """
+    # Let implementations have slots.
+    __slots__ = ()
+
     name: str
     prereqs: Prerequisites
     async def recipe(self, context: Context) -> t.Any:
         # pylint: disable=unused-argument,pointless-statement
         ...
+
+# The types of values found to be targets, by their ``id``, because the
+# metaclass of a protocol compares them slowly. Checking the protocol is
+# slow too, so it is checked only until one instance of a type passes.
+_TARGET_TYPES: t.Dict[int, type] = {}
+
+def is_target(value: t.Any) -> bool:
+    """Return whether a value is a :class:`Target`."""
+    kind = type(value)
+    if _TARGET_TYPES.get(id(kind), None) is kind:
+        return True
+    if isinstance(value, Target):
+        _TARGET_TYPES[id(kind)] = kind
+        return True
+    return False
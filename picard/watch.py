@@ -0,0 +1,277 @@
+"""Rebuild targets whenever their source files change."""
+
+import asyncio
+import collections
+import ctypes
+import ctypes.util
+import os
+import struct
+import typing as t
+
+import typing_extensions as tex
+
+from picard.context import Context
+from picard.graph import Graph
+
+IN_ATTRIB = 0x004
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_MASK = (
+    IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE |
+    IN_DELETE
+)
+_EVENT = struct.Struct('iIII')
+
+DEBOUNCE = 0.1
+"""Seconds without events after which a burst of them is over."""
+
+@tex.runtime
+class Watcher(tex.Protocol):
+    """A protocol for watchers of files."""
+    # pylint: disable=unused-argument,pointless-statement,no-self-use
+
+    def add(self, path: str) -> None:
+        """Watch an absolute path."""
+        ...
+
+    async def changes(self) -> t.Set[str]:
+        """Wait for, and return, the watched paths that changed."""
+        ...
+
+    def close(self) -> None:
+        ...
+
+class InotifyWatcher(Watcher):
+    """A watcher using Linux inotify.
+
+    Directories are watched, instead of files, so that files replaced by
+    renaming (as many editors save) are still watched.
+    """
+
+    def __init__(self) -> None:
+        self._libc = ctypes.CDLL(
+            ctypes.util.find_library('c'), use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1')
+        self._paths: t.Set[str] = set()
+        self._directories: t.Dict[int, str] = {}
+        self._watched: t.Set[str] = set()
+        self._changed: t.Set[str] = set()
+        self._event = asyncio.Event()
+        asyncio.get_event_loop().add_reader(self.fd, self._read)
+
+    def add(self, path: str) -> None:
+        self._paths.add(path)
+        directory = os.path.dirname(path)
+        if directory in self._watched:
+            return
+        wd = self._libc.inotify_add_watch(
+            self.fd, os.fsencode(directory), _MASK)
+        if wd < 0:
+            # The directory may not exist yet.
+            return
+        self._watched.add(directory)
+        self._directories[wd] = directory
+
+    async def changes(self) -> t.Set[str]:
+        await self._event.wait()
+        self._event.clear()
+        changed, self._changed = self._changed, set()
+        return changed
+
+    def close(self) -> None:
+        asyncio.get_event_loop().remove_reader(self.fd)
+        os.close(self.fd)
+
+    def _read(self) -> None:
+        try:
+            buffer = os.read(self.fd, 1 << 16)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(buffer):
+            wd, _, _, length = _EVENT.unpack_from(buffer, offset)
+            offset += _EVENT.size
+            name = buffer[offset:offset + length].rstrip(b'\0')
+            offset += length
+            directory = self._directories.get(wd, None)
+            if directory is None:
+                continue
+            path = os.path.join(directory, os.fsdecode(name))
+            if path in self._paths:
+                self._changed.add(path)
+        if self._changed:
+            self._event.set()
+
+class PollingWatcher(Watcher):
+    """A watcher that compares the status of every file periodically.
+
+    Parameters
+    ----------
+    interval :
+        Seconds between polls.
+    """
+
+    def __init__(self, interval: float = 1) -> None:
+        self.interval = interval
+        self._statuses: t.Dict[str, t.Any] = {}
+
+    def add(self, path: str) -> None:
+        if path not in self._statuses:
+            self._statuses[path] = _status(path)
+
+    async def changes(self) -> t.Set[str]:
+        loop = asyncio.get_event_loop()
+        while True:
+            await asyncio.sleep(self.interval)
+            paths = list(self._statuses)
+            statuses = await loop.run_in_executor(
+                None, lambda: [_status(p) for p in paths])
+            changed = {
+                path for path, status in zip(paths, statuses)
+                if self._statuses[path] != status
+            }
+            self._statuses.update(zip(paths, statuses))
+            if changed:
+                return changed
+
+    def close(self) -> None:
+        pass
+
+def _status(path: str) -> t.Any:
+    try:
+        status = os.stat(path)
+    except OSError:
+        return None
+    return (status.st_mtime_ns, status.st_size, status.st_ino)
+
+def default_watcher() -> Watcher:
+    """Return an inotify watcher if possible, or else a polling watcher."""
+    try:
+        return InotifyWatcher()
+    except (AttributeError, OSError):
+        return PollingWatcher()
+
+class Sources:
+    """The source files of a graph, and the nodes that read each.
+
+    Sources are files without prerequisites, and prerequisites discovered
+    through depfiles. Outputs of recipes are not watched.
+
+    Parameters
+    ----------
+    graph :
+        A graph.
+    context :
+        The context in which the graph is evaluated.
+    watcher :
+        A watcher to which to add the sources as they are found.
+    """
+
+    def __init__(
+            self, graph: Graph, context: Context, watcher: Watcher,
+    ) -> None:
+        self.graph = graph
+        self.context = context
+        self.watcher = watcher
+        # Absolute path to the names by which the file is known, and to the
+        # nodes that read it.
+        self._names: t.Dict[str, t.Set[str]] = collections.defaultdict(set)
+        self._readers: t.Dict[str, t.Set[int]] = collections.defaultdict(set)
+        # The nodes evaluated since the last refresh.
+        self._dirty: t.Set[int] = set(range(len(graph)))
+
+    def refresh(self) -> None:
+        """After a build, forget the nodes that failed, so that they are
+        tried again, and watch the sources of the nodes evaluated."""
+        deps = self.context.database.table('deps')
+        memo = self.context.memo
+        for i in self._dirty:
+            target = self.graph.nodes[i]
+            future = memo.get(target, None)
+            if future is not None and future.done() and (
+                    future.cancelled() or future.exception() is not None):
+                del memo[target]
+            names = list(deps.get(str(target.name), ()))
+            if not self.graph.prereqs[i] and hasattr(target, 'path'):
+                # A file without prerequisites is a source.
+                names.append(os.fspath(target.path))
+            for name in names:
+                path = os.path.abspath(name)
+                if path not in self._names:
+                    self.watcher.add(path)
+                self._names[path].add(name)
+                self._readers[path].add(i)
+        self._dirty.clear()
+
+    def invalidate(self, paths: t.Iterable[str]) -> t.Set[int]:
+        """Forget what is known about changed files and everything
+        downstream of them, and return the nodes forgotten."""
+        stack: t.List[int] = []
+        for path in paths:
+            for name in self._names.get(path, ()):
+                self.context.stats.invalidate(name)
+            stack.extend(self._readers.get(path, ()))
+        affected: t.Set[int] = set()
+        while stack:
+            i = stack.pop()
+            if i in affected:
+                continue
+            affected.add(i)
+            stack.extend(self.graph.dependents[i])
+        for i in affected:
+            target = self.graph.nodes[i]
+            self.context.memo.pop(target, None)
+            if hasattr(target, 'path'):
+                self.context.stats.invalidate(target.path)
+        self._dirty |= affected
+        return affected
+
+async def changes(watcher: Watcher, debounce: float = DEBOUNCE) -> t.Set[str]:
+    """Wait for a burst of changes, and return the paths changed."""
+    changed = await watcher.changes()
+    while True:
+        try:
+            changed |= await asyncio.wait_for(watcher.changes(), debounce)
+        except asyncio.TimeoutError:
+            return changed
+
+async def watch(
+        target: t.Any,
+        context: Context,
+        watcher: Watcher = None,
+        debounce: float = DEBOUNCE,
+) -> None:
+    """Build targets, and then rebuild them whenever their
+    :class:`sources <Sources>` change.
+
+    The graph and the context, including its memo, are kept between builds.
+    When sources change, only the targets downstream of them are forgotten,
+    and only they are evaluated again, so that the work of a rebuild is
+    proportional to the size of the change. Events are coalesced until none
+    arrive for ``debounce`` seconds.
+
+    This coroutine runs until it is cancelled.
+    """
+    from picard.api import sync # pylint: disable=cyclic-import
+    if watcher is None:
+        watcher = default_watcher()
+    sources = Sources(Graph(target), context, watcher)
+    try:
+        while True:
+            try:
+                await sync(target, context)
+            except Exception as error: # pylint: disable=broad-except
+                context.log.error(f'build failed: {error}')
+            context.database.commit()
+            sources.refresh()
+            context.log.info('watching for changes')
+            sources.invalidate(await changes(watcher, debounce))
+    finally:
+        watcher.close()
@@ -0,0 +1,64 @@
+"""A thin client for a build server.
+
+Run ``python -m picard_client [options] [targets]`` in the directory of
+a build server started with ``python make.py --serve``. The arguments are
+the same as those of the build script. The client is a module of its own,
+outside of the :mod:`picard` package, and imports only the standard
+library, so that it starts as fast as Python itself.
+"""
+
+import json
+import os
+import socket
+import struct
+import sys
+import typing as t
+
+SOCKET = '.picard.sock'
+"""The default path of the socket of a build server."""
+
+HEADER = struct.Struct('>cI')
+"""The header of each frame sent by a server: a kind and a length."""
+
+OUTPUT = b'o'
+"""The kind of frame that carries output."""
+
+EXIT = b'x'
+"""The kind of frame that carries the exit status, and ends a response."""
+
+def main(argv: t.Sequence[str] = None, path: str = None) -> int:
+    """Send a command line to a build server, copy its output to standard
+    output, and return its exit status.
+
+    Parameters
+    ----------
+    argv :
+        A command line, like :obj:`sys.argv`. Defaults to this process's.
+    path :
+        The path of the server's socket. Defaults to ``PICARD_SOCKET`` in the
+        environment, or else :data:`SOCKET`.
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+    if path is None:
+        path = os.environ.get('PICARD_SOCKET', SOCKET)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(path)
+        request = {'argv': list(argv)}
+        connection.sendall(json.dumps(request).encode() + b'\n')
+        stream = connection.makefile('rb')
+        out = sys.stdout.buffer
+        while True:
+            header = stream.read(HEADER.size)
+            if len(header) < HEADER.size:
+                raise ConnectionError('server closed the connection')
+            kind, length = HEADER.unpack(header)
+            payload = stream.read(length)
+            if kind == EXIT:
+                out.flush()
+                return int(payload)
+            out.write(payload)
+            out.flush()
+
+if __name__ == '__main__':
+    sys.exit(main())
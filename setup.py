@@ -8,6 +8,7 @@ setup(
     name='picard',
     version='0.1.3',
     packages=['picard'],
+    py_modules=['picard_client'],
     install_requires=[
         'boto3>=1.9,<1.10',
         'tabulate>=0.8,<0.9',
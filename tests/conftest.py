@@ -0,0 +1,36 @@
+"""Fixtures shared by the tests."""
+
+import asyncio
+import os
+
+import pytest # type: ignore
+
+import picard
+
+def _set_mtime(path, seconds):
+    os.utime(path, ns=(seconds * 10**9, seconds * 10**9))
+
+@pytest.fixture
+def set_mtime():
+    """Return a function that sets the modification time of a file, in
+    whole seconds."""
+    return _set_mtime
+
+def _counting_rules(n):
+    # pylint: disable=unused-argument
+    state = {'running': 0, 'peak': 0}
+    async def recipe(context):
+        state['running'] += 1
+        state['peak'] = max(state['peak'], state['running'])
+        await asyncio.sleep(0.01)
+        state['running'] -= 1
+    rules = []
+    for _ in range(n):
+        rules.append(picard.rule()(recipe))
+    return rules, state
+
+@pytest.fixture
+def counting_rules():
+    """Return a function that returns ``n`` rules and a state that records
+    the peak number of them running at once."""
+    return _counting_rules
@@ -0,0 +1,57 @@
+"""Tests for the keys that identify actions."""
+
+import os
+import subprocess
+import sys
+
+from picard.action import recipe_identity
+
+# pylint: disable=unused-argument
+
+SCRIPT = """
+from picard.action import recipe_identity
+
+def outer(flags):
+    async def recipe(self, context, mode=('a', 'b'), *, level=2):
+        if context in {'x', 'y', 'z'}:
+            return flags
+        return frozenset({'p', 'q', 'r'}), (lambda: {1.5, 'w'})
+    return recipe
+
+print(recipe_identity(outer(frozenset({'-O2', '-g', '-Wall'}))))
+"""
+
+def test_identity_is_the_same_in_every_process():
+    """Sets of constants are digested whatever their iteration order."""
+    identities = set()
+    for seed in range(1, 5):
+        env = {**os.environ, 'PYTHONHASHSEED': str(seed)}
+        identities.add(subprocess.run(
+            [sys.executable, '-c', SCRIPT], env=env, check=True,
+            stdout=subprocess.PIPE, universal_newlines=True,
+        ).stdout)
+    assert len(identities) == 1
+
+def _recipe(flags, level=1):
+    async def recipe(self, context, mode='fast'):
+        return flags, level, mode
+    return recipe
+
+def test_identity_covers_defaults_and_captured_values():
+    """The identity changes with default arguments and captured values."""
+    identity = recipe_identity(_recipe('-O2'))
+    assert recipe_identity(_recipe('-O2')) == identity
+    assert recipe_identity(_recipe('-O3')) != identity
+    assert recipe_identity(_recipe('-O2', level=2)) != identity
+    recipe = _recipe('-O2')
+    recipe.__defaults__ = ('slow',)
+    assert recipe_identity(recipe) != identity
+
+def test_captured_state_does_not_change_identity():
+    """A recipe that logs to a list it captures keeps its identity."""
+    calls = []
+    async def recipe(self, context):
+        calls.append(self)
+    identity = recipe_identity(recipe)
+    calls.append(None)
+    assert recipe_identity(recipe) == identity
@@ -1,6 +1,8 @@
 """Test recursive asynchronous fmap."""
 
+import gc
 import typing as t
+import warnings
 
 import pytest # type: ignore
 
@@ -49,3 +51,38 @@ async def test_dict_of_list():
 async def test_args_and_kwargs():
     actual = await afmap(times2, ((1, 2), {'xs': [3, 4]}))
     assert actual == ((2, 4), {'xs': [6, 8]})
+
+@pytest.mark.asyncio
+async def test_afmap_iterator():
+    assert [x async for x in await afmap(times2, iter([1, 2]))] == [2, 4]
+
+@pytest.mark.asyncio
+async def test_afmap_empty():
+    assert await afmap(times2, ([], {}, '')) == ([], {}, '')
+
+@pytest.mark.asyncio
+async def test_afmap_deeply_nested():
+    """Nesting deeper than the recursion limit is mapped."""
+    functor: t.Any = 1
+    for _ in range(5000):
+        functor = [functor, 1]
+    actual = await afmap(times2, functor)
+    for _ in range(5000):
+        assert actual[1] == 2
+        actual = actual[0]
+    assert actual == 2
+
+class _Broken:
+    """A functor whose fmap fails before it returns a coroutine."""
+    def _afmap_(self, function):
+        raise ValueError('broken')
+
+@pytest.mark.asyncio
+async def test_failed_leaf_leaves_no_coroutine_unawaited():
+    """Leaves before one that fails are closed, not left unawaited."""
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        with pytest.raises(ValueError):
+            await afmap(times2, [1, 2, _Broken(), 3])
+        gc.collect()
+    assert not [w for w in caught if w.category is RuntimeWarning]
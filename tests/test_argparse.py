@@ -0,0 +1,54 @@
+"""Tests for parsing the command line of :func:`picard.make`."""
+
+import os
+import subprocess
+import sys
+
+import pytest # type: ignore
+
+from picard.api import COUNTS, FLAGS
+from picard.argparse import parse_args
+
+@pytest.mark.parametrize('flag', sorted(FLAGS))
+def test_flag_leaves_target_alone(flag):
+    assert parse_args([f'--{flag}', 'hello'], FLAGS, COUNTS) == (
+        ('hello',), {flag: True})
+
+def test_count_takes_only_a_number():
+    """A count option takes the next argument only if it is a number."""
+    assert parse_args(['--jobs', 'hello'], FLAGS, COUNTS) == (
+        ('hello',), {'jobs': True})
+    assert parse_args(['--jobs', '4', 'hello'], FLAGS, COUNTS) == (
+        ('hello',), {'jobs': '4'})
+    assert parse_args(['hello', '--jobs'], FLAGS, COUNTS) == (
+        ('hello',), {'jobs': True})
+
+SCRIPT = """
+import picard
+
+@picard.rule()
+async def greet(context):
+    print('hello')
+
+@picard.rule()
+async def default(context):
+    print('default')
+
+def main():
+    picard.make(default, rules=None)
+
+main()
+"""
+
+def test_targets_are_found_in_module_of_caller(tmp_path):
+    """Targets named on the command line are found in the script that calls
+    make."""
+    script = tmp_path / 'make.py'
+    script.write_text(SCRIPT)
+    output = subprocess.run(
+        [sys.executable, str(script), '--no-snapshot', 'greet'],
+        cwd=tmp_path, check=True, stdout=subprocess.PIPE,
+        env={**os.environ, 'PYTHONPATH': os.pathsep.join(sys.path)},
+        universal_newlines=True,
+    ).stdout
+    assert output.splitlines() == ['hello']
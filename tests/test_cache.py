@@ -0,0 +1,177 @@
+"""Tests for caching the outputs of file targets."""
+
+import http.server
+import logging
+import os
+import socket
+import stat
+import threading
+
+import pytest # type: ignore
+
+import picard
+from picard.cache import HttpCache, LocalCache
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    """A stand-in for a cache server, storing everything in memory."""
+
+    def do_GET(self): # pylint: disable=invalid-name
+        """Serve a stored value or file, or 404."""
+        content = self.server.store.get(self.path, None)
+        if content is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_PUT(self): # pylint: disable=invalid-name
+        """Store a value or file."""
+        length = int(self.headers['Content-Length'])
+        self.server.store[self.path] = self.rfile.read(length)
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args): # pylint: disable=arguments-differ
+        pass
+
+class _Truncating(_Handler):
+    """A cache server whose responses end early."""
+
+    def do_GET(self): # pylint: disable=invalid-name
+        content = self.server.store.get(self.path, b'')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(content) + 10))
+        self.end_headers()
+        self.wfile.write(content)
+        self.close_connection = True
+
+async def _double(self, context, source): # pylint: disable=unused-argument
+    self.path.write_text(source.read_text() * 2)
+
+def _serve(handler):
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    httpd.store = {}
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{httpd.server_address[1]}'
+    httpd.shutdown()
+    httpd.server_close()
+
+@pytest.fixture
+def server():
+    yield from _serve(_Handler)
+
+@pytest.fixture
+def truncating_server():
+    yield from _serve(_Truncating)
+
+@pytest.fixture(params=['local', 'http'])
+def cache(request, tmp_path):
+    """A cache of each kind."""
+    if request.param == 'local':
+        return LocalCache(tmp_path / 'cache')
+    return HttpCache(request.getfixturevalue('server'))
+
+@pytest.mark.asyncio
+async def test_cached_file_is_restored(tmp_path, monkeypatch, cache):
+    """A second tree restores a cached file instead of running its recipe."""
+    calls = []
+    async def build(directory):
+        # pylint: disable=unused-argument
+        directory.mkdir(exist_ok=True)
+        monkeypatch.chdir(directory)
+        (directory / 'input.txt').write_text(directory.name[0])
+        @picard.file('output.txt', 'input.txt', cache=True)
+        async def output(self, context, source):
+            # The recipe must not capture the directory, which would make it a
+            # different recipe in each tree.
+            calls.append(os.path.basename(os.getcwd()))
+            self.path.write_text(source.read_text() * 2)
+        await picard.sync(output, picard.Context(cache=cache))
+        return (directory / 'output.txt').read_text()
+    assert await build(tmp_path / 'a') == 'aa'
+    assert await build(tmp_path / 'a2') == 'aa'
+    assert await build(tmp_path / 'b') == 'bb'
+    assert calls == ['a', 'b']
+
+@pytest.mark.asyncio
+async def test_restored_files_are_not_shared(tmp_path, monkeypatch):
+    """Restoring a file in one tree leaves the same file in others alone."""
+    cache = LocalCache(tmp_path / 'cache')
+    async def build(directory):
+        directory.mkdir()
+        monkeypatch.chdir(directory)
+        (directory / 'input.txt').write_text('x')
+        output = picard.file('output.txt', 'input.txt', cache=True)(_double)
+        await picard.sync(output, picard.Context(cache=cache))
+        return os.stat(directory / 'output.txt')
+    first = await build(tmp_path / 'a')
+    os.utime(tmp_path / 'a' / 'output.txt', ns=(0, 0))
+    second = await build(tmp_path / 'b')
+    assert second.st_ino != first.st_ino
+    assert os.stat(tmp_path / 'a' / 'output.txt').st_mtime_ns == 0
+
+@pytest.mark.asyncio
+async def test_rebuilt_file_leaves_cache_alone(tmp_path, monkeypatch):
+    """Rebuilding a restored file in place changes neither the cache nor
+    the tree it was restored from."""
+    cache = LocalCache(tmp_path / 'cache')
+    async def build(directory, content):
+        directory.mkdir(exist_ok=True)
+        monkeypatch.chdir(directory)
+        (directory / 'input.txt').write_text(content)
+        output = picard.file('output.txt', 'input.txt', cache=True)(_double)
+        await picard.sync(output, picard.Context(cache=cache))
+        return (directory / 'output.txt').read_text()
+    assert await build(tmp_path / 'a', 'x') == 'xx'
+    assert await build(tmp_path / 'b', 'x') == 'xx'
+    assert await build(tmp_path / 'b', 'y') == 'yy'
+    assert (tmp_path / 'a' / 'output.txt').read_text() == 'xx'
+    assert await build(tmp_path / 'c', 'x') == 'xx'
+
+@pytest.mark.asyncio
+async def test_restored_file_keeps_its_mode(tmp_path, monkeypatch, cache):
+    """An executable restored from the cache can still be run."""
+    async def build(directory):
+        # pylint: disable=unused-argument
+        directory.mkdir()
+        monkeypatch.chdir(directory)
+        (directory / 'input.txt').write_text('#!/bin/sh\n')
+        @picard.file('program', 'input.txt', cache=True)
+        async def program(self, context, source):
+            self.path.write_text(source.read_text())
+            self.path.chmod(0o755)
+        await picard.sync(program, picard.Context(cache=cache))
+        return stat.S_IMODE(os.stat(directory / 'program').st_mode)
+    assert await build(tmp_path / 'a') == 0o755
+    assert await build(tmp_path / 'b') == 0o755
+
+def _closed_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def test_unreachable_server_is_a_miss(tmp_path, caplog):
+    """Failed requests are logged, and the build goes on without them."""
+    cache = HttpCache(f'http://127.0.0.1:{_closed_port()}', timeout=5)
+    source = tmp_path / 'source.txt'
+    source.write_text('x')
+    with caplog.at_level(logging.WARNING):
+        assert cache.get_value('key') is None
+        cache.put_value('key', {'output': 'digest'})
+        digest = cache.put_file(source)
+        assert not cache.get_file(digest, tmp_path / 'output.txt')
+    assert len(caplog.records) == 4
+    assert sorted(os.listdir(tmp_path)) == ['source.txt']
+
+def test_interrupted_download_leaves_no_file(tmp_path, truncating_server):
+    """A truncated download is a miss, and leaves the destination alone."""
+    cache = HttpCache(truncating_server)
+    destination = tmp_path / 'output.txt'
+    destination.write_text('old')
+    assert not cache.get_file('digest', destination)
+    assert destination.read_text() == 'old'
+    assert sorted(os.listdir(tmp_path)) == ['output.txt']
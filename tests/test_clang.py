@@ -0,0 +1,86 @@
+"""Tests for C and C++ patterns."""
+
+import os
+import shutil
+
+import pytest # type: ignore
+
+import picard
+from picard import clang
+from picard.cache import LocalCache
+from picard.database import Database
+
+pytestmark = pytest.mark.skipif(
+    shutil.which('cc') is None, reason='requires a C compiler')
+
+@pytest.mark.asyncio
+async def test_header_change_recompiles(tmp_path, set_mtime):
+    """Headers discovered by the compiler are prerequisites of the object."""
+    database = Database(tmp_path / 'picard.db')
+    header = tmp_path / 'hello.h'
+    source = tmp_path / 'hello.c'
+    header.write_text('#define ANSWER 42\n')
+    source.write_text('#include "hello.h"\nint answer = ANSWER;\n')
+    async def build():
+        target = clang.object_(str(source))
+        await picard.sync(target, picard.Context(database=database))
+        return target
+    target = await build()
+    assert not os.path.exists(target.depfile)
+    assert database.table('deps')[target.name] == [str(header)]
+    obj = tmp_path / 'hello.o'
+    set_mtime(source, 1000)
+    set_mtime(header, 1000)
+    set_mtime(obj, 2000)
+    await build()
+    assert obj.stat().st_mtime_ns == 2000 * 10**9
+    set_mtime(header, 3000)
+    await build()
+    assert obj.stat().st_mtime_ns != 2000 * 10**9
+
+async def _build_in(directory, cache, monkeypatch):
+    """Build ``hello`` from ``hello.c`` with a fresh database."""
+    monkeypatch.chdir(directory)
+    hello = clang.executable('hello', *clang.objects('hello.c'))
+    context = picard.Context(cache=cache)
+    await picard.sync(hello, context)
+    return context.database.table('builds')
+
+@pytest.mark.asyncio
+async def test_cache_is_shared_between_trees(tmp_path, monkeypatch):
+    """A second tree with the same sources restores from the cache."""
+    cache = LocalCache(tmp_path / 'cache')
+    for name in ('a', 'b', 'c'):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / 'hello.h').write_text('#define ANSWER 42\n')
+        (tmp_path / name / 'hello.c').write_text(
+            '#include "hello.h"\nint main() { return ANSWER - 42; }\n')
+    builds = await _build_in(tmp_path / 'a', cache, monkeypatch)
+    assert builds['hello.o']['commands']
+    builds = await _build_in(tmp_path / 'b', cache, monkeypatch)
+    assert not builds['hello.o']['commands']
+    assert not builds['hello']['commands']
+    assert (tmp_path / 'a' / 'hello').read_bytes() == (
+        tmp_path / 'b' / 'hello').read_bytes()
+    assert not os.path.samefile(
+        tmp_path / 'a' / 'hello', tmp_path / 'b' / 'hello')
+    assert os.access(tmp_path / 'b' / 'hello', os.X_OK)
+    # A different header is a miss.
+    (tmp_path / 'c' / 'hello.h').write_text('#define ANSWER 43\n')
+    builds = await _build_in(tmp_path / 'c', cache, monkeypatch)
+    assert builds['hello.o']['commands']
+
+def test_trim_evicts_least_recently_used(tmp_path):
+    """The cache evicts the oldest files first."""
+    cache = LocalCache(tmp_path / 'cache', max_size=10)
+    old = tmp_path / 'old'
+    new = tmp_path / 'new'
+    old.write_bytes(b'0' * 6)
+    new.write_bytes(b'1' * 6)
+    old_digest = cache.put_file(old)
+    # pylint: disable=protected-access
+    os.utime(cache._path('cas', old_digest), (0, 0))
+    new_digest = cache.put_file(new)
+    cache.trim()
+    assert not cache.get_file(old_digest, tmp_path / 'restored')
+    assert cache.get_file(new_digest, tmp_path / 'restored')
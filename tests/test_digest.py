@@ -0,0 +1,64 @@
+"""Tests for content-digest freshness."""
+
+import hashlib
+import os
+
+import pytest # type: ignore
+
+import picard
+from picard.database import Database
+from picard.digest import MMAP_SIZE, digest_file
+
+def _copy_rule(tmp_path, calls):
+    source = tmp_path / 'source.txt'
+    @picard.file(tmp_path / 'output.txt', source)
+    async def output(self, context, source):
+        calls.append(self.name)
+        self.path.write_bytes(source.read_bytes())
+    return source, output
+
+def _context(tmp_path):
+    database = Database(tmp_path / 'picard.db')
+    return picard.Context(database=database, freshness='digest')
+
+async def _build(tmp_path, target):
+    context = _context(tmp_path)
+    try:
+        await picard.sync(target, context)
+    finally:
+        context.database.close()
+
+@pytest.mark.asyncio
+async def test_touch_does_not_rebuild(tmp_path):
+    """A newer modified time with the same content is up-to-date."""
+    calls = []
+    source, output = _copy_rule(tmp_path, calls)
+    source.write_text('hello')
+    await _build(tmp_path, output)
+    stat = source.stat()
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**10))
+    _, output = _copy_rule(tmp_path, calls)
+    await _build(tmp_path, output)
+    assert len(calls) == 1
+
+@pytest.mark.asyncio
+async def test_changed_content_rebuilds(tmp_path):
+    """A different digest rebuilds, even with an older modified time."""
+    calls = []
+    source, output = _copy_rule(tmp_path, calls)
+    source.write_text('hello')
+    await _build(tmp_path, output)
+    stat = source.stat()
+    source.write_text('goodbye')
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns - 10**10))
+    _, output = _copy_rule(tmp_path, calls)
+    await _build(tmp_path, output)
+    assert len(calls) == 2
+    assert (tmp_path / 'output.txt').read_text() == 'goodbye'
+
+def test_digest_large_file(tmp_path):
+    """Large files are memory-mapped and hash the same as small reads."""
+    path = tmp_path / 'large.bin'
+    path.write_bytes(b'x' * MMAP_SIZE)
+    expected = hashlib.sha256(b'x' * MMAP_SIZE).hexdigest()
+    assert digest_file(path) == expected
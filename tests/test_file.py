@@ -5,10 +5,12 @@ import os
 import pytest # type: ignore
 
 import picard
+from picard.database import Database
 
 async def _touch(
         target: picard.Target,
         context: picard.Context,
+        *prereqs,
 ) -> None:
     # pylint: disable=unused-argument
     filename = target.name
@@ -39,3 +41,136 @@ async def test_file_default_recipe_touches_output(tmp_path):
     output = picard.file(path)(_touch)
     await picard.sync(output)
     assert path.is_file()
+
+@pytest.mark.asyncio
+async def test_shared_prerequisite_is_stated_once(tmp_path, monkeypatch):
+    """Up-to-date checks share one stat per file per build."""
+    source = tmp_path / 'source.txt'
+    source.touch()
+    outputs = [
+        picard.file(tmp_path / f'output{i}.txt', source)(_touch)
+        for i in range(3)
+    ]
+    await picard.sync(outputs)
+    stats = []
+    real_stat = os.stat
+    def counting_stat(path, *args, **kwargs):
+        stats.append(os.fspath(path))
+        return real_stat(path, *args, **kwargs)
+    monkeypatch.setattr(os, 'stat', counting_stat)
+    await picard.sync(outputs)
+    assert stats.count(str(source)) == 1
+
+@pytest.mark.asyncio
+async def test_config_change_rebuilds(tmp_path):
+    """File targets rebuild when the configuration they read changes."""
+    database = Database(tmp_path / 'picard.db')
+    path = tmp_path / 'output.txt'
+    calls = []
+    async def build(flags):
+        context = picard.Context(config={'FLAGS': flags}, database=database)
+        # A fresh target each time, as if from a fresh process.
+        output = picard.file(path, config=['FLAGS'])(_touch)
+        mtime = path.stat().st_mtime_ns if path.exists() else None
+        await picard.sync(output, context)
+        calls.append(path.stat().st_mtime_ns != mtime)
+    await build('-O1')
+    await build('-O1')
+    await build('-O2')
+    assert calls == [True, False, True]
+
+@pytest.mark.asyncio
+async def test_commands_are_recorded(tmp_path):
+    """The commands run by a recipe are recorded with its action."""
+    path = tmp_path / 'output.txt'
+    @picard.file(path)
+    async def output(self, context):
+        await picard.sh('touch', self.name)
+    context = picard.Context()
+    await picard.sync(output, context)
+    record = context.database.table('builds')[output.name]
+    assert record['commands'] == [['touch', str(path)]]
+
+@pytest.mark.asyncio
+async def test_restat_cuts_off_identical_output(tmp_path, set_mtime):
+    """Dependents of a file rewritten with the same content are not rebuilt."""
+    database = Database(tmp_path / 'picard.db')
+    source = tmp_path / 'source.txt'
+    generated = tmp_path / 'generated.txt'
+    final = tmp_path / 'final.txt'
+    calls = []
+    async def build():
+        # pylint: disable=unused-argument
+        @picard.file(generated, source, restat=True)
+        async def generate(self, context, source):
+            calls.append('generate')
+            self.path.write_text(source.read_text().upper())
+        @picard.file(final, generate)
+        async def finish(self, context, generated):
+            calls.append('finish')
+            self.path.write_text(generated.read_text() + '!')
+        await picard.sync(finish, picard.Context(database=database))
+    source.write_text('a')
+    await build()
+    assert calls == ['generate', 'finish']
+    set_mtime(source, 1000)
+    set_mtime(generated, 1100)
+    set_mtime(final, 1200)
+    # Newer, but with the same content when generated.
+    source.write_text('A')
+    set_mtime(source, 2000)
+    await build()
+    assert calls == ['generate', 'finish', 'generate']
+    await build()
+    assert calls == ['generate', 'finish', 'generate']
+    source.write_text('b')
+    await build()
+    assert calls[3:] == ['generate', 'finish']
+    assert final.read_text() == 'B!'
+
+@pytest.mark.asyncio
+async def test_restat_accepts_untouched_output(tmp_path, set_mtime):
+    """A restat recipe may leave its file alone when it would not change."""
+    database = Database(tmp_path / 'picard.db')
+    source = tmp_path / 'source.txt'
+    generated = tmp_path / 'generated.txt'
+    final = tmp_path / 'final.txt'
+    calls = []
+    async def build():
+        # pylint: disable=unused-argument
+        @picard.file(generated, source, restat=True)
+        async def generate(self, context, source):
+            calls.append('generate')
+            content = source.read_text().upper()
+            if not self.path.exists() or self.path.read_text() != content:
+                self.path.write_text(content)
+        @picard.file(final, generate)
+        async def finish(self, context, generated):
+            calls.append('finish')
+            self.path.write_text(generated.read_text() + '!')
+        await picard.sync(finish, picard.Context(database=database))
+    source.write_text('a')
+    await build()
+    assert calls == ['generate', 'finish']
+    set_mtime(source, 1000)
+    set_mtime(generated, 1100)
+    set_mtime(final, 1200)
+    source.write_text('A')
+    set_mtime(source, 2000)
+    await build()
+    assert calls == ['generate', 'finish', 'generate']
+    assert os.stat(generated).st_mtime_ns == 1100 * 10**9
+    await build()
+    assert calls == ['generate', 'finish', 'generate']
+    source.write_text('b')
+    await build()
+    assert calls[3:] == ['generate', 'finish']
+    assert final.read_text() == 'B!'
+
+def test_filenames_share_one_target(tmp_path):
+    """Targets that name the same prerequisite file share its target."""
+    source = str(tmp_path / 'source.txt')
+    a = picard.file(tmp_path / 'a.txt', source)(_touch)
+    b = picard.file(tmp_path / 'b.txt', source)(_touch)
+    assert a.prereqs[0] is b.prereqs[0]
+    assert a.prereqs[0].path == tmp_path / 'source.txt'
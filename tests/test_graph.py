@@ -0,0 +1,110 @@
+"""Tests for the dependency graph."""
+
+import asyncio
+import os
+import time
+
+import pytest # type: ignore
+
+import picard
+from picard.graph import Adjacency, Graph
+
+# pylint: disable=unused-argument
+
+async def _increment(context, n=0):
+    return n + 1
+
+def _chain(length):
+    target = picard.rule()(_increment)
+    for _ in range(length - 1):
+        target = picard.rule(target)(_increment)
+    return target
+
+def test_graph_is_topologically_ordered():
+    """Every node comes after its prerequisites."""
+    @picard.rule()
+    async def a(context):
+        pass
+    @picard.rule(a)
+    async def b(context, a):
+        pass
+    @picard.rule(a, [b])
+    async def c(context, a, bs):
+        pass
+    graph = Graph(c)
+    assert [n.name for n in graph.nodes] == ['a', 'b', 'c']
+    assert graph.prereqs == [[], [0], [0, 1]]
+    assert graph.dependents == [[1, 2], [2], []]
+    durations = {'a': 1, 'c': 4}
+    # b takes the mean of the known durations.
+    assert graph.critical_paths(durations) == [7.5, 6.5, 4]
+
+def test_dependents_are_transposed_prerequisites():
+    """Each dependent is listed once, in order, under each prerequisite."""
+    prereqs = Adjacency()
+    for nodes in ([], [], [0, 1], [0], [1, 2, 3]):
+        prereqs.append(nodes)
+    assert prereqs.degrees() == [0, 0, 2, 1, 3]
+    assert prereqs.transpose() == [[2, 3], [2, 4], [4], [4], []]
+
+@pytest.mark.asyncio
+async def test_deep_chain():
+    """Chains deeper than the recursion limit evaluate."""
+    assert await picard.sync(_chain(5000)) == 5000
+
+@pytest.mark.asyncio
+async def test_cycle_raises_error():
+    """A cycle is reported before any recipe runs."""
+    calls = []
+    @picard.rule()
+    async def a(context, b=None):
+        calls.append('a')
+    @picard.rule(a)
+    async def b(context, a):
+        calls.append('b')
+    a.prereqs = ((b,), {})
+    with pytest.raises(picard.CycleError) as info:
+        await picard.sync(b)
+    assert [t.name for t in info.value.cycle] == ['b', 'a', 'b']
+    assert calls == []
+
+@pytest.mark.asyncio
+async def test_failure_cancels_running_recipes(tmp_path):
+    """By default, the first failure kills the subprocesses of the rest."""
+    pidfile = tmp_path / 'pid'
+    @picard.rule()
+    async def slow(context):
+        await picard.sh(
+            'sh', '-c', f'echo $$ > {pidfile}; exec sleep 30')
+    @picard.rule()
+    async def fail(context):
+        while not pidfile.exists() or not pidfile.read_text():
+            await asyncio.sleep(0.01)
+        raise RuntimeError('fail')
+    start = time.monotonic()
+    with pytest.raises(RuntimeError):
+        await picard.sync([slow, fail], picard.Context(jobs=2))
+    assert time.monotonic() - start < 10
+    pid = int(pidfile.read_text())
+    with pytest.raises(ProcessLookupError):
+        os.kill(pid, 0)
+
+@pytest.mark.asyncio
+async def test_keep_going_builds_independent_targets():
+    """With keep_going, only the dependents of a failure are skipped."""
+    calls = []
+    @picard.rule()
+    async def fail(context):
+        raise RuntimeError('fail')
+    @picard.rule(fail)
+    async def dependent(context, _):
+        calls.append('dependent')
+    @picard.rule()
+    async def independent(context):
+        await asyncio.sleep(0.01)
+        calls.append('independent')
+    context = picard.Context(keep_going=True)
+    with pytest.raises(picard.BuildError) as info:
+        await picard.sync([dependent, independent], context)
+    assert [t.name for t, _ in info.value.failures] == ['fail']
+    assert calls == ['independent']
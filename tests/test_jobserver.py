@@ -0,0 +1,65 @@
+"""Tests for the GNU make jobserver."""
+
+import os
+import shutil
+
+import pytest # type: ignore
+
+import picard
+from picard.jobserver import JobServer
+
+@pytest.mark.asyncio
+async def test_created_jobserver_limits_concurrent_recipes(counting_rules):
+    """A jobserver for two jobs runs two recipes at once."""
+    jobserver = JobServer.create(2)
+    rules, state = counting_rules(6)
+    try:
+        await picard.sync(rules, picard.Context(jobs=4, jobserver=jobserver))
+    finally:
+        jobserver.close()
+    assert state['peak'] == 2
+
+@pytest.mark.asyncio
+async def test_inherited_jobserver_is_joined_and_tokens_returned(
+        counting_rules):
+    """Tokens read from a parent's pipe are written back."""
+    r, w = os.pipe()
+    os.write(w, b'+')
+    environ = {'MAKEFLAGS': f'-j2 --jobserver-auth={r},{w}'}
+    jobserver = JobServer.from_environ(environ)
+    assert jobserver is not None
+    rules, state = counting_rules(4)
+    try:
+        await picard.sync(rules, picard.Context(jobs=4, jobserver=jobserver))
+        assert state['peak'] == 2
+        assert os.read(jobserver.read_fd, 2) == b'+'
+    finally:
+        jobserver.close()
+        os.close(r)
+        os.close(w)
+
+def test_closed_jobserver_is_ignored():
+    """A jobserver whose pipe was closed by the parent is not joined."""
+    r, w = os.pipe()
+    os.close(r)
+    os.close(w)
+    environ = {'MAKEFLAGS': f'-j2 --jobserver-fds={r},{w}'}
+    assert JobServer.from_environ(environ) is None
+
+@pytest.mark.skipif(shutil.which('make') is None, reason='requires make')
+@pytest.mark.asyncio
+async def test_recursive_make_shares_jobserver(tmp_path, capfd):
+    """A ``make`` run by a recipe inherits the jobserver."""
+    (tmp_path / 'Makefile').write_text(
+        'all: a b\na b:\n\t@echo "$@ $(MAKEFLAGS)"\n')
+    @picard.rule()
+    async def recurse(context):
+        await picard.sh('make', '-C', tmp_path, '-s')
+    jobserver = JobServer.create(3)
+    try:
+        await picard.sync(recurse, picard.Context(jobserver=jobserver))
+    finally:
+        jobserver.close()
+    out, err = capfd.readouterr()
+    assert 'jobserver' in out
+    assert 'jobserver unavailable' not in out + err
@@ -0,0 +1,79 @@
+"""Tests for lowering graphs to Ninja."""
+
+import os
+
+import pytest # type: ignore
+
+import picard
+from picard.ninja import lower
+
+@pytest.mark.asyncio
+async def test_lower_recorded_commands(tmp_path):
+    """Recorded commands, depfiles, restat, and pools are lowered."""
+    # pylint: disable=unused-argument
+    source = tmp_path / 'a.txt'
+    source.write_text('a')
+    @picard.file(
+        tmp_path / 'b.txt', source, depfile=tmp_path / 'b.d', restat=True,
+        resources={'mem_gb': 8},
+    )
+    async def copy(self, context, source):
+        await picard.sh('cp', source, self.path)
+        await picard.sh(
+            'sh', '-c', 'echo "$1: $2" > $3', 'sh', self.path, source,
+            self.depfile)
+    @picard.file(tmp_path / 'c.txt', copy)
+    async def python(self, context, copy):
+        self.path.write_text(copy.read_text())
+    @picard.rule(python)
+    async def rule(context, python):
+        pass
+
+    context = picard.Context(pools={'mem_gb': 16})
+    await picard.sync(rule, context)
+
+    text, skipped = lower(rule, context)
+    assert skipped == [python, rule]
+    assert f'build {tmp_path}/b.txt: sh_gcc_restat {tmp_path}/a.txt' in text
+    assert f'  cmd = cp {source} {tmp_path}/b.txt && sh -c ' in text
+    assert '$$1' in text
+    assert f'  depfile = {tmp_path}/b.d' in text
+    assert 'pool mem_gb_2\n  depth = 2' in text
+    assert '  pool = mem_gb_2' in text
+
+    text, skipped = lower(rule, context, 'make.py')
+    assert skipped == [rule]
+    assert f'build {tmp_path}/c.txt: sh_restat {tmp_path}/b.txt' in text
+    assert f'make.py {tmp_path}/c.txt\n' in text
+    assert 'build build.ninja: picard make.py' in text
+
+    text, skipped = lower(
+        rule, context, 'make.py', overrides={'CC': 'clang', 'docs': True})
+    assert f'make.py CC=clang --docs {tmp_path}/c.txt\n' in text
+    assert 'make.py CC=clang --docs --ninja $out' in text
+    # The module of the recipes is an implicit input of the build file.
+    line, = (l for l in text.splitlines() if l.startswith('build build.'))
+    assert line.startswith('build build.ninja: picard make.py | ')
+    assert __file__ in line.split(' | ')[1].split()
+
+@pytest.mark.asyncio
+async def test_lower_directory_and_environment(tmp_path, monkeypatch):
+    """Commands keep the directory and environment that they ran in."""
+    # pylint: disable=unused-argument
+    monkeypatch.setenv('UNWANTED', '1')
+    source = tmp_path / 'a.txt'
+    source.write_text('a')
+    (tmp_path / 'sub').mkdir()
+    @picard.file(tmp_path / 'b.txt', source)
+    async def copy(self, context, source):
+        env = {**os.environ, 'GREETING': 'hi there'}
+        del env['UNWANTED']
+        await picard.sh('cp', source, self.path, cwd=tmp_path / 'sub', env=env)
+        await picard.sh('touch', self.path)
+    context = picard.Context()
+    await picard.sync(copy, context)
+    text, _ = lower(copy, context)
+    assert (
+        f"  cmd = (cd {tmp_path}/sub && env -u UNWANTED 'GREETING=hi there' "
+        f"cp {source} {tmp_path}/b.txt) && touch {tmp_path}/b.txt\n"
+    ) in text
@@ -0,0 +1,74 @@
+"""Tests for dry runs."""
+
+import os
+
+import pytest # type: ignore
+
+import picard
+
+def _copy(output, source):
+    @picard.file(output, source)
+    async def target(self, context, source):
+        # pylint: disable=unused-argument
+        self.path.write_text(source.read_text())
+    return target
+
+@pytest.mark.asyncio
+async def test_dry_run_propagates_staleness(tmp_path):
+    """Everything downstream of a change would run, and nothing runs."""
+    a = tmp_path / 'a.txt'
+    a.write_text('a')
+    b = _copy(tmp_path / 'b.txt', a)
+    c = _copy(tmp_path / 'c.txt', b)
+    d = _copy(tmp_path / 'd.txt', tmp_path / 'e.txt')
+    (tmp_path / 'e.txt').write_text('e')
+    database = picard.Context().database
+    await picard.sync([c, d], picard.Context(database=database))
+
+    os.utime(a, ns=(1 << 62, 1 << 62))
+    context = picard.Context(database=database, dry_run=True)
+    await picard.sync([c, d], context)
+    assert context.plan.steps == [b, c]
+    assert (tmp_path / 'c.txt').read_text() == 'a'
+    lines = list(context.plan.report())
+    # Estimates come from the durations recorded by the last build.
+    assert lines[0].startswith(f'would run: {b.name} (~')
+    assert lines[-1].startswith('2 recipe(s)')
+    # A missing prerequisite that would be built is not an error.
+    os.remove(tmp_path / 'b.txt')
+    context = picard.Context(database=database, dry_run=True)
+    await picard.sync(c, context)
+    assert context.plan.steps == [b, c]
+
+@pytest.mark.asyncio
+async def test_rules_run_only_for_stale_files(tmp_path):
+    """A rule joins the plan only if a file that would be built needs it."""
+    a = tmp_path / 'a.txt'
+    a.write_text('a')
+
+    @picard.rule()
+    async def setup(context):
+        # pylint: disable=unused-argument
+        pass
+
+    @picard.rule(setup)
+    async def prepare(context, setup):
+        # pylint: disable=unused-argument
+        pass
+
+    @picard.file(tmp_path / 'b.txt', a, prepare)
+    async def b(self, context, source, prepare):
+        # pylint: disable=unused-argument
+        self.path.write_text(source.read_text())
+
+    database = picard.Context().database
+    await picard.sync(b, picard.Context(database=database))
+    context = picard.Context(database=database, dry_run=True)
+    await picard.sync(b, context)
+    # Nothing would be built, e.g. for ``--question``.
+    assert not context.plan
+
+    os.utime(a, ns=(1 << 62, 1 << 62))
+    context = picard.Context(database=database, dry_run=True)
+    await picard.sync(b, context)
+    assert context.plan.steps == [setup, prepare, b]
@@ -22,3 +22,24 @@ async def test_rule():
     async def target_3(context, *, two):
         return two + 1
     assert await picard.sync(target_3) == 3
+
+@pytest.mark.asyncio
+async def test_diamond_runs_each_recipe_once():
+    """A shared prerequisite is evaluated once, not once per dependent."""
+    # pylint: disable=unused-argument
+    calls = []
+    @picard.rule()
+    async def bottom(context):
+        calls.append('bottom')
+        return 1
+    @picard.rule(bottom)
+    async def left(context, one):
+        return one + 1
+    @picard.rule(bottom)
+    async def right(context, one):
+        return one + 2
+    @picard.rule(left, right)
+    async def top(context, two, three):
+        return two + three
+    assert await picard.sync([top, bottom]) == [5, 1]
+    assert calls == ['bottom']
@@ -0,0 +1,135 @@
+"""Tests for the job limit."""
+
+import asyncio
+
+import pytest # type: ignore
+
+import picard
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('jobs', [1, 2, 3])
+async def test_jobs_limits_concurrent_recipes(jobs, counting_rules):
+    """No more than ``jobs`` recipes run at once, and all of them are used."""
+    rules, state = counting_rules(8)
+    await picard.sync(rules, picard.Context(jobs=jobs))
+    assert state['peak'] == jobs
+
+@pytest.mark.asyncio
+async def test_nested_sync_does_not_deadlock():
+    """A recipe that evaluates another target reuses its own job."""
+    # pylint: disable=unused-argument
+    @picard.rule()
+    async def inner(context):
+        return 1
+    @picard.rule()
+    async def outer(context):
+        return await picard.sync(inner, context) + 1
+    assert await picard.sync(outer, picard.Context(jobs=1)) == 2
+
+class _Named: # pylint: disable=too-few-public-methods
+    def __init__(self, name):
+        self.name = name
+
+@pytest.mark.asyncio
+async def test_waiters_are_served_by_priority():
+    """A freed job goes to the waiting target with the highest priority."""
+    scheduler = picard.Context(jobs=1).scheduler
+    targets = {n: _Named(n) for n in ('low', 'high', 'middle')}
+    scheduler.priorities.update({
+        targets['low']: 1, targets['high']: 3, targets['middle']: 2})
+    order = []
+    async def wait(target):
+        async with scheduler.job(target):
+            order.append(target.name)
+    # Tasks spawned under a job would share it, so hold it in another.
+    release = asyncio.Event()
+    async def hold():
+        async with scheduler.job():
+            await release.wait()
+    holder = asyncio.ensure_future(hold())
+    await asyncio.sleep(0)
+    tasks = [asyncio.ensure_future(wait(t)) for t in targets.values()]
+    await asyncio.sleep(0)
+    release.set()
+    await asyncio.gather(holder, *tasks)
+    assert order == ['high', 'middle', 'low']
+
+@pytest.mark.asyncio
+async def test_longest_critical_path_starts_first():
+    """Recorded durations put the start of the longest chain first."""
+    # pylint: disable=unused-argument
+    order = []
+    def rule(name, *prereqs):
+        async def recipe(context, *args):
+            order.append(name)
+        recipe.__name__ = name
+        return picard.rule(*prereqs)(recipe)
+    short = rule('short')
+    head = rule('head')
+    tail = rule('tail', head)
+    context = picard.Context(jobs=1)
+    context.scheduler.durations.update({'short': 2, 'head': 1, 'tail': 5})
+    await picard.sync([short, tail], context)
+    assert order == ['head', 'short', 'tail']
+    assert set(context.database.table('durations')) == {
+        'short', 'head', 'tail'}
+
+def _pooled_rules(events, **costs):
+    """Return rules, one for each of some names, that cost some amounts of
+    a pool, and record when they start and end."""
+    # pylint: disable=unused-argument
+    rules = []
+    for name, cost in costs.items():
+        async def recipe(context, name=name):
+            events.append(('start', name))
+            await asyncio.sleep(0.01)
+            events.append(('end', name))
+        recipe.__name__ = name
+        rules.append(picard.resources(mem_gb=cost)(picard.rule()(recipe)))
+    return rules
+
+@pytest.mark.asyncio
+async def test_pools_limit_concurrent_recipes(counting_rules):
+    """Recipes run at once only while their resources fit in the pools."""
+    events = []
+    heavy = _pooled_rules(events, **{f'heavy{i}': 8 for i in range(6)})
+    # A recipe costing more than the pool still runs, alone in the pool.
+    huge, = _pooled_rules(events, huge=100)
+    light, _ = counting_rules(4)
+    context = picard.Context(jobs=4, pools={'mem_gb': 16})
+    await picard.sync([huge, heavy, light], context)
+    running = set()
+    peak = 0
+    for event, name in events:
+        if event == 'start':
+            assert 'huge' not in running
+            assert name != 'huge' or not running
+            running.add(name)
+            peak = max(peak, len(running))
+        else:
+            running.remove(name)
+    assert peak == 2
+    # pylint: disable=protected-access
+    assert context.scheduler._usage == {'mem_gb': 0}
+
+class _Costly(_Named): # pylint: disable=too-few-public-methods
+    def __init__(self, name, **resources):
+        super().__init__(name)
+        self.resources = resources
+
+@pytest.mark.asyncio
+async def test_large_waiter_is_not_starved():
+    """Smaller jobs behind a job that does not fit wait for it."""
+    scheduler = picard.Context(jobs=4, pools={'mem_gb': 16}).scheduler
+    order = []
+    async def run(name, cost):
+        async with scheduler.job(_Costly(name, mem_gb=cost)):
+            order.append(name)
+            await asyncio.sleep(0.01)
+    tasks = [asyncio.ensure_future(run(f'a{i}', 8)) for i in range(2)]
+    await asyncio.sleep(0)
+    tasks.append(asyncio.ensure_future(run('huge', 16)))
+    await asyncio.sleep(0)
+    tasks.extend(asyncio.ensure_future(run(f'b{i}', 8)) for i in range(4))
+    await asyncio.gather(*tasks)
+    assert order == ['a0', 'a1', 'huge', 'b0', 'b1', 'b2', 'b3']
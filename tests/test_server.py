@@ -0,0 +1,71 @@
+"""Tests for the build server."""
+
+import asyncio
+import os
+import subprocess
+import sys
+
+import pytest # type: ignore
+
+import picard
+from picard.server import serve
+
+async def _client(path, *argv):
+    """Run a client in another process and return its status and output."""
+    p = await asyncio.create_subprocess_exec(
+        sys.executable, '-m', 'picard_client', *argv,
+        stdout=asyncio.subprocess.PIPE,
+        env={**os.environ, 'PICARD_SOCKET': str(path)},
+    )
+    out, _ = await p.communicate()
+    return p.returncode, out.decode()
+
+@pytest.mark.asyncio
+async def test_server_builds_only_what_changed(tmp_path):
+    """A warm server rebuilds nothing until a source changes."""
+    source = tmp_path / 'input.txt'
+    source.write_text('a')
+    calls = []
+    @picard.file(tmp_path / 'output.txt', source, config=('X',))
+    async def output(self, context, source):
+        # pylint: disable=unused-argument
+        calls.append(context.config.get('X', None))
+        self.path.write_text(source.read_text())
+    @picard.rule()
+    async def fail(context):
+        raise ValueError('oops')
+
+    path = tmp_path / 'picard.sock'
+    context = picard.Context()
+    task = asyncio.ensure_future(
+        serve(output, {'output': output, 'fail': fail}, context, str(path)))
+    try:
+        while not path.exists():
+            await asyncio.sleep(0.01)
+        status, _ = await _client(path)
+        assert (status, calls) == (0, [None])
+        assert await _client(path, 'output') == (0, '')
+        assert calls == [None]
+        os.utime(source, ns=(0, 0))
+        source.write_text('b')
+        await asyncio.sleep(0.3)
+        assert (await _client(path))[0] == 0
+        assert (tmp_path / 'output.txt').read_text() == 'b'
+        assert (await _client(path, 'X=1'))[0] == 0
+        assert calls == [None, None, '1']
+        status, out = await _client(path, 'fail')
+        assert status == 1
+        assert 'oops' in out
+    finally:
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+    assert not path.exists()
+
+def test_client_imports_only_the_standard_library():
+    """The client does not pay for importing the build system."""
+    code = 'import sys, picard_client; print(sorted(sys.modules))'
+    out = subprocess.run(
+        [sys.executable, '-c', code], stdout=subprocess.PIPE, check=True,
+    ).stdout.decode()
+    assert "'picard'" not in out and "'picard." not in out
@@ -0,0 +1,78 @@
+"""Tests for subprocesses."""
+
+import asyncio
+import os
+import sys
+
+import pytest # type: ignore
+
+import picard
+from picard.output import Output
+
+@pytest.mark.asyncio
+async def test_nonzero_exit_raises_error():
+    """Failed commands raise an error with their status and output."""
+    with pytest.raises(picard.ShellError) as info:
+        await picard.sh('sh', '-c', 'echo oops; exit 3')
+    assert info.value.returncode == 3
+    assert info.value.command == ('sh', '-c', 'echo oops; exit 3')
+    assert b'oops\n' in info.value.output
+
+@pytest.mark.asyncio
+async def test_output_of_concurrent_jobs_is_not_interleaved(capfd):
+    """Each recipe's output is written as one block when it finishes."""
+    # pylint: disable=unused-argument
+    def rule(name, delay):
+        @picard.rule()
+        async def target(context):
+            await picard.sh(
+                'sh', '-c', f'echo {name}1; sleep {delay}; echo {name}2')
+        return target
+    await picard.sync([rule('a', 0.2), rule('b', 0.1)])
+    out = capfd.readouterr().out
+    assert 'a1\na2\n' in out
+    assert 'b1\nb2\n' in out
+
+def test_output_keeps_head_and_tail():
+    """Chatty output keeps its beginning and end within the limit."""
+    output = Output(limit=8)
+    for i in range(10):
+        output.write(str(i).encode())
+    assert output.getvalue() == b'0123\n[... 2 bytes omitted ...]\n6789'
+
+@pytest.mark.asyncio
+async def test_command_runs_in_process_group_of_its_own(tmp_path):
+    """A command is the leader of a new process group."""
+    path = tmp_path / 'pgid'
+    await picard.sh(
+        sys.executable, '-c',
+        f'import os; open({str(path)!r}, "w").write(str(os.getpgrp()))')
+    assert int(path.read_text()) != os.getpgrp()
+
+def _alive(pid):
+    """Return whether a process is running, and not a zombie."""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            return f.read().rsplit(')', 1)[1].split()[0] != 'Z'
+    except FileNotFoundError:
+        return False
+
+@pytest.mark.asyncio
+async def test_cancellation_kills_children_of_command(tmp_path):
+    """Children that a cancelled command started do not survive it."""
+    path = tmp_path / 'pid'
+    task = asyncio.ensure_future(picard.sh(
+        'sh', '-c', f'sleep 60 & echo $! > {path}.tmp; mv {path}.tmp {path}; '
+        'wait'))
+    while not path.exists():
+        await asyncio.sleep(0.01)
+    pid = int(path.read_text())
+    assert _alive(pid)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    for _ in range(100):
+        if not _alive(pid):
+            break
+        await asyncio.sleep(0.05)
+    assert not _alive(pid)
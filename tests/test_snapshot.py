@@ -0,0 +1,195 @@
+"""Tests for snapshots of graphs."""
+
+import collections
+import importlib
+import os
+import subprocess
+import sys
+import typing as t
+
+import pytest # type: ignore
+
+import picard
+from picard.database import Database
+from picard.graph import Graph
+from picard.snapshot import SnapshotError, load, save, construct
+
+# pylint: disable=unused-argument
+
+RUNS: t.List[str] = []
+
+async def _link(self, context, *objects):
+    RUNS.append(self.name)
+    self.path.touch()
+
+def _graph(directory, calls):
+    """Return a constructor of an object per source, and a program."""
+    def constructor():
+        calls.append(None)
+        objects = []
+        for source in picard.glob(f'{directory}/*.c'):
+            @picard.file(source[:-2] + '.o', source, config=('CC',))
+            async def object_(self, context, source):
+                RUNS.append(self.name)
+                self.path.touch()
+            objects.append(object_)
+        return picard.file(
+            f'{directory}/program', *objects,
+            restat=True, resources={'link': 1},
+        )(_link)
+    return constructor
+
+def _sources(directory, *names):
+    for name in names:
+        (directory / name).write_text('')
+
+def test_graph_is_reloaded(tmp_path):
+    """A saved graph is loaded instead of constructed again."""
+    _sources(tmp_path, 'a.c', 'b.c')
+    calls = []
+    constructor = _graph(tmp_path, calls)
+    snapshot = str(tmp_path / 'graph')
+    program = construct(constructor, snapshot)
+    loaded = load(snapshot, constructor)
+    assert len(calls) == 1
+    assert loaded.name == program.name
+    assert loaded.restat and loaded.resources == {'link': 1}
+    nodes = Graph(loaded).nodes
+    assert [n.name for n in nodes] == [n.name for n in Graph(program).nodes]
+    assert [p.name for p in loaded.prereqs] == [
+        f'{tmp_path}/a.o', f'{tmp_path}/b.o']
+    assert loaded.prereqs[0].config == ('CC',)
+
+def test_snapshot_is_discarded_when_globs_change(tmp_path):
+    """A new file matched by a glob makes the snapshot out-of-date."""
+    _sources(tmp_path, 'a.c')
+    constructor = _graph(tmp_path, [])
+    snapshot = str(tmp_path / 'graph')
+    construct(constructor, snapshot)
+    assert load(snapshot, constructor) is not None
+    _sources(tmp_path, 'b.c')
+    assert load(snapshot, constructor) is None
+
+SCRIPT = """
+import picard
+
+async def touch(self, context, *prereqs):
+    self.path.touch()
+
+def graph():
+    return picard.file('{directory}/program', *picard.glob('{directory}/*.c'))(
+        touch)
+"""
+
+def test_snapshot_is_discarded_when_script_changes(tmp_path, monkeypatch):
+    """A change to a build script makes the snapshot out-of-date."""
+    _sources(tmp_path, 'a.c')
+    script = tmp_path / 'snapshot_script.py'
+    script.write_text(SCRIPT.format(directory=tmp_path))
+    monkeypatch.syspath_prepend(str(tmp_path))
+    module = importlib.import_module('snapshot_script')
+    try:
+        snapshot = str(tmp_path / 'graph')
+        construct(module.graph, snapshot)
+        assert load(snapshot, module.graph) is not None
+        script.write_text(script.read_text() + '# A change.\n')
+        assert load(snapshot, module.graph) is None
+    finally:
+        del sys.modules['snapshot_script']
+
+@pytest.mark.asyncio
+async def test_recipes_run_only_when_out_of_date(tmp_path):
+    """The recipes of a loaded graph run only for targets that are
+    out-of-date."""
+    _sources(tmp_path, 'a.c', 'b.c')
+    calls = []
+    constructor = _graph(tmp_path, calls)
+    snapshot = str(tmp_path / 'graph')
+    database = Database(str(tmp_path / 'picard.db'))
+    await picard.sync(construct(constructor, snapshot), picard.Context(
+        database=database, freshness='digest'))
+    RUNS.clear()
+
+    # Reloaded recipes have the same actions, so nothing is rebuilt.
+    program = load(snapshot, constructor)
+    await picard.sync(program, picard.Context(
+        database=database, freshness='digest'))
+    assert not RUNS
+    assert len(calls) == 1
+
+    # A recipe defined in a function is found by constructing the graph.
+    (tmp_path / 'a.c').write_text('int a;\n')
+    program = load(snapshot, constructor)
+    await picard.sync(program, picard.Context(
+        database=database, freshness='digest'))
+    assert RUNS == [f'{tmp_path}/a.o']
+    assert len(calls) == 2
+
+def test_only_file_targets_are_saved(tmp_path):
+    """A graph with a rule cannot be saved."""
+    @picard.rule()
+    async def rule(context):
+        pass
+    target = picard.file(tmp_path / 'a', rule)(_link)
+    with pytest.raises(SnapshotError):
+        save(str(tmp_path / 'graph'), target)
+
+def test_failure_to_save_leaves_no_file(tmp_path):
+    """A graph that cannot be saved is still built."""
+    _sources(tmp_path, 'a.c')
+    constructor = _graph(tmp_path, [])
+    program = construct(constructor, str(tmp_path / 'missing' / 'graph'))
+    assert program.name == f'{tmp_path}/program'
+    # :mod:`marshal` cannot write a deque.
+    objects = construct(
+        lambda: collections.deque(constructor().prereqs),
+        str(tmp_path / 'graph'))
+    assert isinstance(objects, collections.deque)
+    assert sorted(os.listdir(tmp_path)) == ['a.c']
+
+def test_filename_must_be_a_path(tmp_path):
+    with pytest.raises(TypeError):
+        construct(_graph(tmp_path, []), True)
+
+BUILD = """
+import asyncio
+
+import picard
+from picard.database import Database
+from picard.snapshot import construct, load
+
+DIRECTORY = {directory!r}
+
+async def copy(self, context, source):
+    # A set of constants, which is ordered by the hash seed.
+    if source.suffix in {{'.txt', '.md', '.rst'}}:
+        self.path.write_text(source.read_text())
+
+def graph():
+    return picard.file(DIRECTORY + '/out', DIRECTORY + '/in.txt')(copy)
+
+snapshot = DIRECTORY + '/graph'
+loaded = load(snapshot, graph) is not None
+target = construct(graph, snapshot)
+database = Database(DIRECTORY + '/picard.db')
+asyncio.run(picard.sync(target, picard.Context(database=database)))
+print(loaded)
+"""
+
+def test_snapshot_is_loaded_by_another_process(tmp_path):
+    """A recipe in a snapshot is found by a process with another hash
+    seed."""
+    script = tmp_path / 'build.py'
+    script.write_text(BUILD.format(directory=str(tmp_path)))
+    def build(seed, content):
+        (tmp_path / 'in.txt').write_text(content)
+        env = {**os.environ, 'PYTHONHASHSEED': str(seed)}
+        env['PYTHONPATH'] = os.pathsep.join(sys.path)
+        loaded = subprocess.run(
+            [sys.executable, str(script)], env=env, check=True,
+            stdout=subprocess.PIPE, universal_newlines=True,
+        ).stdout.strip()
+        return loaded, (tmp_path / 'out').read_text()
+    assert build(1, 'a') == ('False', 'a')
+    assert build(2, 'b') == ('True', 'b')
+    assert build(3, 'c') == ('True', 'c')
@@ -0,0 +1,35 @@
+"""Tests for profiles of builds."""
+
+import json
+
+import pytest # type: ignore
+
+import picard
+from picard.trace import Tracer
+
+@pytest.mark.asyncio
+async def test_trace_has_spans_for_targets_and_commands(tmp_path):
+    """Targets, their commands, and the job counter appear in the trace."""
+    @picard.rule()
+    async def a(context):
+        await picard.sh('true')
+    @picard.rule(a)
+    async def b(context, a):
+        pass
+
+    tracer = Tracer()
+    await picard.sync(b, picard.Context(tracer=tracer))
+    filename = tmp_path / 'trace.json'
+    tracer.write(filename)
+    with open(filename) as f:
+        events = json.load(f)['traceEvents']
+
+    spans = {(e['cat'], e['name']) for e in events if e['ph'] == 'X'}
+    assert {('target', 'a'), ('target', 'b'), ('sh', 'true')} <= spans
+    assert ('recipe', 'recipe') in spans
+    assert any(e['ph'] == 'C' and e['name'] == 'jobs' for e in events)
+    a_span = next(e for e in events if e.get('cat') == 'target'
+                  and e['name'] == 'a')
+    b_span = next(e for e in events if e.get('cat') == 'target'
+                  and e['name'] == 'b')
+    assert a_span['ts'] + a_span['dur'] <= b_span['ts']
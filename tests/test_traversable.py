@@ -0,0 +1,57 @@
+"""Tests for traversables."""
+
+import typing as t
+
+import pytest # type: ignore
+
+import picard
+from picard.afunctor import afmap
+from picard.functor import fmap
+from picard.graph import prerequisites
+from picard.traversable import Traversable
+
+# pylint: disable=unused-argument
+
+STRUCTURE: t.Any = ([1, (2, 3)], {'a': 4, 'b': {5}}, 'xy', [])
+
+def times2(x):
+    return x * 2
+
+async def atimes2(x):
+    return x * 2
+
+def test_leaves_are_in_order():
+    assert list(Traversable(STRUCTURE)) == [1, 2, 3, 4, 5, 'xy']
+
+def test_fmap_is_the_same_as_the_structure():
+    """Mapping a traversable maps its structure."""
+    mapped = fmap(times2, Traversable(STRUCTURE))
+    assert isinstance(mapped, Traversable)
+    assert mapped.structure == fmap(times2, STRUCTURE)
+    # The layout is reused.
+    assert fmap(times2, mapped) == Traversable(
+        fmap(times2, fmap(times2, STRUCTURE)))
+
+@pytest.mark.asyncio
+async def test_afmap_is_the_same_as_the_structure():
+    mapped = await afmap(atimes2, Traversable(STRUCTURE))
+    assert mapped.structure == await afmap(atimes2, STRUCTURE)
+
+def test_leaf_mapped_to_collection_is_taken_apart():
+    mapped = fmap(lambda x: [x, x], Traversable([1, 2]))
+    assert list(mapped) == [1, 1, 2, 2]
+    assert mapped.structure == [[1, 1], [2, 2]]
+
+def test_empty():
+    assert list(Traversable(())) == []
+    assert fmap(times2, Traversable(())).structure == ()
+
+def test_targets():
+    """The targets in prerequisites are found in order."""
+    @picard.rule()
+    async def a(context):
+        pass
+    @picard.rule(a, 'a.c', xs=[a, picard.file_target('b.c')])
+    async def b(context, a, c, xs):
+        pass
+    assert [p.name for p in prerequisites(b.prereqs)] == ['a', 'a', 'b.c']
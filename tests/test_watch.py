@@ -0,0 +1,57 @@
+"""Tests for watch mode."""
+
+import asyncio
+import os
+
+import pytest # type: ignore
+
+import picard
+from picard.watch import InotifyWatcher, PollingWatcher, watch
+
+def _concat(output, *inputs):
+    @picard.file(output, *inputs)
+    async def target(self, context, *inputs):
+        # pylint: disable=unused-argument
+        with open(self.name, 'w') as f:
+            for i in inputs:
+                with open(i) as g:
+                    f.write(g.read())
+    return target
+
+async def _until(predicate, timeout=5):
+    loop = asyncio.get_event_loop()
+    deadline = loop.time() + timeout
+    while not predicate():
+        assert loop.time() < deadline
+        await asyncio.sleep(0.01)
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('make_watcher', [
+    InotifyWatcher, lambda: PollingWatcher(0.05),
+])
+async def test_change_rebuilds_only_downstream(tmp_path, make_watcher):
+    """Only the targets downstream of a changed source are evaluated."""
+    a, b = tmp_path / 'a.txt', tmp_path / 'b.txt'
+    a.write_text('a')
+    b.write_text('b')
+    a_out = _concat(tmp_path / 'a.out', a)
+    b_out = _concat(tmp_path / 'b.out', b)
+    both = _concat(tmp_path / 'both.out', a_out, b_out)
+
+    context = picard.Context()
+    task = asyncio.ensure_future(
+        watch(both, context, make_watcher(), debounce=0.05))
+    try:
+        await _until(lambda: both in context.memo and
+                     context.memo[both].done())
+        before = {t: context.memo[t] for t in (a_out, b_out, both)}
+        # Ensure a distinct modified time.
+        os.utime(a, ns=(0, 0))
+        a.write_text('A')
+        await _until(lambda: (tmp_path / 'both.out').read_text() == 'Ab')
+        assert context.memo[b_out] is before[b_out]
+        assert context.memo[a_out] is not before[a_out]
+    finally:
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task